@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import gc
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3 import Web3
+from scripts import back_runner, simulator
+from scripts.amm import FeeTable
+from scripts.contract_fetcher import ContractFetcher
+from scripts.pair_resolver import sort_tokens, to_address_bytes
+from scripts.swap_decoder import SWAP_FUNCTIONS, SwapDecoder, function_selector
+from scripts.universal_router import (
+    CONTRACT_BALANCE,
+    V2_SWAP_EXACT_IN,
+    V3_SWAP_EXACT_IN,
+    WRAP_ETH,
+)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+BASELINE_FILENAME = os.path.join(os.path.dirname(__file__), "baseline.json")
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+RECIPIENT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+UNIVERSAL_ROUTER = "0xeC8B0F7Ffe3ae75d7FfAb09429e3675bb63503e4"
+VICTIM_AMOUNT_IN = 10 * 10**18
+MIN_TIME = 0.1
+REPEAT = 5
+# Absolute slowdown, in microseconds, below which a change is timer noise
+NOISE_FLOOR = 0.5
+# Swaps generated for every enabled router: exact in, exact ETH in, exact out
+SWAP_ARGUMENTS = {
+    "swapExactTokensForTokens": [VICTIM_AMOUNT_IN, 5900 * 10**18],
+    "swapExactETHForTokens": [5900 * 10**18],
+    "swapTokensForExactTokens": [5900 * 10**18, VICTIM_AMOUNT_IN],
+}
+
+
+def load_fixture(filename):
+    with open(os.path.join(FIXTURES, filename), "r") as json_file:
+        return json.load(json_file)
+
+
+def swap_transaction(index, router, name):
+    types = [argument_type for argument_type, _ in SWAP_FUNCTIONS[name]]
+    arguments = SWAP_ARGUMENTS[name] + [[WBNB, USDT], RECIPIENT, 2**32]
+    return {
+        "hash": HexBytes(index.to_bytes(32, "big")),
+        "from": RECIPIENT,
+        "to": router,
+        "value": 0,
+        "gas": 250000,
+        "gasPrice": 3 * 10**9,
+        "nonce": index,
+        "input": "0x"
+        + (function_selector(name, types) + encode(types, arguments)).hex(),
+        "blockHash": None,
+        "blockNumber": None,
+    }
+
+
+def universal_router_input():
+    # BNB in, wrapped and split over a V3 and a V2 swap
+    swap_types = ["address", "uint256", "uint256", "address[]", "bool"]
+    v3_swap_types = ["address", "uint256", "uint256", "bytes", "bool"]
+    v3_path = (
+        bytes.fromhex(WBNB[2:]) + (500).to_bytes(3, "big") + bytes.fromhex(USDT[2:])
+    )
+    inputs = [
+        encode(["address", "uint256"], [RECIPIENT, CONTRACT_BALANCE]),
+        encode(v3_swap_types, [RECIPIENT, VICTIM_AMOUNT_IN // 2, 1, v3_path, False]),
+        encode(swap_types, [RECIPIENT, CONTRACT_BALANCE, 1, [WBNB, USDT], False]),
+    ]
+    commands = bytes([WRAP_ETH, V3_SWAP_EXACT_IN, V2_SWAP_EXACT_IN])
+    return "0x" + (
+        bytes.fromhex("3593564c")
+        + encode(["bytes", "bytes[]", "uint256"], [commands, inputs, 2**32])
+    ).hex()
+
+
+class StubHttpClient:
+    # Every aggregator request answers with the same recorded response
+    def __init__(self, response):
+        self.response = response
+
+    async def get(self, aggregator, url, params=None, headers=None):
+        return self.response
+
+    async def post(self, aggregator, url, params=None, json=None, headers=None):
+        return self.response
+
+
+class HotPath:
+    # The back runner's module state for the enabled V2 DEXes, built from the
+    # fixtures without a node
+    def __init__(self, directory):
+        config = back_runner.load_file("config/bot_config.json")
+        dex_config = back_runner.load_file("config/dex_config.json")
+        back_runner.log.remove()
+        back_runner.max_gas_price = config["max_gas_price"]
+        back_runner.base_tokens = []
+        back_runner.token_registry = back_runner.TokenRegistry()
+        for symbol, token_info in back_runner.get_token_list(
+            config["loan_token_filename"]
+        ).items():
+            token = back_runner.Token(
+                symbol,
+                token_info,
+                token_info["vault"],
+                int(token_info["profit"] * (10**18)),
+            )
+            token.max_loan_amount = 10**24
+            back_runner.base_tokens.append(token)
+            back_runner.token_registry.add(token)
+        back_runner.token_registry.add_token_list(
+            back_runner.get_token_list(config["token_filename"])
+        )
+        self.fetcher = ContractFetcher(
+            {"pair_db_filename": os.path.join(directory, "pairs.db")},
+            back_runner.log,
+            Web3(),
+            FeeTable(dex_config),
+        )
+        self.fetcher.http = StubHttpClient(load_fixture("paraswap_prices.json"))
+        back_runner.fetcher = self.fetcher
+        back_runner.dexs = []
+        back_runner.swap_decoder = back_runner.SwapDecoder()
+        reserves = load_fixture("reserves.json")
+        for dex_name, fixture in reserves["pairs"].items():
+            dex = back_runner.Dex(dex_name, dex_config[dex_name])
+            if dex.init_code_hash is not None:
+                self.fetcher.register_pair_factory(dex)
+                pair = self.fetcher.pair_resolver.resolve(dex_name, WBNB, USDT)[0]
+                # Stored like a pair seen before, so no pair ABI is fetched
+                self.fetcher.pair_db.add_pair(dex_name, WBNB, USDT, pair, [])
+            else:
+                pair = fixture["pair"]
+                self.fetcher.pair_db.add_pair(dex_name, WBNB, USDT, pair, [])
+            self.fetcher.reserve_store.seed(pair, *fixture["reserves"])
+            back_runner.dexs.append(dex)
+            back_runner.swap_decoder.add_router(dex.router, dex)
+        self.wbnb = back_runner.token_registry.loan_token(WBNB)
+        self.swaps = [
+            swap_transaction(index, dex.router, name)
+            for index, (dex, name) in enumerate(
+                itertools.product(back_runner.dexs, SWAP_ARGUMENTS)
+            )
+        ]
+        # Most of the mempool: transfers and calls to contracts we do not watch
+        self.others = [
+            {**transaction, "to": USDT, "input": "0xa9059cbb" + "00" * 64}
+            for transaction in self.swaps
+        ]
+        self.decoded = [
+            back_runner.swap_decoder.decode(transaction["to"], transaction["input"])
+            for transaction in self.swaps
+        ]
+
+    def opportunity(self, dex=None):
+        opportunity = back_runner.Opportunity(dex or back_runner.dexs[0])
+        opportunity.src_token = self.wbnb
+        opportunity.loan_token = self.wbnb
+        opportunity.dest_token = back_runner.token_registry.token(USDT)
+        return opportunity
+
+    def benchmarks(self):
+        swaps = itertools.cycle(self.swaps)
+        others = itertools.cycle(self.others)
+        decoded = itertools.cycle(self.decoded)
+
+        async def initial_checks():
+            await back_runner.initial_checks(next(swaps))
+
+        async def initial_checks_reject():
+            await back_runner.initial_checks(next(others))
+
+        universal_decoder = SwapDecoder()
+        universal_decoder.add_universal_router(
+            UNIVERSAL_ROUTER, back_runner.dexs[0], None
+        )
+        universal_input = universal_router_input()
+
+        def universal_router_decode():
+            universal_decoder.decode(UNIVERSAL_ROUTER, universal_input, VICTIM_AMOUNT_IN)
+
+        async def decode_input_v2():
+            dex, function, arguments = next(decoded)
+            await back_runner.decode_input_v2(
+                back_runner.Decoded_Transaction(None, None, None, 3 * 10**9),
+                function,
+                arguments,
+                back_runner.Opportunity(dex),
+            )
+
+        other = next(
+            token for token in back_runner.base_tokens if token is not self.wbnb
+        )
+        sell_opportunity = self.opportunity()
+        buy_opportunity = self.opportunity()
+
+        def set_sell_dex_token_order():
+            # Sell side the wrong way round, so the order is swapped every time
+            sell_opportunity.src_token = self.wbnb
+            sell_opportunity.dest_token = other
+            back_runner.set_sell_dex_token_order(sell_opportunity, buy_opportunity)
+
+        ordered = self.opportunity()
+        ordered.pair_contract = self.fetcher.pair_resolver.resolve(
+            ordered.dex.name, WBNB, USDT
+        )[0]
+
+        reserve0, reserve1, _ = self.fetcher.reserve_store.get(ordered.pair_contract)
+        token0, _ = sort_tokens(WBNB, USDT)
+        if token0 != to_address_bytes(WBNB):
+            reserve0, reserve1 = reserve1, reserve0
+        hop = simulator.Hop(
+            ordered.dex.name,
+            ordered.pair_contract,
+            reserve0,
+            reserve1,
+            *self.fetcher.fee_table.get(ordered.dex.name, ordered.pair_contract),
+        )
+        simulator.simulate_path([hop], VICTIM_AMOUNT_IN)
+        ordered.victim_pool = hop.pool_after(True)
+
+        victim = back_runner.Decoded_Transaction(None, None, None, 3 * 10**9)
+        victim.amount_in = VICTIM_AMOUNT_IN
+        victim.path = [self.wbnb, ordered.dest_token]
+
+        async def reserve_ordering():
+            await self.fetcher.get_token_order(ordered.dest_token, ordered)
+            await self.fetcher.get_reserves(ordered)
+
+        async def victim_path():
+            await back_runner.simulate_victim(ordered.dex, victim)
+
+        async def local_profit():
+            await back_runner.simulate_backrun(ordered)
+
+        async def quote_evaluation():
+            quote = await self.fetcher.get_swap_quote(
+                "paraswap", self.wbnb, ordered.dest_token, VICTIM_AMOUNT_IN
+            )
+            return quote.dest_amount > VICTIM_AMOUNT_IN + self.wbnb.profit
+
+        return {
+            "initial_checks": initial_checks,
+            "initial_checks_reject": initial_checks_reject,
+            "decode_input_v2": decode_input_v2,
+            "universal_router_decode": universal_router_decode,
+            "set_sell_dex_token_order": set_sell_dex_token_order,
+            "reserve_ordering": reserve_ordering,
+            "victim_path": victim_path,
+            "local_profit": local_profit,
+            "quote_evaluation": quote_evaluation,
+        }
+
+
+async def timed_rounds(function, rounds):
+    is_coroutine = asyncio.iscoroutinefunction(function)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        if is_coroutine:
+            await function()
+        else:
+            function()
+    return time.perf_counter() - start
+
+
+async def measure(function, min_time=MIN_TIME, repeat=REPEAT):
+    # Best of repeat runs, in microseconds per call. The round count grows
+    # until one run takes min_time, so fast and slow stages are timed equally
+    # well. Coroutines are awaited in one running loop so the loop's own
+    # startup is not counted.
+    rounds = 1
+    while await timed_rounds(function, rounds) < min_time:
+        rounds *= 2
+    best = min([await timed_rounds(function, rounds) for _ in range(repeat)])
+    return best / rounds * 1e6
+
+
+async def run_benchmarks(benchmarks):
+    # Collections are left out of the timings, like timeit does
+    gc.disable()
+    try:
+        return {name: await measure(function) for name, function in benchmarks.items()}
+    finally:
+        gc.enable()
+
+
+def compare(results, baseline, tolerance):
+    # Names of the benchmarks slower than the baseline by more than tolerance
+    regressions = []
+    for name, microseconds in results.items():
+        reference = baseline.get(name)
+        change = "" if reference is None else f"{microseconds / reference - 1:+7.1%}"
+        print(f"{name:>26}: {microseconds:9.2f} us {change}")
+        if (
+            reference is not None
+            and microseconds > reference * (1 + tolerance)
+            and microseconds - reference > NOISE_FLOOR
+        ):
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the decode and pricing hot path against the stored baseline"
+    )
+    parser.add_argument("--baseline", default=BASELINE_FILENAME)
+    parser.add_argument(
+        "--save", action="store_true", help="Store these results as the baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Slowdown over the baseline reported as a regression",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        hot_path = HotPath(directory)
+        results = asyncio.run(run_benchmarks(hot_path.benchmarks()))
+        hot_path.fetcher.pair_db.close()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as json_file:
+            baseline = json.load(json_file)
+    regressions = compare(results, baseline, args.tolerance)
+    if args.save:
+        with open(args.baseline, "w") as json_file:
+            json.dump(
+                {name: round(value, 2) for name, value in results.items()},
+                json_file,
+                indent=2,
+            )
+            json_file.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"Slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import json
+import timeit
+from web3 import Web3
+from scripts.tx_builder import FlashArbitrageTransactions
+
+ARBITRAGE = "0x31E3d0a099954C285e232387946B4190EEb5EB68"
+LENDER = "0xEe7e961f77066c5E995615ae7e7E8e4366d9eC5A"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+PRIVATE_KEY = "0x" + "4c" * 32
+CALLDATA1 = bytes(range(256)) * 6
+CALLDATA2 = bytes(range(256)) * 6
+ROUNDS = 500
+
+
+def main():
+    w3 = Web3()
+    with open("abi/smart_contract_abi.json", "r") as json_file:
+        contract = w3.eth.contract(address=ARBITRAGE, abi=json.load(json_file))
+    account = w3.eth.account.from_key(PRIVATE_KEY)
+    transactions = FlashArbitrageTransactions(
+        ARBITRAGE, LENDER, PRIVATE_KEY, 56, 1500000
+    )
+
+    def web3_path():
+        transaction = contract.functions.executeFlashArbitrage(
+            LENDER, 10**18, BUSD, WBNB, CALLDATA1, CALLDATA2
+        ).build_transaction(
+            {
+                "from": account.address,
+                "gas": 1500000,
+                "gasPrice": 3 * 10**9,
+                "nonce": 12,
+                "chainId": 56,
+            }
+        )
+        w3.eth.account.sign_transaction(transaction, PRIVATE_KEY)
+
+    def template_path():
+        transactions.build(12, 3 * 10**9, 10**18, BUSD, WBNB, CALLDATA1, CALLDATA2)
+
+    for name, function in (
+        ("web3 build + sign", web3_path),
+        ("template", template_path),
+    ):
+        seconds = min(timeit.repeat(function, number=ROUNDS, repeat=3)) / ROUNDS
+        print(f"{name:>18}: {seconds * 1e6:8.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+DEFAULT_FEE = 25
+DEFAULT_FEE_DENOMINATOR = 10000
+
+
+def get_amount_out(
+    amount_in,
+    reserve_in,
+    reserve_out,
+    fee=DEFAULT_FEE,
+    fee_denominator=DEFAULT_FEE_DENOMINATOR,
+):
+    # Mirrors UniswapV2Library.getAmountOut with the fork's own fee constants,
+    # so the integer result matches the router exactly.
+    if amount_in <= 0:
+        raise ValueError("INSUFFICIENT_INPUT_AMOUNT")
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("INSUFFICIENT_LIQUIDITY")
+    amount_in_with_fee = amount_in * (fee_denominator - fee)
+    numerator = amount_in_with_fee * reserve_out
+    denominator = reserve_in * fee_denominator + amount_in_with_fee
+    return numerator // denominator
+
+
+def get_amount_in(
+    amount_out,
+    reserve_in,
+    reserve_out,
+    fee=DEFAULT_FEE,
+    fee_denominator=DEFAULT_FEE_DENOMINATOR,
+):
+    if amount_out <= 0:
+        raise ValueError("INSUFFICIENT_OUTPUT_AMOUNT")
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("INSUFFICIENT_LIQUIDITY")
+    if amount_out >= reserve_out:
+        # The router reverts on the underflow / division by zero here
+        raise ValueError("INSUFFICIENT_LIQUIDITY")
+    numerator = reserve_in * amount_out * fee_denominator
+    denominator = (reserve_out - amount_out) * (fee_denominator - fee)
+    return numerator // denominator + 1
+
+
+class FeeTable:
+    def __init__(self, dex_config):
+        self.dex_fees = {}
+        self.pair_fee_functions = {}
+        self.pair_fees = {}
+        for dex_name, dex_info in dex_config.items():
+            fee_denominator = dex_info.get("fee_denominator", DEFAULT_FEE_DENOMINATOR)
+            self.dex_fees[dex_name] = (
+                dex_info.get("fee", DEFAULT_FEE),
+                fee_denominator,
+            )
+            if "pair_fee_function" in dex_info:
+                self.pair_fee_functions[dex_name] = (
+                    dex_info["pair_fee_function"],
+                    dex_info.get("pair_fee_denominator", fee_denominator),
+                )
+
+    def get(self, dex_name, pair=None):
+        if pair is not None:
+            fee = self.pair_fees.get(pair)
+            if fee is not None:
+                return fee
+        return self.dex_fees.get(dex_name, (DEFAULT_FEE, DEFAULT_FEE_DENOMINATOR))
+
+    def has_pair_fee(self, pair):
+        return pair in self.pair_fees
+
+    def get_pair_fee_function(self, dex_name):
+        return self.pair_fee_functions.get(dex_name)
+
+    def set_pair_fee(self, pair, fee, fee_denominator):
+        self.pair_fees[pair] = (fee, fee_denominator)
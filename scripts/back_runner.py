@@ -5,9 +5,29 @@ from web3.middleware import geth_poa_middleware
 import traceback
 import json
 import time
-import threading
 from eth_account import Account
 from scripts.contract_fetcher import ContractFetcher
+from scripts.amm import FeeTable
+from scripts.mempool_stream import MempoolStream
+from scripts.swap_decoder import SwapDecoder
+from scripts import simulator
+from scripts.nonce_manager import NonceManager
+from scripts.gas_oracle import GasOracle
+from scripts.receipt_tracker import ReceiptTracker
+from scripts.broadcaster import Broadcaster
+from scripts.node_client import NodeClient
+from scripts.tx_builder import FlashArbitrageTransactions
+from scripts.tx_simulator import SimulationCandidate, TransactionSimulator
+from scripts.v3_math import FEE_TIERS
+from scripts.recorder import Recorder
+from scripts.metrics import Metrics
+from scripts.boot import BootLoader
+from scripts.token_registry import (
+    Decoded_Token,
+    Token,
+    TokenRegistry,
+    checksum_address,
+)
 from decimal import Decimal
 import os
 from loguru import logger as log
@@ -17,13 +37,11 @@ from copy import deepcopy
 import math
 
 
-global_gas_price = None
-gas_price_lock = threading.Lock()
 fetcher = None
 uni_router = None
 dexs = []
 base_tokens = []
-tokens = {}
+token_registry = TokenRegistry()
 biswap = None
 arbitrage_address = None
 arbitrage_abi = None
@@ -33,6 +51,25 @@ account = None
 gas_limit = None
 max_gas_price = None
 aggregator = None
+worker_count = None
+queue_depth = None
+mempool_stream = None
+aggregators = None
+aggregator_deadline = None
+nonce_manager = None
+gas_oracle = None
+receipt_tracker = None
+broadcaster = None
+node = None
+arbitrage_transactions = None
+transaction_simulator = None
+simulation_loan_fractions = None
+simulation_gas_headroom = None
+recorder = None
+metrics_port = None
+boot_started_at = None
+swap_decoder = SwapDecoder()
+metrics = Metrics()
 
 
 def connect_to_network(network_ws):
@@ -53,34 +90,71 @@ class Router:
         self.abi = abi
 
 
-class Token:
-    def __init__(self, symbol, token_info, vault=None, profit=None, loan_amount=None):
-        self.symbol = symbol
-        self.address = Web3.to_checksum_address(token_info["address"])
-        self.decimals = token_info["decimals"]
-        self.profit = profit
-        self.vault = vault
-        self.max_loan_amount = None
-        self.loan_amount = None
-        self.abi = None
-
-
-class Decoded_Token:
-    def __init__(self, address):
-        self.address = Web3.to_checksum_address(address)
-        self.abi = None
-
-
 class Dex:
+    __slots__ = (
+        "name",
+        "factory",
+        "router",
+        "quoter",
+        "pool_deployer",
+        "universal_router",
+        "v2_dex",
+        "v3_dex",
+        "init_code_hash",
+        "enabled",
+        "factory_abi",
+        "router_abi",
+        "quoter_abi",
+        "pair_abi",
+    )
+
     def __init__(self, name, dex_info):
         self.name = name
-        self.factory = Web3.to_checksum_address(dex_info[Type.FACTORY])
-        self.router = Web3.to_checksum_address(dex_info[Type.ROUTER])
+        # A Universal Router entry trades on the pools of other entries
+        self.factory = (
+            checksum_address(dex_info[Type.FACTORY])
+            if Type.FACTORY in dex_info
+            else None
+        )
+        self.router = checksum_address(dex_info[Type.ROUTER])
         self.quoter = dex_info.get(Type.QUOTER, None)
+        self.pool_deployer = dex_info.get(Type.POOL_DEPLOYER, None)
+        self.universal_router = dex_info.get(Type.UNIVERSAL_ROUTER, False)
+        self.v2_dex = dex_info.get(Type.V2_DEX, None)
+        self.v3_dex = dex_info.get(Type.V3_DEX, None)
+        self.init_code_hash = dex_info.get(Type.INIT_CODE_HASH, None)
         self.enabled = dex_info["enabled"]
         self.factory_abi = None
         self.router_abi = None
         self.quoter_abi = None
+        self.pair_abi = None
+
+
+class Opportunity:
+    # Everything worked out for one victim on one DEX. Each worker owns its
+    # opportunity, the shared Dex and Token objects are never written to.
+    __slots__ = (
+        "dex",
+        "pair_contract",
+        "pair_abi",
+        "src_token",
+        "dest_token",
+        "loan_token",
+        "src_token_position",
+        "dest_token_position",
+        "src_token_reserves",
+        "dest_token_reserves",
+        "loan_amount",
+        "swap_quote",
+        "gas_price",
+        "calldata",
+        "calldata2",
+        "gas_used",
+        "victim_pool",
+    )
+
+    def __init__(self, dex):
+        self.dex = dex
         self.pair_contract = None
         self.pair_abi = None
         self.src_token = None
@@ -90,13 +164,31 @@ class Dex:
         self.dest_token_position = None
         self.src_token_reserves = None
         self.dest_token_reserves = None
+        self.loan_amount = None
         self.swap_quote = None
         self.gas_price = None
         self.calldata = None
         self.calldata2 = None
+        self.gas_used = None
+        self.victim_pool = None
 
 
 class Decoded_Transaction:
+    __slots__ = (
+        "block_hash",
+        "block_number",
+        "transaction_hash",
+        "gas_price",
+        "received_at",
+        "function",
+        "amount_out",
+        "amount_in",
+        "src_token_address",
+        "dest_token_address",
+        "path",
+        "fees",
+    )
+
     def __init__(
         self,
         block_hash,
@@ -108,11 +200,15 @@ class Decoded_Transaction:
         self.block_number = block_number
         self.transaction_hash = transaction_hash
         self.gas_price = gas_price
+        self.received_at = None
         self.function = None
         self.amount_out = None
         self.amount_in = None
         self.src_token_address = None
         self.dest_token_address = None
+        self.path = None
+        # Fee tier of each hop of a V3 swap, None for a V2 swap
+        self.fees = None
 
 
 def get_token_list(token_filename):
@@ -121,16 +217,6 @@ def get_token_list(token_filename):
         return tokens
 
 
-async def get_gas_price():
-    try:
-        gas_price = w3.eth.gas_price
-        log.info(f"Current gas price: {gas_price}")
-        return int(gas_price)
-    except Exception as e:
-        traceback.print_exc()
-        return None
-
-
 async def add_percentage(wad, percentage):
     result = wad + (percentage / 100) * wad
     return int(result)
@@ -141,323 +227,554 @@ async def subtract_percentage(wad, percentage):
     return int(result)
 
 
-async def decode_input_v2(decoded_transaction, transaction_details, dex):
+async def decode_input_v2(decoded_transaction, function, arguments, opportunity):
     try:
-        contract = w3.eth.contract(address=dex.router, abi=dex.router_abi)
-        input = contract.decode_function_input(transaction_details["input"])
-        if dex.quoter is not None:
-            byte_array = input[1]["inputs"][0]
-            call_decoded = contract.decode_function_input(byte_array)
-            print(call_decoded)
-        else:
-
-            function = input[0]
-            arguments = input[1]
-            amount_in = None
-            log.debug(dex.name)
-
-            if "amountIn" in arguments:
-                # return None
-                amount_in = arguments["amountIn"]
-                if amount_in == 0 or amount_in is None:
-                    return None
-
-            if "amountOutMin" not in arguments:
-                log.debug("Amount out not found")
-                return None
-
-            if arguments["amountOutMin"] == 0 and (amount_in is None or amount_in == 0):
-                log.debug("Amounts not found")
-                return None
+        amount_in = None
+        log.debug(opportunity.dex.name)
 
-            if len(arguments["path"]) > 2:
-                log.debug("The path is too large")
+        if "amountIn" in arguments:
+            amount_in = arguments["amountIn"]
+            if amount_in == 0:
+                metrics.reject("zero_amount")
                 return None
 
-            dex.src_token = next(
-                (
-                    base_token
-                    for base_token in base_tokens
-                    if base_token.address.lower() == arguments["path"][0].lower()
-                ),
-                None,
-            )
-            if dex.src_token is None:
-                log.debug("src token not found")
-                return None
-            log.warning(f"Decoded Input: {input}")
-            dex.dest_token = Decoded_Token(arguments["path"][1])
-            log.debug(f"src_token: {dex.src_token.address}")
-            log.debug(f"dest_token: {dex.dest_token.address}")
-            amount_out = arguments["amountOutMin"]
-            decoded_transaction.function = function
-            decoded_transaction.src_token_address = dex.src_token.address
-            decoded_transaction.dest_token_address = dex.dest_token.address
-            decoded_transaction.amount_in = amount_in
-            decoded_transaction.amount_out = amount_out
-            return True
+        # Exact-input swaps give a minimum out, exact-output swaps the exact out
+        amount_out = arguments.get("amountOutMin", arguments.get("amountOut"))
+        if amount_out == 0 and amount_in is None:
+            log.debug("Amounts not found")
+            metrics.reject("no_amounts")
+            return None
+
+        path = [token_registry.token(address) for address in arguments["path"]]
+        # Only a pair with a loan token on one side can be backrun
+        if not any(token.key in token_registry.loan_tokens for token in path):
+            log.debug("No loan token in the path")
+            metrics.reject("no_loan_token")
+            return None
+        log.warning(f"Decoded Input: {function.name} {arguments}")
+        opportunity.src_token = path[0]
+        opportunity.dest_token = path[-1]
+        log.debug(f"src_token: {opportunity.src_token.address}")
+        log.debug(f"dest_token: {opportunity.dest_token.address}")
+        decoded_transaction.function = function
+        decoded_transaction.src_token_address = opportunity.src_token.address
+        decoded_transaction.dest_token_address = opportunity.dest_token.address
+        decoded_transaction.amount_in = amount_in
+        decoded_transaction.amount_out = amount_out
+        decoded_transaction.path = path
+        decoded_transaction.fees = function.fees
+        return True
     except Exception as e:
         log.error("Error decoding tx: {}".format(e))
         traceback.print_exc()
 
 
-async def initial_checks(transaction):
+async def initial_checks(transaction_details):
     try:
-        if transaction is not None:
-            transaction_hash = transaction.hex()
-            transaction_details = w3.eth.get_transaction(transaction_hash)
-            if transaction_details["to"] is None:
-                return False, None, None
-            dex = next(
-                (
-                    dex
-                    for dex in dexs
-                    if dex.router.lower() == transaction_details["to"].lower()
-                ),
-                None,
-            )
-            if not dex:
-                return False, None, None
-            # log.info(transaction_details)
-            if transaction_details["gasPrice"] > max_gas_price:
-                log.warning(
-                    f"Gas price for transcation is too high - {transaction_details['gasPrice']}"
+        if transaction_details is not None:
+            with metrics.span("decode"):
+                decoded_input = swap_decoder.decode(
+                    transaction_details["to"],
+                    transaction_details["input"],
+                    transaction_details.get("value", 0),
                 )
-                return False, None, None
-            decoded_transaction = Decoded_Transaction(
-                transaction_details["blockHash"],
-                transaction_details["blockNumber"],
-                transaction_details["hash"],
-                transaction_details["gasPrice"],
-            )
-            inputDecoded = await decode_input_v2(
-                decoded_transaction, transaction_details, dex
-            )
-            if inputDecoded:
-                return True, decoded_transaction, dex
-            else:
-                return False, None, None
+                if decoded_input is None:
+                    metrics.reject("not_a_swap")
+                    return False, None, None
+                metrics.count("decoded")
+                dex, function, arguments = decoded_input
+                # log.info(transaction_details)
+                if transaction_details["gasPrice"] > max_gas_price:
+                    log.warning(
+                        f"Gas price for transcation is too high - {transaction_details['gasPrice']}"
+                    )
+                    metrics.reject("gas_price_too_high")
+                    return False, None, None
+                decoded_transaction = Decoded_Transaction(
+                    transaction_details["blockHash"],
+                    transaction_details["blockNumber"],
+                    transaction_details["hash"],
+                    transaction_details["gasPrice"],
+                )
+                decoded_transaction.received_at = transaction_details.get(
+                    "received_at"
+                )
+                opportunity = Opportunity(dex)
+                inputDecoded = await decode_input_v2(
+                    decoded_transaction, function, arguments, opportunity
+                )
+                if inputDecoded:
+                    return True, decoded_transaction, opportunity
+                else:
+                    return False, None, None
 
     except Exception as e:
         # log.warning(f"Error in handle_transaction: {e}")
+        metrics.reject("decode_error")
         return False, None, None
 
 
-async def execute_transaction(dex, transaction, swap_type):
-    arb_contract = w3.eth.contract(
-        address=w3.to_checksum_address(arbitrage_address), abi=arbitrage_abi
+async def execute_transaction(opportunity, transaction, swap_type):
+    nonce = nonce_manager.allocate()
+    try:
+        # Encode and sign with the prebuilt template, the gas limit comes from
+        # the simulation with some headroom for state moving until inclusion
+        with metrics.span("sign"):
+            raw_transaction, _ = arbitrage_transactions.build(
+                nonce,
+                opportunity.gas_price,
+                opportunity.loan_amount,
+                opportunity.dest_token.address,
+                opportunity.loan_token.address,
+                opportunity.calldata,
+                opportunity.calldata2,
+                min(gas_limit, int(opportunity.gas_used * simulation_gas_headroom)),
+            )
+    except Exception:
+        nonce_manager.release(nonce)
+        raise
+
+    # Send transaction to the node and every broadcast endpoint at once
+    try:
+        with metrics.span("broadcast"):
+            tx_hash, endpoint = await broadcaster.broadcast(raw_transaction)
+    except Exception:
+        # Nonce too low or an underpriced replacement, the chain knows better
+        metrics.reject("broadcast_failed")
+        nonce_manager.release(nonce)
+        nonce_manager.resync()
+        raise
+    metrics.count("submitted")
+    if transaction.received_at is not None:
+        metrics.observe(
+            "time_to_broadcast", time.perf_counter() - transaction.received_at
+        )
+    nonce_manager.track(nonce, tx_hash)
+    log.info(
+        f"Arbitrage transaction sent: {tx_hash.hex()} (nonce {nonce}, first accepted by {endpoint})"
     )
-    gas_price = None
-    if transaction.gas_price > dex.gas_price:
-        gas_price = transaction.gas_price - 100000
-    else:
-        gas_price = transaction.gas_price
-
-    tx_params = {
-        "from": account.address,
-        "gas": gas_limit,
-        "gasPrice": dex.gas_price,
-        "nonce": w3.eth.get_transaction_count(account.address),
-    }
-
-    calldata = HexBytes(dex.calldata)
-    calldata2 = HexBytes(dex.calldata2)
-    transaction = arb_contract.functions.executeFlashArbitrage(
-        flashloan_address,
-        dex.loan_token.loan_amount,
-        dex.dest_token.address,
-        dex.loan_token.address,
-        calldata,
-        calldata2,
-    ).build_transaction(tx_params)
-
-    estimated_gas = w3.eth.estimate_gas(tx_params, block_identifier=None)
-    log.info(f"Estimated gas for transaction: {estimated_gas}")
-
-    # Sign transaction
-    signed_transaction = w3.eth.account.sign_transaction(transaction, private_key)
-
-    # Send transaction
-    tx_hash = w3.eth.send_raw_transaction(signed_transaction.rawTransaction)
-    log.info(f"Arbitrage transaction sent: {tx_hash.hex()}")
-
-    # Wait for the transaction receipt
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    log.info(f"Arbitrage transaction mined in block: {receipt['blockNumber']}")
-    sys.exit(1)
-
-
-async def build_v2_swap(dex, transaction):
-    if transaction.amount_in is None:
-        await fetcher.get_pair_contract_and_abi_async(
-            dex,
-            dex.src_token,
-            dex.dest_token,
+
+    # The receipt tracker follows it from here, the worker goes back to the queue
+    receipt_tracker.track(
+        tx_hash,
+        nonce,
+        f"{opportunity.loan_token.symbol}/{opportunity.dest_token.address}",
+    )
+    return tx_hash
+
+
+async def simulate_backrun(opportunity):
+    # Size the backrun of the pair the victim moved against every other enabled
+    # V2 pair and V3 pool locally, without asking the aggregator.
+    all_reserves = await fetcher.get_reserves_all_dexes(
+        dexs, opportunity.loan_token, opportunity.dest_token
+    )
+    # Served from memory once a pool has been read, so not worth a task
+    v3_pools = await fetcher.get_v3_pools_all_dexes(
+        dexs, opportunity.loan_token, opportunity.dest_token
+    )
+    other_pools = []
+    for dex_name, (pair, reserve_loan, reserve_token) in all_reserves.items():
+        if dex_name == opportunity.dex.name:
+            continue
+        fee, fee_denominator = fetcher.fee_table.get(dex_name, pair)
+        other_pools.append(
+            simulator.Pool(
+                dex_name, pair, reserve_loan, reserve_token, fee, fee_denominator
+            )
         )
-        await fetcher.get_token_order(dex.dest_token, dex)
-        await fetcher.get_reserves(dex)
-        log.info(f"before src reserves: {dex.src_token_reserves}")
-        log.info(f"before dest reserves: {dex.dest_token_reserves}")
-        log.info(f"Amount out {transaction.amount_out}")
-    if transaction.amount_out < dex.dest_token_reserves:
-        amount_in = await fetcher.get_amount_in(
-            dex,
-            transaction.amount_out,
-            dex.src_token_reserves,
-            dex.dest_token_reserves,
+    # A pool is listed once, and never against itself when the victim swaps
+    # on it
+    seen = {opportunity.pair_contract}
+    for (dex_name, _), (pool, state, loan_is_token0) in v3_pools.items():
+        if pool in seen:
+            continue
+        seen.add(pool)
+        other_pools.append(simulator.V3Pool(dex_name, pool, state, loan_is_token0))
+    return simulator.find_best_backrun(
+        opportunity.victim_pool, other_pools, opportunity.loan_token.max_loan_amount
+    )
+
+
+async def quote_candidate(opportunity, loan_amount):
+    # Both aggregator legs for one loan size, built into calldata
+    with metrics.span("quote"):
+        swap_quote = await fetcher.race_swap_quotes(
+            opportunity.loan_token,
+            opportunity.dest_token,
+            loan_amount,
+            aggregators,
+            aggregator_deadline,
         )
-        dex.loan_token.loan_amount = min(amount_in, dex.loan_token.max_loan_amount)
-        desired_amount = dex.loan_token.loan_amount + dex.loan_token.profit
-        log.info(f"Amount in: {amount_in}")
-        log.warning(f"Desired amount: {desired_amount}")
-        log.warning(
-            f"Loan amount {dex.loan_token.symbol}: {dex.loan_token.loan_amount}"
+    if swap_quote is None:
+        return None
+    # A cached quote may be for a slightly smaller amount, borrow exactly that
+    desired_amount = swap_quote.src_amount + opportunity.loan_token.profit
+    with metrics.span("quote"):
+        swap2_quote = await fetcher.race_swap_quotes(
+            opportunity.dest_token,
+            opportunity.loan_token,
+            swap_quote.dest_amount,
+            aggregators,
+            aggregator_deadline,
         )
-        swap_data = await fetcher.get_swap_route_paraswap(
-            dex.loan_token, dex.dest_token, dex.loan_token.loan_amount
+    if swap2_quote is None:
+        return None
+    log.warning(
+        f"Loan {swap_quote.src_amount}: swap amount out {swap_quote.dest_amount} "
+        f"({swap_quote.aggregator}), swap2 amount out {swap2_quote.dest_amount} "
+        f"({swap2_quote.aggregator}), desired {desired_amount}"
+    )
+    if swap2_quote.dest_amount <= desired_amount:
+        return None
+    with metrics.span("calldata"):
+        calldata, calldata2 = await asyncio.gather(
+            fetcher.build_swap_transaction(
+                swap_quote,
+                opportunity.loan_token,
+                opportunity.dest_token,
+                arbitrage_address,
+                opportunity.loan_token.vault,
+            ),
+            fetcher.build_swap_transaction(
+                swap2_quote,
+                opportunity.dest_token,
+                opportunity.loan_token,
+                arbitrage_address,
+                opportunity.loan_token.vault,
+            ),
         )
-        swap2_data = await fetcher.get_swap_route_paraswap(
-            dex.dest_token, dex.loan_token, swap_data["destAmount"]
+    if calldata is None or calldata2 is None:
+        return None
+    return SimulationCandidate(
+        swap_quote.src_amount,
+        bytes(HexBytes(calldata)),
+        bytes(HexBytes(calldata2)),
+        swap2_quote.dest_amount,
+    )
+
+
+async def load_pair(opportunity):
+    await fetcher.get_pair_contract_and_abi_async(
+        opportunity,
+        opportunity.src_token,
+        opportunity.dest_token,
+    )
+    if opportunity.pair_contract is None:
+        return
+    await fetcher.get_pair_fee(opportunity)
+    await fetcher.get_token_order(opportunity.dest_token, opportunity)
+
+
+def reverse_opportunity(opportunity):
+    # Look at the pair from its dest token instead
+    opportunity.src_token, opportunity.dest_token = (
+        opportunity.dest_token,
+        opportunity.src_token,
+    )
+    opportunity.src_token_position, opportunity.dest_token_position = (
+        opportunity.dest_token_position,
+        opportunity.src_token_position,
+    )
+    opportunity.src_token_reserves, opportunity.dest_token_reserves = (
+        opportunity.dest_token_reserves,
+        opportunity.src_token_reserves,
+    )
+
+
+async def simulate_victim(dex, transaction):
+    # Replay the victim hop by hop on the cached reserves of every pair in its
+    # path. Returns an opportunity for each pair it moves that has a loan token
+    # on one side, with src_token the loan token and victim_pool the pair after
+    # the victim's swap.
+    path = transaction.path
+    opportunities = []
+    for token_in, token_out in zip(path, path[1:]):
+        opportunity = Opportunity(dex)
+        opportunity.src_token = token_in
+        opportunity.dest_token = token_out
+        opportunities.append(opportunity)
+    with metrics.span("pair"):
+        await asyncio.gather(*(load_pair(opportunity) for opportunity in opportunities))
+    if any(opportunity.pair_contract is None for opportunity in opportunities):
+        metrics.reject("no_pair")
+        return []
+    with metrics.span("reserves"):
+        await asyncio.gather(
+            *(fetcher.get_reserves(opportunity) for opportunity in opportunities)
         )
-        if swap_data is not None and swap2_data is not None:
-            swap_amount_out = int(swap_data["destAmount"])
-            log.warning(f"Swap amount out: {swap_amount_out}")
-            log.warning(f"Swap2 amount out: {swap2_data['destAmount']}")
-            if int(swap2_data["destAmount"]) > desired_amount:
-                # dex.calldata = swap_data["data"]
-                dex.calldata = await fetcher.build_paraswap_transaction(
-                    dex.loan_token,
-                    dex.dest_token,
-                    swap_data["srcAmount"],
-                    swap_data,
-                    arbitrage_address,
-                    dex.loan_token.vault,
-                )
-                dex.calldata2 = await fetcher.build_paraswap_transaction(
-                    dex.dest_token,
-                    dex.loan_token,
-                    swap2_data["srcAmount"],
-                    swap2_data,
-                    arbitrage_address,
-                    dex.loan_token.vault,
-                )
-                log.success("Arbitrage found")
-                dex.gas_price = await get_gas_price()
-                await execute_transaction(dex, transaction, 1)
-    else:
-        dex.loan_token.loan_amount = min(
-            transaction.amount_in, dex.loan_token.max_loan_amount
+    if any(opportunity.dest_token_reserves is None for opportunity in opportunities):
+        metrics.reject("no_reserves")
+        return []
+    hops = [
+        simulator.Hop(
+            dex.name,
+            opportunity.pair_contract,
+            opportunity.src_token_reserves,
+            opportunity.dest_token_reserves,
+            *fetcher.fee_table.get(dex.name, opportunity.pair_contract),
         )
-        # dex.loan_token.loan_amount = dex.loan_token.max_loan_amount
-        desired_amount = dex.loan_token.loan_amount + dex.loan_token.profit
-        log.warning(
-            f"loan amount {dex.loan_token.symbol}: {dex.loan_token.loan_amount}"
+        for opportunity in opportunities
+    ]
+    return backrun_opportunities(opportunities, hops, transaction)
+
+
+async def simulate_victim_v3(dex, transaction):
+    # Same as simulate_victim on the V3 pool of each hop's fee tier, priced
+    # from the V3 pool store, with victim_pool the pool after the victim's
+    # swap.
+    path = transaction.path
+    opportunities = []
+    pools = []
+    for token_in, token_out, fee in zip(path, path[1:], transaction.fees):
+        resolved = fetcher.pair_resolver.resolve_pool(
+            dex.name, token_in.address, token_out.address, fee
         )
-        log.warning(f"Desired amount: {desired_amount}")
-        swap_data = await fetcher.get_swap_route_paraswap(
-            dex.loan_token, dex.dest_token, dex.loan_token.loan_amount
+        if resolved is None or fee not in FEE_TIERS:
+            metrics.reject("no_pair")
+            return []
+        opportunity = Opportunity(dex)
+        opportunity.src_token = token_in
+        opportunity.dest_token = token_out
+        opportunity.pair_contract, opportunity.src_token_position = resolved
+        opportunity.dest_token_position = 1 - opportunity.src_token_position
+        opportunities.append(opportunity)
+        pools.append((opportunity.pair_contract, fee))
+    with metrics.span("reserves"):
+        states = await fetcher.v3_pools.load(pools)
+    if any(state is None for state in states.values()):
+        metrics.reject("no_reserves")
+        return []
+    hops = [
+        simulator.V3Hop(
+            dex.name,
+            opportunity.pair_contract,
+            states[opportunity.pair_contract],
+            opportunity.src_token_position == 0,
         )
-        swap2_data = await fetcher.get_swap_route_paraswap(
-            dex.dest_token, dex.loan_token, swap_data["destAmount"]
+        for opportunity in opportunities
+    ]
+    return backrun_opportunities(opportunities, hops, transaction)
+
+
+def backrun_opportunities(opportunities, hops, transaction):
+    # Runs the victim's swap through the hops of its path and keeps the
+    # opportunities with a loan token on one side of their pool
+    try:
+        simulator.simulate_path(hops, transaction.amount_in, transaction.amount_out)
+    except ValueError as e:
+        log.debug(f"The victim's swap reverts on the cached reserves: {e}")
+        metrics.reject("exceeds_reserves")
+        return []
+
+    backruns = []
+    for opportunity, hop in zip(opportunities, hops):
+        log.info(f"Hop {hop.pair}: {hop.amount_in} in, {hop.amount_out} out")
+        src_loan_token = token_registry.loan_tokens.get(opportunity.src_token.key)
+        dest_loan_token = token_registry.loan_tokens.get(opportunity.dest_token.key)
+        if src_loan_token is not None and dest_loan_token is not None:
+            metrics.reject("base_token_output")
+            continue
+        if src_loan_token is not None:
+            opportunity.loan_token = src_loan_token
+        elif dest_loan_token is not None:
+            reverse_opportunity(opportunity)
+            opportunity.loan_token = dest_loan_token
+        else:
+            continue
+        opportunity.victim_pool = hop.pool_after(src_loan_token is not None)
+        backruns.append(opportunity)
+    return backruns
+
+
+def victim_override(opportunity):
+    # The victim's pool after its swap as a state override, so the simulation
+    # sees it on chain, or None when it cannot be written
+    victim_pool = opportunity.victim_pool
+    if isinstance(victim_pool, simulator.V3Pool):
+        state_override = transaction_simulator.v3_pool_override(
+            victim_pool.pair, victim_pool.state
         )
-        if swap_data is not None and swap2_data is not None:
-            swap_amount_out = int(swap_data["destAmount"])
-            log.warning(f"Swap amount out: {swap_amount_out}")
-            log.warning(f"Swap2 amount out: {swap2_data['destAmount']}")
-            if int(swap2_data["destAmount"]) > desired_amount:
-                # dex.calldata = swap_data["data"]
-                dex.calldata = await fetcher.build_paraswap_transaction(
-                    dex.loan_token,
-                    dex.dest_token,
-                    swap_data["srcAmount"],
-                    swap_data,
-                    arbitrage_address,
-                    dex.loan_token.vault,
-                )
-                dex.calldata2 = await fetcher.build_paraswap_transaction(
-                    dex.dest_token,
-                    dex.loan_token,
-                    swap2_data["srcAmount"],
-                    swap2_data,
-                    arbitrage_address,
-                    dex.loan_token.vault,
-                )
-                log.success("Arbitrage found")
-                dex.gas_price = await get_gas_price()
-                await execute_transaction(dex, transaction, 1)
+        if state_override is None:
+            metrics.reject("no_state_override")
+        return state_override
+    if opportunity.src_token_position == 0:
+        token0, token1 = opportunity.src_token, opportunity.dest_token
+        reserve0, reserve1 = victim_pool.reserve_loan, victim_pool.reserve_token
+    else:
+        token0, token1 = opportunity.dest_token, opportunity.src_token
+        reserve0, reserve1 = victim_pool.reserve_token, victim_pool.reserve_loan
+    # The override needs the balance slots worked out at boot, without them
+    # the pair's K check sees its old balances and every candidate reverts
+    if not (
+        transaction_simulator.has_balance_slot(token0.address)
+        and transaction_simulator.has_balance_slot(token1.address)
+    ):
+        log.debug(f"No balance slot for {token0.address} or {token1.address}")
+        metrics.reject("no_balance_slot")
+        return None
+    return transaction_simulator.pair_override(
+        opportunity.pair_contract, token0.address, token1.address, reserve0, reserve1
+    )
 
 
-def set_sell_dex_token_order(sell_dex, buy_dex):
-    if sell_dex.src_token.symbol == buy_dex.loan_token.symbol:
-        src_token = sell_dex.dest_token
-        dest_token = sell_dex.src_token
-        src_position = sell_dex.dest_token_position
-        dest_position = sell_dex.src_token_position
-        sell_dex.src_token = src_token
-        sell_dex.dest_token = dest_token
-        sell_dex.src_token_position = src_position
-        sell_dex.dest_token_position = dest_position
+async def build_v2_swap(opportunity, transaction):
+    with metrics.span("local_simulation"):
+        backrun = await simulate_backrun(opportunity)
+    if backrun is None or backrun.profit <= opportunity.loan_token.profit:
+        log.debug("No backrun clears the profit threshold locally")
+        metrics.reject("no_local_profit")
+        return
+    log.info(
+        f"Simulated backrun: buy on {backrun.buy_pool.dex_name}, sell on "
+        f"{backrun.sell_pool.dex_name}, profit {backrun.profit}"
+    )
+    state_override = victim_override(opportunity)
+    if state_override is None:
+        return
+    loan_amounts = sorted(
+        {int(backrun.amount_in * fraction) for fraction in simulation_loan_fractions}
+    )
+    candidates = [
+        candidate
+        for candidate in await asyncio.gather(
+            *(
+                quote_candidate(opportunity, loan_amount)
+                for loan_amount in loan_amounts
+                if loan_amount > 0
+            )
+        )
+        if candidate is not None
+    ]
+    if not candidates:
+        metrics.reject("no_profitable_quote")
+        return
+    metrics.count("priced")
+    opportunity.gas_price = gas_oracle.bid(transaction.gas_price)
+    if opportunity.gas_price is None:
+        log.info(f"Victim gas price {transaction.gas_price} is outside the bid range")
+        metrics.reject("gas_price_out_of_range")
+        return
+    with metrics.span("eth_simulation"):
+        results = await transaction_simulator.simulate_all(
+            candidates,
+            opportunity.dest_token.address,
+            opportunity.loan_token.address,
+            state_override,
+        )
+    for result in results:
+        log.info(
+            f"Simulated loan {result.candidate.loan_amount}: success {result.success}, "
+            f"profit {result.profit}, gas {result.gas_used}, error {result.error}"
+        )
+    best = TransactionSimulator.best(results, opportunity.loan_token.profit)
+    if best is None:
+        log.info("No candidate simulated profitably")
+        metrics.reject("simulation_unprofitable")
+        return
+    metrics.count("profitable")
+    opportunity.loan_amount = best.candidate.loan_amount
+    opportunity.calldata = best.candidate.calldata1
+    opportunity.calldata2 = best.candidate.calldata2
+    opportunity.gas_used = best.gas_used
+    log.success(f"Arbitrage found, simulated profit {best.profit}")
+    await execute_transaction(opportunity, transaction, 1)
+
+
+def set_sell_dex_token_order(sell_opportunity, buy_opportunity):
+    if sell_opportunity.src_token.symbol == buy_opportunity.loan_token.symbol:
+        src_token = sell_opportunity.dest_token
+        dest_token = sell_opportunity.src_token
+        src_position = sell_opportunity.dest_token_position
+        dest_position = sell_opportunity.src_token_position
+        sell_opportunity.src_token = src_token
+        sell_opportunity.dest_token = dest_token
+        sell_opportunity.src_token_position = src_position
+        sell_opportunity.dest_token_position = dest_position
 
 
 async def processTransaction(transaction):
-    checks_passed, decoded_transaction, dex = await initial_checks(transaction)
+    checks_passed, decoded_transaction, opportunity = await initial_checks(
+        transaction
+    )
     if checks_passed:
-        dest_token = next(
-            (
-                token
-                for token in base_tokens
-                if token.address.lower() == dex.dest_token.address.lower()
-            ),
-            None,
-        )
-        if dest_token is not None:
-            dex.dest_token = dest_token
-            dex.loan_token = dest_token
-            if dex.quoter is not None:
-                pass
-            else:
-                pass
+        # Every pool of the path the victim moves is a backrun of its own
+        if decoded_transaction.fees is not None:
+            opportunities = await simulate_victim_v3(
+                opportunity.dex, decoded_transaction
+            )
         else:
-            if dex.quoter is not None:
-                pass
-            else:
-                dex.loan_token = next(
-                    (
-                        token
-                        for token in base_tokens
-                        if token.address == dex.src_token.address
-                    ),
-                    None,
-                )
-                await build_v2_swap(dex, decoded_transaction)
+            opportunities = await simulate_victim(opportunity.dex, decoded_transaction)
+        await asyncio.gather(
+            *(
+                build_v2_swap(opportunity, decoded_transaction)
+                for opportunity in opportunities
+            )
+        )
 
 
 async def handle_transaction(transaction):
     # Handle the received transaction data here
-    log.debug(f"Received transaction: {transaction}")
+    log.debug(f"Received transaction: {transaction['hash'].hex()}")
     await processTransaction(transaction)
 
 
-async def log_loop(event_filter, poll_interval):
-    while True:
-        for transaction in event_filter.get_new_entries():
-            await handle_transaction(transaction)
-        await asyncio.sleep(poll_interval)
-
-
-async def listen_to_transactions():
-    transaction_filter = w3.eth.filter("pending")
+def report_first_transaction():
+    global boot_started_at
+    seconds = time.perf_counter() - boot_started_at
+    boot_started_at = None
+    metrics.startup_time("first_transaction", seconds)
+    log.info(f"First transaction processed {seconds:.2f}s after start")
 
-    log.info("Listening for new transactions...")
 
+async def worker(queue):
     while True:
+        transaction = await queue.get()
+        metrics.observe("queue", time.perf_counter() - transaction["received_at"])
         try:
-            await asyncio.gather(
-                log_loop(transaction_filter, 0)
-            )  # Run log_loop asynchronously
+            with metrics.span("pipeline"):
+                await handle_transaction(transaction)
         except Exception as e:
-            log.error("Error in listen_to_transactions: {}".format(e))
+            log.error("Error in worker: {}".format(e))
             traceback.print_exc()
+        finally:
+            queue.task_done()
+            if boot_started_at is not None:
+                report_first_transaction()
+
+
+def enqueue_transaction(queue, transaction):
+    if recorder is not None:
+        recorder.record_transaction(transaction)
+    gas_oracle.observe_pending(transaction["gasPrice"])
+    transaction["received_at"] = time.perf_counter()
+    # Under a mempool burst keep the freshest transactions, a victim that has
+    # waited behind a full queue is usually mined before we get to it.
+    if queue.full():
+        queue.get_nowait()
+        queue.task_done()
+        metrics.reject("queue_full")
+        log.debug("Transaction queue full, dropping the oldest entry")
+    queue.put_nowait(transaction)
+
+
+async def listen_to_transactions():
+    queue = asyncio.Queue(maxsize=queue_depth)
+    tasks = [asyncio.create_task(worker(queue)) for _ in range(worker_count)]
+    tasks.append(asyncio.create_task(fetcher.reserve_store.run()))
+    tasks.append(asyncio.create_task(fetcher.v3_pools.run()))
+    tasks.append(asyncio.create_task(gas_oracle.run()))
+    tasks.append(asyncio.create_task(receipt_tracker.run()))
+    if metrics_port is not None:
+        await metrics.serve(port=metrics_port)
+        log.info(f"Metrics served on http://127.0.0.1:{metrics_port}/metrics")
+
+    log.info(f"Listening for new transactions with {worker_count} workers...")
+
+    # The stream reconnects on its own, transactions arrive with full bodies
+    await mempool_stream.run(
+        lambda transaction: enqueue_transaction(queue, transaction)
+    )
 
 
 class Type:
@@ -467,31 +784,52 @@ class Type:
     POOL = "pool"
     ROUTER = "router"
     QUOTER = "quoter"
+    POOL_DEPLOYER = "pool_deployer"
+    UNIVERSAL_ROUTER = "universal_router"
+    V2_DEX = "v2_dex"
+    V3_DEX = "v3_dex"
+    INIT_CODE_HASH = "init_code_hash"
 
 
 class Networks:
     BSC = 56
 
 
-def main():
-    global uni_router, dexs, routers, w3, fetcher, base_tokens, tokens, dex_config, biswap, arbitrage_address, arbitrage_abi, private_key, flashloan_address, account, gas_limit, max_gas_price, aggregator
-    config_filename = "config/bot_config.json"
-    dex_config_filename = "config/dex_config.json"
-    config = load_file(config_filename)
-    dex_config = load_file(dex_config_filename)
-    log.remove()
-    log.add(sys.stdout, level=config["log_level"])
-    log.opt(colors=True)
+def setup(config, dex_configuration, web3, network_ws):
+    global uni_router, dexs, routers, w3, fetcher, base_tokens, token_registry, dex_config, biswap, arbitrage_address, arbitrage_abi, private_key, flashloan_address, account, gas_limit, max_gas_price, aggregator, worker_count, queue_depth, mempool_stream, aggregators, aggregator_deadline, nonce_manager, gas_oracle, receipt_tracker, broadcaster, node, arbitrage_transactions, transaction_simulator, simulation_loan_fractions, simulation_gas_headroom, metrics_port, swap_decoder
+    w3 = web3
+    dex_config = dex_configuration
+    base_tokens = []
+    token_registry = TokenRegistry()
+    dexs = []
     mode = config["mode"]
     gas_limit = config["gas_limit"]
     max_gas_price = config["max_gas_price"]
+    worker_count = config["workers"]
+    queue_depth = config["queue_depth"]
+    aggregators = config["aggregators"]
+    aggregator_deadline = config["aggregator_deadline"]
+    simulation_loan_fractions = config["simulation_loan_fractions"]
+    simulation_gas_headroom = config["simulation_gas_headroom"]
+    metrics_port = config.get("metrics_port")
     slippage = config["slippage"]
     arbitrage_address = config["arbitrage_address"]
     arbitrage_abi = load_file(config["arbitrage_abi_filename"])
-    network_ws = config["testnet_ws"] if mode == "test" else config["mainnet_ws"]
-    w3 = connect_to_network(network_ws)
+    gas_oracle = GasOracle(
+        network_ws,
+        log,
+        max_gas_price,
+        config["min_gas_price"],
+        config["gas_floor_percentile"],
+        config["gas_history_blocks"],
+    )
+    mempool_stream = MempoolStream(
+        network_ws,
+        log,
+        config["mempool_batch_size"],
+        config["mempool_batch_interval"],
+    )
     flashloan_address = w3.to_checksum_address(config["flashloan_address"])
-    flashloan_abi = load_file(config["flashloan_abi_filename"])
     aggregator = w3.to_checksum_address(config["aggregator"])
     private_key = (
         config["test_private_key"]
@@ -499,13 +837,48 @@ def main():
         else config["production_private_key"]
     )
     account = Account.from_key(private_key)
+    nonce_manager = NonceManager(w3, account.address, log)
+    nonce_manager.sync()
+    node = NodeClient(
+        config.get("node_http_url") or network_ws, log, config.get("node_limit")
+    )
+    broadcaster = Broadcaster(
+        config.get("node_http_url") or network_ws,
+        log,
+        config.get("broadcast_endpoints", []),
+        metrics=metrics,
+    )
+    receipt_tracker = ReceiptTracker(
+        node, log, nonce_manager, metrics=metrics, broadcaster=broadcaster
+    )
+    gas_oracle.head_listeners.append(receipt_tracker.new_head)
+    arbitrage_transactions = FlashArbitrageTransactions(
+        w3.to_checksum_address(arbitrage_address),
+        flashloan_address,
+        private_key,
+        w3.eth.chain_id,
+        gas_limit,
+    )
+    transaction_simulator = TransactionSimulator(
+        node,
+        log,
+        arbitrage_transactions.encoder,
+        account.address,
+        arbitrage_address,
+        config["arbitrage_owner_slot"],
+    )
 
-    fetcher = ContractFetcher(config, log, w3)
-    tokens = get_token_list(config["token_filename"])
+    fetcher = ContractFetcher(
+        config, log, w3, FeeTable(dex_config), metrics, network_ws, node
+    )
+    # Aggregator quotes are reused until the next block
+    gas_oracle.head_listeners.append(fetcher.quote_cache.new_head)
+    if recorder is not None:
+        fetcher.http.recorder = recorder
+        fetcher.reserve_store.recorder = recorder
+        node.recorder = recorder
     loan_tokens = get_token_list(config["loan_token_filename"])
 
-    flashloan_contract = w3.eth.contract(address=flashloan_address, abi=flashloan_abi)
-
     base_token_list = loan_tokens.keys()
     for token_name in base_token_list:
         token_info = loan_tokens.get(token_name)
@@ -515,27 +888,87 @@ def main():
             token_info["vault"],
             int(token_info["profit"] * (10**18)),
         )
-        fetcher.get_token_abi(token)
-        token.max_loan_amount = int(
-            flashloan_contract.functions.maxFlashLoan(token.address).call()
-        )
         base_tokens.append(token)
+        token_registry.add(token)
+    token_registry.add_token_list(get_token_list(config["token_filename"]))
 
     dex_list = dex_config.keys()
+    enabled = []
     for dex_name in dex_list:
         dex = Dex(dex_name, dex_config.get(dex_name))
         if dex.enabled:
-            fetcher.get_abi(dex)
-            fetcher.get_router_abi(dex)
-            # fetcher.get_pair_contract_and_abi(dex, base_tokens[0], base_tokens[1])
-            # fetcher.get_initial_token_order(base_tokens[1], dex)
-            if dex.quoter is not None:
-                fetcher.get_abi(dex, Type.QUOTER)
             if dex.name == "BiSwapV2":
                 biswap = dex
-            dexs.append(dex)
+            enabled.append(dex)
+            # A Universal Router only routes, its swaps price the pools of
+            # the DEXes it names
+            if not dex.universal_router:
+                dexs.append(dex)
+    enabled_dexs = {dex.name: dex for dex in dexs}
+    swap_decoder = SwapDecoder()
+    routed = {}
+    for dex in enabled:
+        if dex.universal_router:
+            # V2 legs trade on the pairs of v2_dex, V3 legs on the pools of v3_dex
+            added = swap_decoder.add_universal_router(
+                dex.router, enabled_dexs.get(dex.v2_dex), enabled_dexs.get(dex.v3_dex)
+            )
+        elif dex.quoter is not None:
+            added = swap_decoder.add_v3_router(dex.router, dex)
+        else:
+            added = swap_decoder.add_router(dex.router, dex)
+        if added:
+            routed[dex.router] = dex
+        else:
+            log.warning(
+                f"{dex.name} shares router {dex.router} with {routed[dex.router].name}, "
+                f"its victims are decoded as {routed[dex.router].name}"
+            )
+
+
+async def load_startup_data(config):
+    try:
+        boot_seconds = await BootLoader(config, log, fetcher).load(
+            base_tokens, dexs, flashloan_address
+        )
+        # Every token a backrun pair can hold, so no victim waits on a probe
+        await transaction_simulator.load_balance_slots(
+            token.address for token in token_registry.tokens.values()
+        )
+    finally:
+        # Its session belongs to this loop, the next request opens a new one
+        await node.close()
+    metrics.startup_time("boot", boot_seconds)
+
+
+def boot(config):
+    asyncio.run(load_startup_data(config))
+
 
-    asyncio.run(listen_to_transactions())
+def main():
+    global recorder, boot_started_at
+    boot_started_at = time.perf_counter()
+    config_filename = "config/bot_config.json"
+    dex_config_filename = "config/dex_config.json"
+    config = load_file(config_filename)
+    log.remove()
+    log.add(sys.stdout, level=config["log_level"])
+    log.opt(colors=True)
+    network_ws = (
+        config["testnet_ws"] if config["mode"] == "test" else config["mainnet_ws"]
+    )
+    web3 = connect_to_network(network_ws)
+    if config.get("record_filename"):
+        # Everything the bot reads from here on can be replayed offline
+        recorder = Recorder(config["record_filename"])
+        web3.middleware_onion.inject(recorder.middleware, layer=0)
+    setup(config, load_file(dex_config_filename), web3, network_ws)
+    boot(config)
+    try:
+        asyncio.run(listen_to_transactions())
+    finally:
+        if recorder is not None:
+            recorder.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import aiohttp
+from scripts.http_client import HttpClient, HTTPStatusError
+from scripts.multicall import max_flash_loan_call
+
+BOOT_SNAPSHOT_VERSION = 1
+BOOT_SNAPSHOT_FILENAME = "data/boot_snapshot.json"
+BSCSCAN = "bscscan"
+# The free BscScan tier allows 5 calls a second
+BSCSCAN_LIMIT = {"timeout": 10.0, "rate": 5, "burst": 5}
+
+
+def abi_targets(tokens, dexs):
+    # (ABI filename, object, attribute, contract address) for every ABI the bot
+    # needs, with the filenames ContractFetcher has always used
+    targets = [
+        (f"abi/{token.address}_abi.json", token, "abi", token.address)
+        for token in tokens
+    ]
+    for dex in dexs:
+        targets.append(
+            (f"abi/{dex.name}_factory_abi.json", dex, "factory_abi", dex.factory)
+        )
+        targets.append(
+            (f"abi/{dex.name}_router_abi.json", dex, "router_abi", dex.router)
+        )
+        if dex.quoter is not None:
+            targets.append(
+                (f"abi/{dex.name}_quoter_abi.json", dex, "quoter_abi", dex.quoter)
+            )
+        # Every pair of a fork shares one ABI. It ships with the repo, there is
+        # no pair address to ask BscScan about before the first victim.
+        pair_abi_filename = f"abi/{dex.name}_pair_abi.json"
+        if dex.quoter is None and os.path.exists(pair_abi_filename):
+            targets.append((pair_abi_filename, dex, "pair_abi", None))
+    return targets
+
+
+def fingerprint(targets):
+    # Changes whenever a contract is added, removed or moved to a new address
+    contracts = sorted((filename, address) for filename, _, _, address in targets)
+    return hashlib.sha256(
+        json.dumps([BOOT_SNAPSHOT_VERSION, contracts]).encode()
+    ).hexdigest()
+
+
+class BootLoader:
+    # Loads everything setup needs before the first transaction: ABIs, init
+    # code hashes and flash loan limits. Missing ABIs are fetched from BscScan
+    # concurrently under its rate limit while the flash loan limits are read,
+    # and the result is kept in a snapshot so the next start reads one file.
+    def __init__(self, config, log, fetcher):
+        self.config = config
+        self.log = log
+        self.fetcher = fetcher
+        self.snapshot_filename = config.get(
+            "boot_snapshot_filename", BOOT_SNAPSHOT_FILENAME
+        )
+        self.http = HttpClient(
+            log, {BSCSCAN: config.get("bscscan_limit", BSCSCAN_LIMIT)}
+        )
+        self.fetched = 0
+
+    def read_snapshot(self, key):
+        if not self.snapshot_filename or not os.path.exists(self.snapshot_filename):
+            return None
+        try:
+            with open(self.snapshot_filename, "r") as json_file:
+                snapshot = json.load(json_file)
+        except (OSError, ValueError) as e:
+            self.log.warning(f"Ignoring unreadable boot snapshot: {e}")
+            return None
+        if (
+            snapshot.get("version") != BOOT_SNAPSHOT_VERSION
+            or snapshot.get("fingerprint") != key
+        ):
+            self.log.info("Boot snapshot is out of date, rebuilding it")
+            return None
+        return snapshot
+
+    def write_snapshot(self, key, abis, init_code_hashes):
+        directory = os.path.dirname(self.snapshot_filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Written aside and renamed, so a crash never leaves half a snapshot
+        temporary_filename = f"{self.snapshot_filename}.tmp"
+        with open(temporary_filename, "w") as json_file:
+            json.dump(
+                {
+                    "version": BOOT_SNAPSHOT_VERSION,
+                    "fingerprint": key,
+                    "abis": abis,
+                    "init_code_hashes": init_code_hashes,
+                },
+                json_file,
+            )
+        os.replace(temporary_filename, self.snapshot_filename)
+
+    async def fetch_contract_abi(self, contract_address):
+        api_key = self.config["bsc_api_key"]
+        api_base_url = self.config["bsc_mainnet_api_url"]
+        self.fetched += 1
+        try:
+            abi_data = await self.http.get(
+                BSCSCAN, f"{api_base_url}{contract_address}&apikey={api_key}"
+            )
+        except (HTTPStatusError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.log.debug(f"BscScan request for {contract_address} failed: {e}")
+            return None
+        if abi_data.get("status") == "1":
+            return abi_data["result"]
+        return None
+
+    async def load_abi(self, filename, contract_address):
+        if os.path.exists(filename):
+            with open(filename, "r") as json_file:
+                return json.load(json_file)
+        abi = await self.fetch_contract_abi(contract_address)
+        if abi:
+            self.fetcher.save_content_to_json(filename, abi)
+            return abi
+        self.log.debug(
+            f"Failed to fetch ABI for {contract_address}. Check if the contract source code is verified."
+        )
+        return None
+
+    async def load(self, tokens, dexs, flashloan_address):
+        started_at = time.perf_counter()
+        targets = abi_targets(tokens, dexs)
+        key = fingerprint(targets)
+        snapshot = self.read_snapshot(key)
+        # Read through the multicall window on the loop thread, the websocket
+        # provider is not safe to share with worker threads
+        max_loan_amounts = self.fetcher.multicall.gather(
+            [max_flash_loan_call(flashloan_address, token.address) for token in tokens]
+        )
+        if snapshot is not None:
+            abis = snapshot["abis"]
+            init_code_hashes = snapshot["init_code_hashes"]
+            max_loan_amounts = await max_loan_amounts
+        else:
+            try:
+                max_loan_amounts, *loaded = await asyncio.gather(
+                    max_loan_amounts,
+                    *[
+                        self.load_abi(filename, address)
+                        for filename, _, _, address in targets
+                    ],
+                )
+            finally:
+                await self.http.close()
+            abis = {
+                target[0]: abi for target, abi in zip(targets, loaded) if abi
+            }
+            init_code_hashes = {}
+
+        for token, max_loan_amount in zip(tokens, max_loan_amounts):
+            if max_loan_amount is None:
+                # Nothing can be borrowed until the next start
+                self.log.warning(f"No flash loan limit for {token.symbol}, skipping it")
+                token.max_loan_amount = 0
+                continue
+            token.max_loan_amount = int(max_loan_amount[0])
+        for filename, entity, attribute, _ in targets:
+            setattr(entity, attribute, abis.get(filename))
+
+        pair_dexs = [dex for dex in dexs if dex.quoter is None]
+        for dex in pair_dexs:
+            if dex.init_code_hash is None:
+                dex.init_code_hash = init_code_hashes.get(dex.name)
+        # Factories without an init code hash in the config are asked for it
+        for dex in pair_dexs:
+            self.fetcher.register_pair_factory(dex)
+
+        # V3 pools are derived from the pool deployer, nothing to ask the chain
+        for dex in dexs:
+            if dex.quoter is not None:
+                self.fetcher.register_pool_deployer(dex)
+
+        source = "snapshot"
+        if snapshot is None:
+            source = f"{self.fetched} ABIs fetched"
+            if not self.snapshot_filename:
+                self.log.debug("Boot snapshot disabled")
+            elif len(abis) == len(targets):
+                self.write_snapshot(
+                    key,
+                    abis,
+                    {
+                        dex.name: dex.init_code_hash
+                        for dex in pair_dexs
+                        if dex.init_code_hash is not None
+                    },
+                )
+            else:
+                self.log.warning(
+                    "Boot snapshot not written, some ABIs could not be loaded"
+                )
+        seconds = time.perf_counter() - started_at
+        self.log.info(f"Startup data loaded in {seconds:.2f}s ({source})")
+        return seconds
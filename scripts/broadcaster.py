@@ -0,0 +1,168 @@
+import asyncio
+import time
+from eth_utils import keccak
+from hexbytes import HexBytes
+from scripts.http_client import HttpClient
+from scripts.node_client import NODE, http_url
+from scripts.receipt_tracker import DROPPED
+
+# Per-endpoint request timeout (seconds) and token bucket, overridable on each
+# entry of "broadcast_endpoints"
+DEFAULT_LIMIT = {"timeout": 2.0, "rate": 50, "burst": 50}
+# A relay that could not be reached this many times in a row is left out of
+# the broadcasts for FAILURE_COOLDOWN seconds, then tried again
+MAX_FAILURES = 3
+FAILURE_COOLDOWN = 30.0
+# A node that already has the transaction got it from someone, so it counts
+ACCEPTED_ERRORS = ("already known", "known transaction")
+
+
+class BroadcastError(Exception):
+    def __init__(self, errors):
+        super().__init__(
+            "No endpoint accepted the transaction: "
+            + ", ".join(f"{name}: {error}" for name, error in errors.items())
+        )
+        self.errors = errors
+
+
+class Endpoint:
+    # An RPC node or private relay taking eth_sendRawTransaction
+    def __init__(self, name, url, method="eth_sendRawTransaction", headers=None):
+        self.name = name
+        self.url = url
+        self.method = method
+        self.headers = headers
+        # Sends in a row that never got an answer
+        self.failures = 0
+        self.skipped_until = 0.0
+
+    def available(self, now):
+        return now >= self.skipped_until
+
+    def fail(self, now):
+        self.failures += 1
+        if self.failures >= MAX_FAILURES:
+            self.skipped_until = now + FAILURE_COOLDOWN
+
+
+class Broadcaster:
+    # Sends each signed transaction to the node and every configured endpoint
+    # at once over HTTP, and returns on the first acceptance. The slower
+    # endpoints finish in the background so their latency and errors are
+    # still recorded, and a relay that keeps timing out sits the next
+    # broadcasts out. Nothing goes through the node's websocket provider,
+    # which cannot take requests from several tasks at once.
+    def __init__(self, node_url, log, endpoints=(), metrics=None):
+        self.log = log
+        self.metrics = metrics
+        self.endpoints = [Endpoint(NODE, http_url(node_url))]
+        limits = {NODE: DEFAULT_LIMIT}
+        for endpoint in endpoints:
+            self.endpoints.append(
+                Endpoint(
+                    endpoint["name"],
+                    endpoint["url"],
+                    endpoint.get("method", "eth_sendRawTransaction"),
+                    endpoint.get("headers"),
+                )
+            )
+            limits[endpoint["name"]] = {
+                key: endpoint.get(key, value) for key, value in DEFAULT_LIMIT.items()
+            }
+        self.http = HttpClient(log, limits)
+        # Transaction hash -> endpoints that accepted it
+        self.accepted_by = {}
+        self.tasks = set()
+
+    async def send_to(self, endpoint, raw_transaction):
+        response = await self.http.post(
+            endpoint.name,
+            endpoint.url,
+            json={
+                "jsonrpc": "2.0",
+                "id": 1,
+                "method": endpoint.method,
+                "params": [HexBytes(raw_transaction).hex()],
+            },
+            headers=endpoint.headers,
+        )
+        error = response.get("error")
+        if error is not None:
+            raise ValueError(error.get("message", str(error)))
+        return response.get("result")
+
+    async def send(self, endpoint, transaction_hash, raw_transaction):
+        # None once the endpoint accepted the transaction, else why not
+        started_at = time.perf_counter()
+        try:
+            await self.send_to(endpoint, raw_transaction)
+        except ValueError as e:
+            # The endpoint answered, the transaction is what it turned down
+            endpoint.failures = 0
+            error = str(e)
+            if not any(accepted in error for accepted in ACCEPTED_ERRORS):
+                self.log.debug(f"Broadcast to {endpoint.name} failed: {error}")
+                return error
+        except Exception as e:
+            endpoint.fail(time.perf_counter())
+            error = str(e) or type(e).__name__
+            self.log.debug(f"Broadcast to {endpoint.name} failed: {error}")
+            return error
+        else:
+            endpoint.failures = 0
+        seconds = time.perf_counter() - started_at
+        if self.metrics is not None:
+            self.metrics.observe(f"accepted_by_{endpoint.name}", seconds)
+        # Acceptances after the outcome was recorded have nothing to add to
+        accepted_by = self.accepted_by.get(transaction_hash)
+        if accepted_by is not None:
+            accepted_by.append(endpoint)
+        return None
+
+    async def broadcast(self, raw_transaction):
+        # Returns (transaction hash, name of the first endpoint to accept it),
+        # or raises BroadcastError when every endpoint turned it down
+        transaction_hash = HexBytes(keccak(raw_transaction))
+        self.accepted_by.setdefault(transaction_hash, [])
+        now = time.perf_counter()
+        # The node is always sent to, so there is someone to try
+        tasks = {
+            asyncio.create_task(
+                self.send(endpoint, transaction_hash, raw_transaction)
+            ): endpoint
+            for endpoint in self.endpoints
+            if endpoint.name == NODE or endpoint.available(now)
+        }
+        errors = {}
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                error = task.result()
+                if error is not None:
+                    errors[tasks[task].name] = error
+                    continue
+                # Kept referenced until they finish, they only update the stats
+                self.tasks.update(pending)
+                for other in pending:
+                    other.add_done_callback(self.tasks.discard)
+                return transaction_hash, tasks[task].name
+        if not self.accepted_by[transaction_hash]:
+            # Never tracked, so no outcome will come for it
+            del self.accepted_by[transaction_hash]
+        raise BroadcastError(errors)
+
+    def record_outcome(self, transaction_hash, result):
+        # Mined or reverted both mean the endpoints got it into a block
+        accepted_by = self.accepted_by.pop(transaction_hash, ())
+        if self.metrics is None:
+            return
+        outcome = "missed" if result == DROPPED else "included"
+        for endpoint in accepted_by:
+            self.metrics.count(f"{outcome}_by_{endpoint.name}")
+
+    async def close(self):
+        await self.http.close()
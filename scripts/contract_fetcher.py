@@ -1,195 +1,191 @@
 from curses import flash
+import asyncio
+import aiohttp
 import os
-import requests
 import json
 from web3 import Web3
 from web3.middleware import geth_poa_middleware
 from decimal import Decimal, getcontext
 from fractions import Fraction
-from web3.exceptions import ValidationError
 from hexbytes import HexBytes
+from scripts import amm
+from scripts.reserve_store import ReserveStore
+from scripts.v3_pool_store import V3PoolStore
+from scripts.v3_math import FEE_TIERS
+from scripts.pair_resolver import PairResolver, sort_tokens, to_address_bytes
+from scripts.pair_db import PairDatabase, PAIR_DB_FILENAME
+from scripts.http_client import HttpClient, HTTPStatusError
+from scripts.quote_cache import QuoteCache
+from scripts.multicall import (
+    Call,
+    Multicall,
+    get_pair_call,
+    get_reserves_call,
+    slot0_call,
+)
 
 KYBERSWAP_API_URL = "https://aggregator-api.kyberswap.com/bsc/api/v1"
 PARASWAP_API_URL = "https://apiv5.paraswap.io"
 OPEN_OCEAN_API_URL = "https://open-api.openocean.finance/v3/bsc/swap_quote"
+INIT_CODE_HASH_FUNCTIONS = ["INIT_CODE_PAIR_HASH", "INIT_CODE_HASH", "pairCodeHash"]
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+class SwapQuote:
+    def __init__(self, aggregator, src_amount, dest_amount, route):
+        self.aggregator = aggregator
+        self.src_amount = src_amount
+        self.dest_amount = dest_amount
+        self.route = route
 
 
 class ContractFetcher:
-    def __init__(self, config, log, w3):
+    def __init__(
+        self, config, log, w3, fee_table=None, metrics=None, ws_url=None, node=None
+    ):
         self.config = config
         self.log = log
         self.w3 = w3
+        self.fee_table = fee_table if fee_table is not None else amm.FeeTable({})
+        self.reserve_store = ReserveStore(ws_url, log, node)
+        self.pair_resolver = PairResolver()
+        self.pair_db = PairDatabase(config.get("pair_db_filename", PAIR_DB_FILENAME))
+        # Pairs resolved but not read yet, {pair key: (pair, abi)}. A derived
+        # address may never have been deployed, so it is only stored once its
+        # reserves were read.
+        self.pending_pairs = {}
+        self.multicall = Multicall(w3, log, config.get("multicall_window", 0.002))
+        self.v3_pools = V3PoolStore(
+            ws_url, log, self.multicall, node, config.get("v3_tick_words", 2)
+        )
+        self.http = HttpClient(log, config.get("aggregator_limits"))
+        self.quote_cache = QuoteCache(
+            config.get("quote_cache_size", 1024),
+            config.get("quote_cache_bucket", 0.001),
+            metrics,
+        )
 
-    def get_abi(self, dex, type="factory"):
-        filename = f"abi/{dex.name}_{type}_abi.json"
-        if os.path.exists(filename):
-            with open(filename, "r") as json_file:
-                abi = json.load(json_file)
-                if type == "factory":
-                    dex.factory_abi = abi
-                else:
-                    dex.quoter_abi = abi
+    def register_pair_factory(self, dex):
+        if dex.init_code_hash is None:
+            factory_contract = self.w3.eth.contract(
+                address=dex.factory, abi=dex.factory_abi
+            )
+            for function_name in INIT_CODE_HASH_FUNCTIONS:
+                try:
+                    init_code_hash = factory_contract.get_function_by_name(
+                        function_name
+                    )().call()
+                    dex.init_code_hash = HexBytes(init_code_hash).hex()
+                    break
+                except Exception:
+                    continue
+        if dex.init_code_hash is not None:
+            self.pair_resolver.add_factory(dex.name, dex.factory, dex.init_code_hash)
         else:
-            if type == "factory":
-                abi = self.fetch_contract_abi(dex.factory)
-            else:
-                abi = self.fetch_contract_abi(dex.quoter)
-            if abi:
-                self.save_content_to_json(filename, abi)
-                if type == "factory":
-                    dex.factory_abi = abi
-                else:
-                    dex.quoter_abi = abi
-            else:
-                self.log.debug(
-                    f"Failed to fetch ABI for {dex.name}. Check if the contract source code is verified."
-                )
+            self.log.warning(
+                f"No init code hash for {dex.name}, pair addresses will use getPair"
+            )
 
-    def get_token_abi(self, token):
-        filename = f"abi/{token.address}_abi.json"
-        if os.path.exists(filename):
-            with open(filename, "r") as json_file:
-                abi = json.load(json_file)
-                token.abi = abi
+    def register_pool_deployer(self, dex):
+        # V3 pool addresses are derived like V2 pairs, from the pool deployer
+        if dex.pool_deployer is not None and dex.init_code_hash is not None:
+            self.pair_resolver.add_pool_deployer(
+                dex.name, dex.pool_deployer, dex.init_code_hash
+            )
         else:
-            abi = self.fetch_contract_abi(token.address)
-            if abi:
-                self.save_content_to_json(filename, abi)
-                token.abi = abi
-            else:
-                self.log.debug(
-                    f"Failed to fetch ABI for {token.address}. Check if the contract source code is verified."
-                )
+            self.log.warning(
+                f"No pool deployer for {dex.name}, its pools will not be priced"
+            )
 
-    def get_router_abi(self, dex):
-        filename = f"abi/{dex.name}_router_abi.json"
-        if os.path.exists(filename):
-            with open(filename, "r") as json_file:
-                abi = json.load(json_file)
-                dex.router_abi = abi
+    def get_pair_abi(self, dex):
+        # Every pair of a fork is deployed from the same bytecode, so one ABI
+        # per DEX serves all of its pairs: the one in the pair database, or
+        # the one the boot loader read
+        pair_contract_abi = self.pair_db.get_dex_abi(dex.name)
+        if pair_contract_abi is None:
+            pair_contract_abi = dex.pair_abi
+        return pair_contract_abi
+
+    def load_pair_contract_and_abi(
+        self, opportunity, token1, token2, pair_contract_address=None
+    ):
+        dex = opportunity.dex
+        stored = self.known_pair(dex.name, token1.address, token2.address)
+        if stored is not None:
+            opportunity.pair_contract, opportunity.pair_abi = stored
+            return
+        if pair_contract_address is None and dex.quoter is None:
+            resolved = self.pair_resolver.resolve(
+                dex.name, token1.address, token2.address
+            )
+            if resolved is not None:
+                pair_contract_address = resolved[0]
+        if pair_contract_address is None:
+            # V3 pools are priced from the V3 pool store, and forks without an
+            # init code hash had their getPair batched by the caller
+            self.log.warning(
+                f"Error feteching pair address {dex.name}-{token1.address}-{token2.address}"
+            )
+            return
+        pair_contract_abi = self.get_pair_abi(dex)
+
+        if pair_contract_abi:
+            self.pending_pairs[
+                PairDatabase.pair_key(dex.name, token1.address, token2.address)
+            ] = (pair_contract_address, pair_contract_abi)
+            opportunity.pair_contract = pair_contract_address
+            opportunity.pair_abi = pair_contract_abi
         else:
-            abi = self.fetch_contract_abi(dex.router)
-            if abi:
-                self.save_content_to_json(filename, abi)
-                dex.router_abi = abi
-            else:
-                self.log.debug(
-                    f"Failed to fetch ABI for {dex.name}. Check if the contract source code is verified."
-                )
+            self.log.error(
+                f"No pair ABI for {dex.name}, add abi/{dex.name}_pair_abi.json"
+            )
 
-    def fetch_contract_abi(self, contract_address):
-        api_key = self.config["bsc_api_key"]
-        api_base_url = self.config["bsc_mainnet_api_url"]
-        api_url = f"{api_base_url}{contract_address}&apikey={api_key}"
-        response = requests.get(api_url)
-        # print(f"ABI API Response: {response.text}")
-        if response.status_code == 200:
-            abi_data = response.json()
-            if abi_data["status"] == "1":
-                return abi_data["result"]
-
-        return None
-
-    async def get_pair_contract_and_abi_async(self, dex, token1, token2):
-        pair_contract_abi = None
-        pair_contract_address = None
-        pair_abi_filename = (
-            f"abi/{dex.name}_{token1.address}-{token2.address}_abi.json"
-        )
-        pair_contract_filename = f"contract/{dex.name}_{token1.address}-{token2.address}_contract.json"
-        if os.path.exists(pair_abi_filename) and os.path.exists(pair_contract_filename):
-            # print(
-            #     f"ABI file already exists for {pair_name} in {environment} environment. Skipping..."
-            # )
-            with open(pair_abi_filename, "r") as pair_abi_file:
-                pair_contract_abi = json.load(pair_abi_file)
-            with open(pair_contract_filename, "r") as pair_contract_file:
-                pair_contract_address = json.load(pair_contract_file)
-                dex.pair_contract = pair_contract_address
-                dex.pair_abi = pair_contract_abi
-        else:
-            factory_contract = self.w3.eth.contract(
-                address=dex.factory, abi=dex.factory_abi
+    def known_pair(self, dex_name, token_a, token_b):
+        # (pair, abi) from the pair database or resolved since boot
+        stored = self.pair_db.get_pair(dex_name, token_a, token_b)
+        if stored is None:
+            stored = self.pending_pairs.get(
+                PairDatabase.pair_key(dex_name, token_a, token_b)
             )
-            if dex.quoter is not None:
-                pair_contract_address = factory_contract.functions.getPool(
-                    token1.address, token2.address, 500
-                ).call()
-            else:
-                try:
-                    pair_contract_address = factory_contract.functions.getPair(
-                        token1.address, token2.address
-                    ).call()
-                except Exception as e:
-                    self.log.warning(
-                        f"Error feteching pair address {dex.name}-{token1.address}-{token2.address}"
-                    )
-                    return
-            self.log.warning(pair_contract_address)
-            # Fetch the ABI for the pair contract
-            pair_contract_abi = self.fetch_contract_abi(pair_contract_address)
-
-            # Save pair contract ABI to JSON file
-            if pair_contract_abi and pair_contract_address:
-                self.save_content_to_json(pair_abi_filename, pair_contract_abi)
-                self.save_content_to_json(pair_contract_filename, pair_contract_address)
-                dex.pair_contract = pair_contract_address
-                dex.pair_abi = pair_contract_abi
-            else:
-                self.log.error(
-                    f"Failed to fetch ABI for {token1.address}-{token2.address}. Check if the contract source code is verified."
-                )
+        return stored
 
-    def get_pair_contract_and_abi(self, dex, token1, token2):
-        pair_contract_abi = None
-        pair_contract_address = None
-        dex.src_token = token1
-        dex.dest_token = token2
-        pair_abi_filename = (
-            f"abi/{dex.name}_{token1.address}-{token2.address}_abi.json"
+    def confirm_pair(self, dex_name, token_a, token_b):
+        # The pair answered a reserves read, keep it for the next boot
+        pending = self.pending_pairs.pop(
+            PairDatabase.pair_key(dex_name, token_a, token_b), None
         )
-        pair_contract_filename = f"contract/{dex.name}_{token1.address}-{token2.address}_contract.json"
-        if os.path.exists(pair_abi_filename) and os.path.exists(pair_contract_filename):
-            # print(
-            #     f"ABI file already exists for {pair_name} in {environment} environment. Skipping..."
-            # )
-            with open(pair_abi_filename, "r") as pair_abi_file:
-                pair_contract_abi = json.load(pair_abi_file)
-            with open(pair_contract_filename, "r") as pair_contract_file:
-                pair_contract_address = json.load(pair_contract_file)
-                dex.pair_contract = pair_contract_address
-                dex.pair_abi = pair_contract_abi
-        else:
-            factory_contract = self.w3.eth.contract(
-                address=dex.factory, abi=dex.factory_abi
-            )
-            if dex.quoter is not None:
-                pair_contract_address = factory_contract.functions.getPool(
-                    token1.address, token2.address, 500
-                ).call()
-            else:
-                try:
-                    pair_contract_address = factory_contract.functions.getPair(
-                        token1.address, token2.address
-                    ).call()
-                except Exception as e:
-                    self.log.warning(
-                        f"Error feteching pair address {dex.name}-{token1.address}-{token2.address}"
-                    )
-                    return
-            # Fetch the ABI for the pair contract
-            pair_contract_abi = self.fetch_contract_abi(pair_contract_address)
-
-            # Save pair contract ABI to JSON file
-            if pair_contract_abi and pair_contract_address:
-                self.save_content_to_json(pair_abi_filename, pair_contract_abi)
-                self.save_content_to_json(pair_contract_filename, pair_contract_address)
-                dex.pair_contract = pair_contract_address
-                dex.pair_abi = pair_contract_abi
-            else:
-                self.log.error(
-                    f"Failed to fetch ABI for {token1.address}-{token2.address}. Check if the contract source code is verified."
+        if pending is not None:
+            self.pair_db.add_pair(dex_name, token_a, token_b, *pending)
+
+    async def get_pair_contract_and_abi_async(self, opportunity, token1, token2):
+        dex = opportunity.dex
+        pair_contract_address = None
+        if (
+            dex.quoter is None
+            and not self.pair_resolver.has_factory(dex.name)
+            and self.known_pair(dex.name, token1.address, token2.address) is None
+        ):
+            # No init code hash for this fork, batch the getPair with other reads
+            try:
+                result = await self.multicall.call(
+                    get_pair_call(dex.factory, token1.address, token2.address)
                 )
+            except Exception:
+                result = None
+            if result is None or result[0] == ZERO_ADDRESS:
+                self.log.warning(
+                    f"Error feteching pair address {dex.name}-{token1.address}-{token2.address}"
+                )
+                return
+            pair_contract_address = Web3.to_checksum_address(result[0])
+        self.load_pair_contract_and_abi(
+            opportunity, token1, token2, pair_contract_address
+        )
+
+    def get_pair_contract_and_abi(self, opportunity, token1, token2):
+        opportunity.src_token = token1
+        opportunity.dest_token = token2
+        self.load_pair_contract_and_abi(opportunity, token1, token2)
 
     def save_content_to_json(self, filename, content):
         with open(f"{filename}", "w") as json_file:
@@ -219,105 +215,216 @@ class ContractFetcher:
             # )
             return None
 
-    def get_initial_token_order(self, token2, dex):
-        pair_contract = self.w3.eth.contract(
-            address=dex.pair_contract, abi=dex.pair_abi
-        )
-        token0 = pair_contract.functions.token0().call()
-        if token0 == token2.address:
-            dex.src_token_position = 1
-            dex.dest_token_position = 0
+    def get_initial_token_order(self, token2, opportunity):
+        token0, _ = sort_tokens(opportunity.src_token.address, token2.address)
+        if token0 == to_address_bytes(token2.address):
+            opportunity.src_token_position = 1
+            opportunity.dest_token_position = 0
         else:
-            dex.src_token_position = 0
-            dex.dest_token_position = 1
-
-    async def get_token_order(self, token2, dex):
-        pair_contract = self.w3.eth.contract(
-            address=dex.pair_contract, abi=dex.pair_abi
-        )
-        token0 = pair_contract.functions.token0().call()
-        if token0 == token2.address:
-            dex.src_token_position = 1
-            dex.dest_token_position = 0
+            opportunity.src_token_position = 0
+            opportunity.dest_token_position = 1
+
+    async def get_token_order(self, token2, opportunity):
+        token0, _ = sort_tokens(opportunity.src_token.address, token2.address)
+        if token0 == to_address_bytes(token2.address):
+            opportunity.src_token_position = 1
+            opportunity.dest_token_position = 0
         else:
-            dex.src_token_position = 0
-            dex.dest_token_position = 1
+            opportunity.src_token_position = 0
+            opportunity.dest_token_position = 1
 
-    async def get_reserves(self, dex):
-        pair_contract = self.w3.eth.contract(
-            address=dex.pair_contract, abi=dex.pair_abi
-        )
-        if dex.quoter is not None:
-            src_token_contract = self.w3.eth.contract(
-                address=dex.src_token.address, abi=dex.src_token.abi
+    async def get_reserves(self, opportunity):
+        if opportunity.dex.quoter is not None:
+            reserves = await self.get_reserves_v3(opportunity)
+        else:
+            reserves = self.reserve_store.get(opportunity.pair_contract)
+            if reserves is None:
+                # Cold pair: read it once, Sync logs keep it current afterwards
+                try:
+                    reserves = await self.multicall.call(
+                        get_reserves_call(opportunity.pair_contract)
+                    )
+                except Exception:
+                    reserves = None
+                if reserves is None:
+                    # A derived pair address that was never deployed
+                    self.log.warning(
+                        f"Error fetching reserves {opportunity.pair_contract}"
+                    )
+                    opportunity.src_token_reserves = None
+                    opportunity.dest_token_reserves = None
+                    return
+                self.reserve_store.seed(
+                    opportunity.pair_contract, reserves[0], reserves[1]
+                )
+            self.confirm_pair(
+                opportunity.dex.name,
+                opportunity.src_token.address,
+                opportunity.dest_token.address,
             )
-            dest_token_contract = self.w3.eth.contract(
-                address=dex.dest_token.address, abi=dex.dest_token.abi
+            self.reserve_store.watch(opportunity.pair_contract)
+            opportunity.src_token_reserves = reserves[opportunity.src_token_position]
+            opportunity.dest_token_reserves = reserves[opportunity.dest_token_position]
+
+    async def get_reserves_v3(self, opportunity):
+        return await self.multicall.call(slot0_call(opportunity.pair_contract))
+
+    async def get_reserves_all_dexes(self, dexes, token_a, token_b):
+        # Reserves of token_a/token_b on every V2 DEX as
+        # {dex name: (pair, reserve_a, reserve_b)}. Pairs the Sync logs already
+        # track are served from memory, every other read shares one multicall.
+        pairs = {}
+        lookups = []
+        for dex in dexes:
+            if dex.quoter is not None:
+                continue
+            stored = self.known_pair(dex.name, token_a.address, token_b.address)
+            if stored is not None:
+                pairs[dex.name] = stored[0]
+                continue
+            resolved = self.pair_resolver.resolve(
+                dex.name, token_a.address, token_b.address
             )
-            reserves = pair_contract.functions.slot0().call()
-        else:
-            reserves = pair_contract.functions.getReserves().call()
-            dex.src_token_reserves = reserves[dex.src_token_position]
-            dex.dest_token_reserves = reserves[dex.dest_token_position]
-
-    async def get_reserves_v3(self, dex):
-        pair_contract = self.w3.eth.contract(
-            address=dex.pair_contract, abi=dex.pair_abi
+            if resolved is not None:
+                pairs[dex.name] = resolved[0]
+            else:
+                lookups.append(dex)
+        if lookups:
+            results = await self.multicall.gather(
+                [
+                    get_pair_call(dex.factory, token_a.address, token_b.address)
+                    for dex in lookups
+                ]
+            )
+            for dex, result in zip(lookups, results):
+                if result is not None and result[0] != ZERO_ADDRESS:
+                    pairs[dex.name] = Web3.to_checksum_address(result[0])
+
+        cold = [
+            (dex_name, pair)
+            for dex_name, pair in pairs.items()
+            if self.reserve_store.get(pair) is None
+        ]
+        results = await self.multicall.gather(
+            [get_reserves_call(pair) for _, pair in cold]
+        )
+        missing = set()
+        for (dex_name, pair), reserves in zip(cold, results):
+            if reserves is None:
+                missing.add(dex_name)
+            else:
+                self.reserve_store.seed(pair, reserves[0], reserves[1])
+
+        token0, _ = sort_tokens(token_a.address, token_b.address)
+        a_is_token0 = token0 == to_address_bytes(token_a.address)
+        all_reserves = {}
+        for dex_name, pair in pairs.items():
+            if dex_name in missing:
+                continue
+            self.confirm_pair(dex_name, token_a.address, token_b.address)
+            self.reserve_store.watch(pair)
+            reserve0, reserve1, _ = self.reserve_store.get(pair)
+            if a_is_token0:
+                all_reserves[dex_name] = (pair, reserve0, reserve1)
+            else:
+                all_reserves[dex_name] = (pair, reserve1, reserve0)
+        return all_reserves
+
+    async def get_v3_pools_all_dexes(self, dexes, token_a, token_b):
+        # The token_a/token_b pool of every fee tier on every V3 DEX as
+        # {(dex name, fee): (pool, state, a_is_token0)}, read into the V3 pool
+        # store the first time and followed through its logs afterwards.
+        pools = {}
+        for dex in dexes:
+            if dex.quoter is None or not self.pair_resolver.has_pool_deployer(
+                dex.name
+            ):
+                continue
+            for fee in FEE_TIERS:
+                pool, position = self.pair_resolver.resolve_pool(
+                    dex.name, token_a.address, token_b.address, fee
+                )
+                pools[(dex.name, fee)] = (pool, position == 0)
+        if not pools:
+            return {}
+        states = await self.v3_pools.load(
+            [(pool, fee) for (_, fee), (pool, _) in pools.items()]
         )
-        reserves = pair_contract.functions.slot0().call()
-        return reserves
+        return {
+            key: (pool, states[pool], a_is_token0)
+            for key, (pool, a_is_token0) in pools.items()
+            if states[pool] is not None
+        }
 
     async def get_qoute(
         self,
-        dex,
+        opportunity,
         amount,
         src_reserves,
         dest_reserves,
     ):
-        try:
-            router_contract = self.w3.eth.contract(
-                address=dex.router, abi=dex.router_abi
-            )
-            return router_contract.functions.getAmountOut(
-                amount, src_reserves, dest_reserves
-            ).call()
-        except ValidationError as e:
-            return router_contract.functions.getAmountOut(
-                amount, src_reserves, dest_reserves, 1
-            ).call()
+        fee, fee_denominator = self.fee_table.get(
+            opportunity.dex.name, opportunity.pair_contract
+        )
+        return amm.get_amount_out(
+            amount, src_reserves, dest_reserves, fee, fee_denominator
+        )
 
     async def get_amount_in(
         self,
-        dex,
+        opportunity,
         amount,
         src_reserves,
         dest_reserves,
     ):
+        fee, fee_denominator = self.fee_table.get(
+            opportunity.dex.name, opportunity.pair_contract
+        )
+        return amm.get_amount_in(
+            amount, src_reserves, dest_reserves, fee, fee_denominator
+        )
+
+    async def get_pair_fee(self, opportunity):
+        # Forks with a per-pair swap fee (BiSwap, NomiSwap, KyotoSwap) expose it
+        # on the pair contract; read it once and keep it in the fee table.
+        pair_fee_function = self.fee_table.get_pair_fee_function(
+            opportunity.dex.name
+        )
+        if pair_fee_function is None or self.fee_table.has_pair_fee(
+            opportunity.pair_contract
+        ):
+            return
+        function_name, fee_denominator = pair_fee_function
         try:
-            router_contract = self.w3.eth.contract(
-                address=dex.router, abi=dex.router_abi
+            fee = await self.multicall.call(
+                Call(
+                    opportunity.pair_contract,
+                    f"{function_name}()",
+                    output_types=["uint256"],
+                )
+            )
+            if fee is None:
+                raise ValueError(f"{function_name}() reverted")
+            self.fee_table.set_pair_fee(
+                opportunity.pair_contract, int(fee[0]), fee_denominator
+            )
+        except Exception as e:
+            self.log.warning(
+                f"Error fetching pair fee {opportunity.dex.name}-{opportunity.pair_contract}, using the default"
             )
-            return router_contract.functions.getAmountIn(
-                amount, src_reserves, dest_reserves
-            ).call()
-        except ValidationError as e:
-            return router_contract.functions.getAmountIn(
-                amount, src_reserves, dest_reserves, 1
-            ).call()
-
-    async def get_qouteV3(
-        self, dex, amount, src_token, dest_token, sqrt_price_limit_X96
-    ):
-        quoter_contract = self.w3.eth.contract(address=dex.quoter, abi=dex.quoter_abi)
-        params = {
-            "tokenIn": src_token,
-            "tokenOut": dest_token,
-            "amountIn": amount,
-            "fee": 500,
-            "sqrtPriceLimitX96": sqrt_price_limit_X96,
-        }
-        quote = quoter_contract.functions.quoteExactInputSingle(params).call()
-        return quote[0], quote[1]
+
+    async def get_quote_v3(self, dex, amount, src_token, dest_token, fee):
+        # Exact input quote from the cached pool state, no quoter call
+        resolved = self.pair_resolver.resolve_pool(
+            dex.name, src_token.address, dest_token.address, fee
+        )
+        if resolved is None:
+            return None
+        pool, position = resolved
+        state = (await self.v3_pools.load([(pool, fee)]))[pool]
+        if state is None:
+            return None
+        return state.get_amount_out(amount, position == 0)
 
     async def get_swap_route_openocean(
         self, src_token, dest_token, src_amount, receiver, gas_price
@@ -338,20 +445,18 @@ class ContractFetcher:
         }
 
         params = target_path_config.get("params")
-        # Call the API with requests to handle async calls
         try:
-            response = requests.get(OPEN_OCEAN_API_URL, params=params)
-            response.raise_for_status()
-            json_response = json.dumps(response.json(), indent=2)
-            self.log.debug(json_response)
-            price_route = response.json()
+            price_route = await self.http.get(
+                "openocean", OPEN_OCEAN_API_URL, params=params
+            )
+            self.log.debug(json.dumps(price_route, indent=2))
             return price_route["data"]
-        except requests.exceptions.HTTPError as http_err:
+        except HTTPStatusError as http_err:
             self.log.error(f"HTTP error occurred: {http_err}")
-            self.log.error(response.content)
+            self.log.error(http_err.content)
             return None
-        except requests.exceptions.RequestException as req_err:
-            self.log.error(f"Request error occurred: {req_err}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+            self.log.error(f"Request error occurred: {req_err!r}")
             return None
 
     async def get_swap_route_paraswap(self, src_token, dest_token, src_amount):
@@ -372,23 +477,19 @@ class ContractFetcher:
 
             prices_url = f"{PARASWAP_API_URL}/prices"
             params = requestOptions.get("params", {})
-            response = requests.get(prices_url, params=params)
-            response.raise_for_status()
-
-            # Convert the response to JSON format and print it
-            json_response = json.dumps(response.json(), indent=2)
-            self.log.debug(json_response)
-        except requests.exceptions.HTTPError as http_err:
+            response = await self.http.get("paraswap", prices_url, params=params)
+            self.log.debug(json.dumps(response, indent=2))
+        except HTTPStatusError as http_err:
             self.log.error(f"HTTP error occurred: {http_err}")
-            self.log.error(response.content)
+            self.log.error(http_err.content)
             return None
-        except requests.exceptions.RequestException as req_err:
-            self.log.error(f"Request error occurred: {req_err}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+            self.log.error(f"Request error occurred: {req_err!r}")
             return None
 
         # Ensure that the response contains the expected structure
-        if "priceRoute" in response.json():
-            price_route = response.json()["priceRoute"]
+        if "priceRoute" in response:
+            price_route = response["priceRoute"]
             return price_route
         else:
             self.log.error("Unexpected response format.")
@@ -408,22 +509,108 @@ class ContractFetcher:
             "headers": {"x-client-id": "v1swapper"},
         }
         params = target_path_config.get("params")
-        # Call the API with requests to handle async calls
         try:
-            response = requests.get(route_path, params=params)
-            response.raise_for_status()
-            json_response = json.dumps(response.json(), indent=2)
-            self.log.debug(json_response)
-            price_route = response.json()
+            price_route = await self.http.get(
+                "kyberswap",
+                route_path,
+                params=params,
+                headers=target_path_config.get("headers"),
+            )
+            self.log.debug(json.dumps(price_route, indent=2))
             return price_route["data"]
-        except requests.exceptions.HTTPError as http_err:
+        except HTTPStatusError as http_err:
             self.log.error(f"HTTP error occurred: {http_err}")
-            self.log.error(response.content)
+            self.log.error(http_err.content)
             return None
-        except requests.exceptions.RequestException as req_err:
-            self.log.error(f"Request error occurred: {req_err}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+            self.log.error(f"Request error occurred: {req_err!r}")
             return None
 
+    async def get_swap_quote(self, aggregator, src_token, dest_token, src_amount):
+        # The aggregator's route normalised to a SwapQuote, or None
+        if aggregator == "paraswap":
+            route = await self.get_swap_route_paraswap(
+                src_token, dest_token, src_amount
+            )
+            if route is None:
+                return None
+            return SwapQuote(aggregator, src_amount, int(route["destAmount"]), route)
+        if aggregator == "kyberswap":
+            route = await self.get_swap_route_kyberswap(
+                src_token, dest_token, src_amount
+            )
+            if route is None:
+                return None
+            return SwapQuote(
+                aggregator, src_amount, int(route["routeSummary"]["amountOut"]), route
+            )
+        if aggregator == "openocean":
+            route = await self.get_swap_route_openocean(
+                src_token,
+                dest_token,
+                src_amount,
+                self.config["arbitrage_address"],
+                self.config.get("openocean_gas_price", "5"),
+            )
+            if route is None:
+                return None
+            return SwapQuote(aggregator, src_amount, int(route["outAmount"]), route)
+        raise ValueError(f"Unknown aggregator {aggregator}")
+
+    async def race_swap_quotes(
+        self, src_token, dest_token, src_amount, aggregators, deadline
+    ):
+        # Ask every aggregator at once and keep the best quote that arrives
+        # before the deadline; stragglers are cancelled. Quotes are reused
+        # until the next new head.
+        block_number = self.quote_cache.block_number
+        cached = self.quote_cache.get(src_token.address, dest_token.address, src_amount)
+        if cached is not None:
+            return cached
+        tasks = [
+            asyncio.create_task(
+                self.get_swap_quote(aggregator, src_token, dest_token, src_amount)
+            )
+            for aggregator in aggregators
+        ]
+        done, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        best = None
+        for task in done:
+            if task.exception() is not None:
+                self.log.error(f"Quote failed: {task.exception()!r}")
+                continue
+            quote = task.result()
+            if quote is not None and (
+                best is None or quote.dest_amount > best.dest_amount
+            ):
+                best = quote
+        if pending:
+            self.log.debug(f"{len(pending)} aggregator quotes missed the deadline")
+        if best is not None:
+            self.quote_cache.put(
+                src_token.address, dest_token.address, block_number, best
+            )
+        return best
+
+    async def build_swap_transaction(
+        self, quote, src_token, dest_token, receiver_address, vault_address
+    ):
+        if quote.aggregator == "paraswap":
+            return await self.build_paraswap_transaction(
+                src_token,
+                dest_token,
+                quote.src_amount,
+                quote.route,
+                receiver_address,
+                vault_address,
+            )
+        if quote.aggregator == "kyberswap":
+            return await self.build_kyberswap_transaction(quote.route, receiver_address)
+        # OpenOcean's swap_quote already carries the calldata
+        return quote.route["data"]
+
     async def build_paraswap_transaction(
         self,
         src_token,
@@ -450,21 +637,21 @@ class ContractFetcher:
 
             query_params = {"ignoreChecks": "true"}
 
-            response = requests.post(tx_url, params=query_params, json=tx_config)
-            response.raise_for_status()
+            tx_params = await self.http.post(
+                "paraswap", tx_url, params=query_params, json=tx_config
+            )
 
             # Assuming the response contains the necessary data for TransactionParams
-            tx_params = response.json()
             if tx_params is not None:
                 json_response = json.dumps(tx_params, indent=2)
                 self.log.debug(json_response)
             return tx_params["data"]
-        except requests.exceptions.HTTPError as http_err:
+        except HTTPStatusError as http_err:
             self.log.error(f"HTTP error occurred: {http_err}")
-            self.log.error(response.content)
+            self.log.error(http_err.content)
             return None
-        except requests.exceptions.RequestException as req_err:
-            self.log.error(f"Request error occurred: {req_err}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+            self.log.error(f"Request error occurred: {req_err!r}")
             return None
 
     async def build_kyberswap_transaction(
@@ -483,19 +670,19 @@ class ContractFetcher:
             }
             headers = {"x-client-id": "v1swapper"}
 
-            response = requests.post(tx_url, headers=headers, json=tx_config)
-            response.raise_for_status()
+            tx_params = await self.http.post(
+                "kyberswap", tx_url, json=tx_config, headers=headers
+            )
 
             # Assuming the response contains the necessary data for TransactionParams
-            tx_params = response.json()
             if tx_params is not None:
                 json_response = json.dumps(tx_params, indent=2)
                 self.log.debug(json_response)
             return tx_params["data"]["data"]
-        except requests.exceptions.HTTPError as http_err:
+        except HTTPStatusError as http_err:
             self.log.error(f"HTTP error occurred: {http_err}")
-            self.log.error(response.content)
+            self.log.error(http_err.content)
             return None
-        except requests.exceptions.RequestException as req_err:
-            self.log.error(f"Request error occurred: {req_err}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as req_err:
+            self.log.error(f"Request error occurred: {req_err!r}")
             return None
@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+import json
+from collections import deque
+import websockets
+from scripts.mempool_stream import to_int
+
+SUBSCRIBE_ID = 1
+
+
+def percentile(sorted_values, percent):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, len(sorted_values) * percent // 100)
+    return sorted_values[index]
+
+
+class GasOracle:
+    # Keeps a rolling distribution of the gas prices paid in recent blocks and
+    # seen in the mempool, refreshed on every new head, so bids are served from
+    # memory on the submit path.
+    def __init__(
+        self,
+        ws_url,
+        log,
+        max_gas_price,
+        min_gas_price=0,
+        floor_percentile=10,
+        history_blocks=20,
+        mempool_samples=1000,
+        min_backoff=0.5,
+        max_backoff=30,
+    ):
+        self.ws_url = ws_url
+        self.log = log
+        self.max_gas_price = max_gas_price
+        self.min_gas_price = min_gas_price
+        self.floor_percentile = floor_percentile
+        self.block_prices = deque(maxlen=history_blocks)
+        self.mempool_prices = deque(maxlen=mempool_samples)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.request_ids = itertools.count(SUBSCRIBE_ID + 1)
+        self.head = None
+        # Called with the number of every new head as soon as it arrives
+        self.head_listeners = []
+        self.floor = min_gas_price
+
+    def observe_pending(self, gas_price):
+        if gas_price:
+            self.mempool_prices.append(gas_price)
+
+    def observe_block(self, block):
+        # System transactions on BSC pay nothing and would drag the floor down
+        prices = [
+            to_int(transaction["gasPrice"])
+            for transaction in block.get("transactions", [])
+            if isinstance(transaction, dict) and to_int(transaction.get("gasPrice"))
+        ]
+        self.block_prices.append(prices)
+        self.head = to_int(block["number"])
+        self.refresh()
+
+    def refresh(self):
+        samples = sorted(
+            itertools.chain(
+                itertools.chain.from_iterable(self.block_prices), self.mempool_prices
+            )
+        )
+        if not samples:
+            return
+        self.floor = max(self.min_gas_price, percentile(samples, self.floor_percentile))
+
+    def bid(self, victim_gas_price):
+        # Validators order by gas price, then arrival: matching the victim's
+        # price lands right behind it, paying more would put us in front. A
+        # victim below the floor is unlikely to make the next block, and one
+        # above our cap cannot be matched.
+        if victim_gas_price < self.floor or victim_gas_price > self.max_gas_price:
+            return None
+        return victim_gas_price
+
+    async def run(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                async with websockets.connect(
+                    self.ws_url, max_size=None, ping_interval=20
+                ) as ws:
+                    await self.subscribe(ws)
+                    backoff = self.min_backoff
+                    await self.stream(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log.error(f"Gas oracle disconnected: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def subscribe(self, ws):
+        await ws.send(
+            json.dumps(
+                {
+                    "jsonrpc": "2.0",
+                    "id": SUBSCRIBE_ID,
+                    "method": "eth_subscribe",
+                    "params": ["newHeads"],
+                }
+            )
+        )
+        response = json.loads(await ws.recv())
+        if "error" in response:
+            raise ConnectionError(f"eth_subscribe failed: {response['error']}")
+        self.log.info("Gas oracle subscribed to new heads")
+
+    async def stream(self, ws):
+        async for message in ws:
+            message = json.loads(message)
+            if message.get("method") == "eth_subscription":
+                number = message["params"]["result"]["number"]
+                for listener in self.head_listeners:
+                    listener(to_int(number))
+                # Headers carry no transactions, fetch the block's bodies
+                await ws.send(
+                    json.dumps(
+                        {
+                            "jsonrpc": "2.0",
+                            "id": next(self.request_ids),
+                            "method": "eth_getBlockByNumber",
+                            "params": [number, True],
+                        }
+                    )
+                )
+            elif message.get("result"):
+                self.observe_block(message["result"])
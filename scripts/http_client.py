@@ -0,0 +1,104 @@
+import asyncio
+import time
+import aiohttp
+
+# Per-aggregator request timeout (seconds) and token bucket (requests per
+# second, burst). Overridable with "aggregator_limits" in the bot config.
+DEFAULT_LIMITS = {
+    "paraswap": {"timeout": 1.5, "rate": 5, "burst": 10},
+    "kyberswap": {"timeout": 1.5, "rate": 5, "burst": 10},
+    "openocean": {"timeout": 2.0, "rate": 2, "burst": 4},
+}
+
+
+class HTTPStatusError(Exception):
+    def __init__(self, aggregator, status, content):
+        super().__init__(f"{aggregator} returned HTTP {status}")
+        self.aggregator = aggregator
+        self.status = status
+        self.content = content
+
+
+class RateLimiter:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HttpClient:
+    # One keep-alive connection pool shared by every aggregator call
+    def __init__(self, log, limits=None, pool_size=32):
+        self.log = log
+        self.pool_size = pool_size
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.rate_limiters = {
+            aggregator: RateLimiter(limit["rate"], limit["burst"])
+            for aggregator, limit in self.limits.items()
+        }
+        self.session = None
+        self.recorder = None
+
+    def get_session(self):
+        # Created lazily so it binds to the running event loop
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size, keepalive_timeout=60, ttl_dns_cache=300
+                )
+            )
+        return self.session
+
+    async def request(self, aggregator, method, url, **kwargs):
+        limit = self.limits[aggregator]
+        await self.rate_limiters[aggregator].acquire()
+        async with self.get_session().request(
+            method,
+            url,
+            timeout=aiohttp.ClientTimeout(total=limit["timeout"]),
+            **kwargs,
+        ) as response:
+            if response.status >= 400:
+                raise HTTPStatusError(
+                    aggregator, response.status, await response.text()
+                )
+            content = await response.json(content_type=None)
+        if self.recorder is not None:
+            self.recorder.record_http(
+                aggregator,
+                method,
+                url,
+                kwargs.get("params"),
+                kwargs.get("json"),
+                content,
+            )
+        return content
+
+    async def get(self, aggregator, url, params=None, headers=None):
+        return await self.request(
+            aggregator, "GET", url, params=params, headers=headers
+        )
+
+    async def post(self, aggregator, url, params=None, json=None, headers=None):
+        return await self.request(
+            aggregator, "POST", url, params=params, json=json, headers=headers
+        )
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
@@ -0,0 +1,100 @@
+import argparse
+import json
+import os
+from scripts.pair_db import PairDatabase, PAIR_DB_FILENAME
+
+CONTRACT_SUFFIX = "_contract.json"
+
+
+def load_file(filename):
+    with open(filename, "r") as json_file:
+        file = json.load(json_file)
+    return file
+
+
+def get_token_addresses(token_filenames):
+    # Early pair files are named by symbol (BUSD-WBNB) rather than by address
+    addresses = {}
+    for token_filename in token_filenames:
+        for symbol, token_info in load_file(token_filename).items():
+            addresses.setdefault(symbol, token_info["address"])
+    return addresses
+
+
+def to_token_address(token, token_addresses):
+    if token.startswith("0x"):
+        return token
+    return token_addresses.get(token)
+
+
+def import_pairs(pair_db, abi_dir, contract_dir, token_addresses, log=print):
+    imported = 0
+    skipped = 0
+    migrated_files = []
+    for contract_filename in sorted(os.listdir(contract_dir)):
+        if not contract_filename.endswith(CONTRACT_SUFFIX):
+            continue
+        name = contract_filename[: -len(CONTRACT_SUFFIX)]
+        dex_name, _, token_pair = name.partition("_")
+        token1, _, token2 = token_pair.partition("-")
+        abi_filename = os.path.join(abi_dir, f"{name}_abi.json")
+        token1_address = to_token_address(token1, token_addresses)
+        token2_address = to_token_address(token2, token_addresses)
+        if (
+            not os.path.exists(abi_filename)
+            or token1_address is None
+            or token2_address is None
+        ):
+            log(f"Skipping {contract_filename}")
+            skipped += 1
+            continue
+        pair = load_file(os.path.join(contract_dir, contract_filename))
+        abi = load_file(abi_filename)
+        pair_db.add_pair(
+            dex_name, token1_address, token2_address, pair, abi, commit=False
+        )
+        migrated_files.append(os.path.join(contract_dir, contract_filename))
+        migrated_files.append(abi_filename)
+        imported += 1
+    pair_db.commit()
+    return imported, skipped, migrated_files
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Migrate the per-pair abi/ and contract/ JSON files into the pair database"
+    )
+    parser.add_argument("--db", default=PAIR_DB_FILENAME)
+    parser.add_argument("--abi-dir", default="abi")
+    parser.add_argument("--contract-dir", default="contract")
+    parser.add_argument(
+        "--tokens",
+        nargs="+",
+        default=["config/loan_tokens.json", "config/tokens.json"],
+    )
+    parser.add_argument(
+        "--remove",
+        action="store_true",
+        help="Delete the migrated JSON files once they are in the database",
+    )
+    args = parser.parse_args()
+
+    pair_db = PairDatabase(args.db)
+    imported, skipped, migrated_files = import_pairs(
+        pair_db,
+        args.abi_dir,
+        args.contract_dir,
+        get_token_addresses(args.tokens),
+    )
+    pair_db.close()
+    print(
+        f"Imported {imported} pairs ({len(pair_db.abis)} distinct ABIs), skipped {skipped}"
+    )
+    if args.remove:
+        for filename in migrated_files:
+            os.remove(filename)
+        print(f"Removed {len(migrated_files)} files")
+
+
+if __name__ == "__main__":
+    main()
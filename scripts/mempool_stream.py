@@ -0,0 +1,155 @@
+import asyncio
+import itertools
+import json
+import traceback
+import websockets
+from hexbytes import HexBytes
+from scripts.token_registry import checksum_address
+
+SUBSCRIBE_ID = 1
+
+
+def to_int(value):
+    if value is None:
+        return None
+    return int(value, 16)
+
+
+def format_transaction(raw_transaction):
+    # Same shape as w3.eth.get_transaction for the fields the bot reads
+    return {
+        "hash": HexBytes(raw_transaction["hash"]),
+        "from": checksum_address(raw_transaction["from"]),
+        "to": (
+            checksum_address(raw_transaction["to"])
+            if raw_transaction.get("to")
+            else None
+        ),
+        "value": to_int(raw_transaction.get("value")),
+        "gas": to_int(raw_transaction.get("gas")),
+        "gasPrice": to_int(raw_transaction.get("gasPrice")),
+        "nonce": to_int(raw_transaction.get("nonce")),
+        "input": raw_transaction.get("input", "0x"),
+        "blockHash": raw_transaction.get("blockHash"),
+        "blockNumber": to_int(raw_transaction.get("blockNumber")),
+    }
+
+
+class MempoolStream:
+    def __init__(
+        self,
+        ws_url,
+        log,
+        batch_size=100,
+        batch_interval=0.005,
+        min_backoff=0.5,
+        max_backoff=30,
+    ):
+        self.ws_url = ws_url
+        self.log = log
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.full_transactions = None
+        self.request_ids = itertools.count(SUBSCRIBE_ID + 1)
+        self.pending_hashes = []
+
+    async def run(self, on_transaction):
+        backoff = self.min_backoff
+        while True:
+            try:
+                async with websockets.connect(
+                    self.ws_url, max_size=None, ping_interval=20
+                ) as ws:
+                    await self.subscribe(ws)
+                    backoff = self.min_backoff
+                    await self.stream(ws, on_transaction)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log.error(f"Mempool stream disconnected: {e}")
+            self.pending_hashes = []
+            self.log.info(f"Reconnecting to the mempool stream in {backoff}s")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def subscribe(self, ws):
+        # Ask for full transaction bodies first, nodes that do not support the
+        # flag reject it and we fall back to hashes plus batched lookups.
+        for full_transactions in (True, False):
+            params = ["newPendingTransactions"]
+            if full_transactions:
+                params.append(True)
+            await ws.send(
+                json.dumps(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": SUBSCRIBE_ID,
+                        "method": "eth_subscribe",
+                        "params": params,
+                    }
+                )
+            )
+            response = json.loads(await ws.recv())
+            if "error" not in response:
+                self.full_transactions = full_transactions
+                self.log.info(
+                    f"Subscribed to pending transactions (full bodies: {full_transactions})"
+                )
+                return response["result"]
+        raise ConnectionError(f"eth_subscribe failed: {response['error']}")
+
+    async def stream(self, ws, on_transaction):
+        flusher = asyncio.create_task(self.flush_loop(ws))
+        try:
+            async for message in ws:
+                self.handle_message(json.loads(message), on_transaction)
+                if len(self.pending_hashes) >= self.batch_size:
+                    await self.flush(ws)
+        finally:
+            flusher.cancel()
+
+    def handle_message(self, message, on_transaction):
+        if isinstance(message, list):
+            # Response to a batched eth_getTransactionByHash
+            for response in message:
+                result = response.get("result")
+                if result:
+                    on_transaction(format_transaction(result))
+            return
+        if message.get("method") != "eth_subscription":
+            return
+        result = message["params"]["result"]
+        if isinstance(result, dict):
+            on_transaction(format_transaction(result))
+        else:
+            # Some nodes accept the flag but still only send hashes
+            self.pending_hashes.append(result)
+
+    async def flush(self, ws):
+        if not self.pending_hashes:
+            return
+        batch = [
+            {
+                "jsonrpc": "2.0",
+                "id": next(self.request_ids),
+                "method": "eth_getTransactionByHash",
+                "params": [transaction_hash],
+            }
+            for transaction_hash in self.pending_hashes
+        ]
+        self.pending_hashes = []
+        # Pipelined: the reply is handled by the read loop when it arrives
+        await ws.send(json.dumps(batch))
+
+    async def flush_loop(self, ws):
+        try:
+            while True:
+                await asyncio.sleep(self.batch_interval)
+                await self.flush(ws)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.log.error(f"Error flushing transaction batch: {e}")
+            traceback.print_exc()
@@ -0,0 +1,195 @@
+import time
+from bisect import bisect_left
+from aiohttp import web
+
+# Seconds, from a cache hit to a slow aggregator round trip
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class Counter:
+    def __init__(self, name, description, label):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}
+
+    def inc(self, label_value, amount=1):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} counter",
+        ]
+        for label_value, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+class Gauge:
+    # The last value set for each label, for one-off timings such as startup
+    # that would only pile up in the top bucket of a latency histogram
+    def __init__(self, name, description, label):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}
+
+    def set(self, label_value, value):
+        self.values[label_value] = value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} gauge",
+        ]
+        for label_value, value in sorted(self.values.items()):
+            lines.append(f'{self.name}{{{self.label}="{label_value}"}} {value}')
+        return lines
+
+
+class Histogram:
+    # Bucket counts are kept non-cumulative so an observation is one bisect
+    # and two additions; they are summed up only when scraped.
+    def __init__(self, name, description, label, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+
+    def observe(self, label_value, value):
+        series = self.series.get(label_value)
+        if series is None:
+            # Bucket counts, with +Inf last, then the sum
+            series = [0] * (len(self.buckets) + 1) + [0.0]
+            self.series[label_value] = series
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for label_value, series in sorted(self.series.items()):
+            labels = f'{self.label}="{label_value}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                )
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+
+class Span:
+    __slots__ = ("histogram", "stage", "start")
+
+    def __init__(self, histogram, stage):
+        self.histogram = histogram
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.histogram.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    # Stage latencies and pipeline counters, kept in memory and rendered in
+    # the Prometheus text format only when scraped.
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.stage_seconds = Histogram(
+            "backrun_stage_seconds",
+            "Time spent in each pipeline stage",
+            "stage",
+            buckets,
+        )
+        self.events = Counter(
+            "backrun_transactions_total",
+            "Transactions reaching each pipeline step",
+            "step",
+        )
+        self.rejections = Counter(
+            "backrun_rejections_total",
+            "Transactions dropped from the pipeline, by reason",
+            "reason",
+        )
+        self.quote_cache = Counter(
+            "backrun_quote_cache_total",
+            "Aggregator quote cache lookups, by result",
+            "result",
+        )
+        self.startup = Gauge(
+            "backrun_startup_seconds",
+            "Time taken by each startup milestone",
+            "milestone",
+        )
+        self.runner = None
+
+    def span(self, stage):
+        return Span(self.stage_seconds, stage)
+
+    def observe(self, stage, seconds):
+        self.stage_seconds.observe(stage, seconds)
+
+    def startup_time(self, milestone, seconds):
+        self.startup.set(milestone, seconds)
+
+    def count(self, step):
+        self.events.inc(step)
+
+    def reject(self, reason):
+        self.rejections.inc(reason)
+
+    def render(self):
+        lines = []
+        for metric in (
+            self.stage_seconds,
+            self.events,
+            self.rejections,
+            self.quote_cache,
+            self.startup,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def handle(self, request):
+        return web.Response(
+            body=self.render().encode(), headers={"Content-Type": CONTENT_TYPE}
+        )
+
+    async def serve(self, host="127.0.0.1", port=9108):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+
+    async def close(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
@@ -0,0 +1,152 @@
+import asyncio
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+AGGREGATE3_TYPES = ["(address,bool,bytes)[]"]
+AGGREGATE3_RESULT_TYPES = ["(bool,bytes)[]"]
+
+
+def function_selector(signature):
+    return keccak(text=signature)[:4]
+
+
+AGGREGATE3_SELECTOR = function_selector("aggregate3((address,bool,bytes)[])")
+
+
+class Call:
+    # One read for the batch: calldata for target and the ABI types of its result
+    def __init__(
+        self, target, signature, argument_types=(), arguments=(), output_types=()
+    ):
+        self.target = to_checksum_address(target)
+        self.call_data = function_selector(signature) + encode(
+            list(argument_types), list(arguments)
+        )
+        self.output_types = list(output_types)
+
+    def decode(self, success, return_data):
+        if not success or len(return_data) < 32 * len(self.output_types):
+            return None
+        return decode(self.output_types, return_data)
+
+
+def get_pair_call(factory, token_a, token_b):
+    return Call(
+        factory,
+        "getPair(address,address)",
+        ["address", "address"],
+        [token_a, token_b],
+        ["address"],
+    )
+
+
+def token0_call(pair):
+    return Call(pair, "token0()", output_types=["address"])
+
+
+def get_reserves_call(pair):
+    return Call(pair, "getReserves()", output_types=["uint112", "uint112", "uint32"])
+
+
+def slot0_call(pool):
+    return Call(
+        pool,
+        "slot0()",
+        output_types=[
+            "uint160",
+            "int24",
+            "uint16",
+            "uint16",
+            "uint16",
+            "uint32",
+            "bool",
+        ],
+    )
+
+
+def liquidity_call(pool):
+    return Call(pool, "liquidity()", output_types=["uint128"])
+
+
+def tick_bitmap_call(pool, word_position):
+    return Call(pool, "tickBitmap(int16)", ["int16"], [word_position], ["uint256"])
+
+
+def ticks_call(pool, tick):
+    # Only liquidityGross and liquidityNet of the Tick.Info struct
+    return Call(pool, "ticks(int24)", ["int24"], [tick], ["uint128", "int128"])
+
+
+def block_number_call(multicall_address=MULTICALL3_ADDRESS):
+    return Call(multicall_address, "getBlockNumber()", output_types=["uint256"])
+
+
+def max_flash_loan_call(lender, token):
+    return Call(lender, "maxFlashLoan(address)", ["address"], [token], ["uint256"])
+
+
+class Multicall:
+    def __init__(
+        self, w3, log, window=0.002, max_calls=500, address=MULTICALL3_ADDRESS
+    ):
+        self.w3 = w3
+        self.log = log
+        self.window = window
+        self.max_calls = max_calls
+        self.address = address
+        self.pending = []
+        self.flush_handle = None
+
+    def aggregate(self, calls, block_identifier="latest"):
+        # One eth_call for every read; a reverting read decodes to None instead
+        # of failing the batch.
+        if not calls:
+            return []
+        data = AGGREGATE3_SELECTOR + encode(
+            AGGREGATE3_TYPES,
+            [[(call.target, True, call.call_data) for call in calls]],
+        )
+        return_data = self.w3.eth.call(
+            {"to": self.address, "data": data}, block_identifier
+        )
+        (results,) = decode(AGGREGATE3_RESULT_TYPES, bytes(return_data))
+        return [
+            call.decode(success, result)
+            for call, (success, result) in zip(calls, results)
+        ]
+
+    async def call(self, call):
+        # Reads issued by concurrent tasks within one window share an eth_call
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((call, future))
+        if len(self.pending) >= self.max_calls:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(
+                self.window, self.flush
+            )
+        return await future
+
+    async def gather(self, calls):
+        return await asyncio.gather(*(self.call(call) for call in calls))
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        batch = self.pending
+        self.pending = []
+        if not batch:
+            return
+        try:
+            results = self.aggregate([call for call, _ in batch])
+        except Exception as e:
+            self.log.warning(f"Multicall of {len(batch)} reads failed: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
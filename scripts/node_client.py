@@ -0,0 +1,74 @@
+from scripts.http_client import HttpClient
+
+NODE = "node"
+# The node's JSON-RPC over HTTP usually sits at its websocket URL
+URL_SCHEMES = {"ws://": "http://", "wss://": "https://"}
+# Request timeout (seconds) and token bucket for the node, overridable with
+# "node_limit" in the bot config
+NODE_LIMIT = {"timeout": 2.0, "rate": 100, "burst": 100}
+
+
+def http_url(url):
+    for scheme, http_scheme in URL_SCHEMES.items():
+        if url.startswith(scheme):
+            return http_scheme + url[len(scheme) :]
+    return url
+
+
+class RPCError(Exception):
+    def __init__(self, method, error):
+        message = error.get("message", str(error)) if isinstance(error, dict) else error
+        super().__init__(f"{method} failed: {message}")
+        self.method = method
+        self.error = error
+
+
+class NodeClient:
+    # The node's JSON-RPC over HTTP on a pooled aiohttp session. Requests made
+    # together go out as one JSON-RPC batch, so several reads cost a single
+    # round trip and none of them block the event loop the way the sync
+    # websocket provider does.
+    def __init__(self, url, log, limit=None):
+        self.url = http_url(url)
+        self.log = log
+        self.http = HttpClient(log, {NODE: limit or NODE_LIMIT})
+        self.recorder = None
+
+    async def batch(self, requests):
+        # [(method, params)] -> their results in the same order. A request the
+        # node turned down comes back as its RPCError, the batch itself only
+        # raises when the node could not be reached.
+        if not requests:
+            return []
+        responses = await self.http.post(
+            NODE,
+            self.url,
+            json=[
+                {"jsonrpc": "2.0", "id": index, "method": method, "params": params}
+                for index, (method, params) in enumerate(requests)
+            ],
+        )
+        if isinstance(responses, dict):
+            # A node that refuses batches answers with a single error
+            responses = [{**responses, "id": index} for index in range(len(requests))]
+        # Batch responses may come back in any order
+        by_id = {response.get("id"): response for response in responses}
+        results = []
+        for index, (method, params) in enumerate(requests):
+            response = by_id.get(index, {"error": {"message": "no response"}})
+            if self.recorder is not None:
+                self.recorder.record_rpc(method, params, response)
+            if "error" in response:
+                results.append(RPCError(method, response["error"]))
+            else:
+                results.append(response.get("result"))
+        return results
+
+    async def request(self, method, params):
+        (result,) = await self.batch([(method, params)])
+        if isinstance(result, RPCError):
+            raise result
+        return result
+
+    async def close(self):
+        await self.http.close()
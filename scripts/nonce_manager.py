@@ -0,0 +1,97 @@
+import threading
+
+
+class NonceManager:
+    # Hands out nonces for our account from memory. The chain is only asked at
+    # startup and whenever one of our transactions is dropped or replaced.
+    def __init__(self, w3, address, log):
+        self.w3 = w3
+        self.address = address
+        self.log = log
+        self.lock = threading.Lock()
+        self.next_nonce = None
+        # Handed to a worker that has not broadcast it yet -> sync generation
+        self.allocated = {}
+        self.in_flight = {}
+        self.released = set()
+        self.generation = 0
+        # The node's pending count at the last sync
+        self.synced_nonce = None
+
+    def sync(self):
+        mined_nonce = self.w3.eth.get_transaction_count(self.address, "latest")
+        pending_nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+        with self.lock:
+            # Below the mined count is done. A transaction above the pending
+            # count may only be queued behind a gap, it stays in flight until
+            # the receipt tracker gives up on it.
+            self.in_flight = {
+                nonce: transaction_hash
+                for nonce, transaction_hash in self.in_flight.items()
+                if nonce >= mined_nonce
+            }
+            # Workers still signing or broadcasting keep their nonces, the
+            # ones between them that nobody holds are handed out first
+            self.next_nonce = max(
+                [
+                    pending_nonce,
+                    *(nonce + 1 for nonce in self.allocated),
+                    *(nonce + 1 for nonce in self.in_flight),
+                ]
+            )
+            self.released = set(range(pending_nonce, self.next_nonce)).difference(
+                self.allocated, self.in_flight
+            )
+            self.synced_nonce = pending_nonce
+            self.generation += 1
+        self.log.info(f"Nonce synced at {self.next_nonce}")
+
+    def allocate(self):
+        with self.lock:
+            if self.released:
+                nonce = min(self.released)
+                self.released.remove(nonce)
+            else:
+                nonce = self.next_nonce
+                self.next_nonce += 1
+            self.allocated[nonce] = self.generation
+            return nonce
+
+    def track(self, nonce, transaction_hash):
+        with self.lock:
+            self.allocated.pop(nonce, None)
+            self.in_flight[nonce] = transaction_hash
+
+    def release(self, nonce):
+        # The transaction was never broadcast. The latest nonce is simply handed
+        # back; an older one is reused by the next allocation to fill the gap.
+        # A nonce allocated before the last sync is only reused when the node
+        # had not reached it at that sync.
+        with self.lock:
+            generation = self.allocated.pop(nonce, None)
+            if generation is None or (
+                generation != self.generation and nonce < self.synced_nonce
+            ):
+                return
+            if nonce == self.next_nonce - 1:
+                self.next_nonce = nonce
+            else:
+                self.released.add(nonce)
+
+    def confirm(self, nonce):
+        with self.lock:
+            self.in_flight.pop(nonce, None)
+
+    def drop(self, nonce):
+        # The transaction was never mined, its nonce is free again
+        with self.lock:
+            self.in_flight.pop(nonce, None)
+        self.resync()
+
+    def resync(self):
+        # Dropped, replaced or rejected transaction: the node knows best
+        self.log.warning(
+            f"Resyncing nonce, {len(self.in_flight)} in flight, "
+            f"{len(self.allocated)} being sent"
+        )
+        self.sync()
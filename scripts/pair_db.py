@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+PAIR_DB_FILENAME = "data/pairs.db"
+
+
+def abi_hash(abi_text):
+    return hashlib.sha256(abi_text.encode()).hexdigest()
+
+
+class PairDatabase:
+    def __init__(self, filename=PAIR_DB_FILENAME):
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS abis (
+                hash TEXT PRIMARY KEY,
+                abi TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pairs (
+                dex TEXT NOT NULL,
+                token0 TEXT NOT NULL,
+                token1 TEXT NOT NULL,
+                pair TEXT NOT NULL,
+                abi_hash TEXT NOT NULL REFERENCES abis(hash),
+                added_at INTEGER NOT NULL,
+                PRIMARY KEY (dex, token0, token1)
+            );
+            """)
+        self.abis = {}
+        self.pairs = {}
+        self.dex_abis = {}
+        self.load()
+
+    @staticmethod
+    def pair_key(dex_name, token_a, token_b):
+        token_a = token_a.lower()
+        token_b = token_b.lower()
+        if token_a < token_b:
+            return dex_name, token_a, token_b
+        return dex_name, token_b, token_a
+
+    def load(self):
+        for digest, abi_text in self.connection.execute("SELECT hash, abi FROM abis"):
+            self.abis[digest] = json.loads(abi_text)
+        for dex_name, token0, token1, pair, digest in self.connection.execute(
+            "SELECT dex, token0, token1, pair, abi_hash FROM pairs"
+        ):
+            self.pairs[(dex_name, token0, token1)] = (pair, digest)
+            self.dex_abis.setdefault(dex_name, digest)
+
+    def get_pair(self, dex_name, token_a, token_b):
+        entry = self.pairs.get(self.pair_key(dex_name, token_a, token_b))
+        if entry is None:
+            return None
+        return entry[0], self.abis[entry[1]]
+
+    def get_dex_abi(self, dex_name):
+        digest = self.dex_abis.get(dex_name)
+        if digest is None:
+            return None
+        return self.abis[digest]
+
+    def add_abi(self, abi):
+        abi_text = json.dumps(abi, separators=(",", ":"))
+        digest = abi_hash(abi_text)
+        if digest not in self.abis:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO abis (hash, abi) VALUES (?, ?)",
+                (digest, abi_text),
+            )
+            self.abis[digest] = abi
+        return digest
+
+    def add_pair(self, dex_name, token_a, token_b, pair, abi, commit=True):
+        key = self.pair_key(dex_name, token_a, token_b)
+        digest = self.add_abi(abi)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO pairs (dex, token0, token1, pair, abi_hash, added_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (*key, pair, digest, int(time.time())),
+        )
+        if commit:
+            self.connection.commit()
+        self.pairs[key] = (pair, digest)
+        self.dex_abis.setdefault(dex_name, digest)
+
+    def commit(self):
+        self.connection.commit()
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
@@ -0,0 +1,85 @@
+from eth_utils import keccak, to_checksum_address
+
+
+def to_address_bytes(address):
+    return bytes.fromhex(address[2:] if address.startswith("0x") else address)
+
+
+def sort_tokens(token_a, token_b):
+    # UniswapV2Library.sortTokens: token0 is the numerically smaller address
+    a = to_address_bytes(token_a)
+    b = to_address_bytes(token_b)
+    return (a, b) if a < b else (b, a)
+
+
+def compute_pair_address(factory, init_code_hash, token_a, token_b):
+    token0, token1 = sort_tokens(token_a, token_b)
+    salt = keccak(token0 + token1)
+    digest = keccak(
+        b"\xff" + to_address_bytes(factory) + salt + to_address_bytes(init_code_hash)
+    )
+    return to_checksum_address(digest[12:])
+
+
+def compute_pool_address(deployer, init_code_hash, token_a, token_b, fee):
+    # V3 pools are salted with abi.encode(token0, token1, fee), one per fee tier
+    token0, token1 = sort_tokens(token_a, token_b)
+    salt = keccak(
+        token0.rjust(32, b"\0") + token1.rjust(32, b"\0") + fee.to_bytes(32, "big")
+    )
+    digest = keccak(
+        b"\xff" + to_address_bytes(deployer) + salt + to_address_bytes(init_code_hash)
+    )
+    return to_checksum_address(digest[12:])
+
+
+class PairResolver:
+    def __init__(self):
+        self.factories = {}
+        self.deployers = {}
+        self.index = {}
+
+    def add_factory(self, dex_name, factory, init_code_hash):
+        self.factories[dex_name] = (factory, init_code_hash)
+
+    def has_factory(self, dex_name):
+        return dex_name in self.factories
+
+    def resolve(self, dex_name, token_a, token_b):
+        # Returns (pair address, position of token_a in the pair) where position 0
+        # means token_a is token0, or None if the factory is not registered.
+        key = (dex_name, to_address_bytes(token_a), to_address_bytes(token_b))
+        entry = self.index.get(key)
+        if entry is not None:
+            return entry
+        factory = self.factories.get(dex_name)
+        if factory is None:
+            return None
+        pair = compute_pair_address(factory[0], factory[1], token_a, token_b)
+        position = 0 if key[1] < key[2] else 1
+        entry = (pair, position)
+        self.index[key] = entry
+        self.index[(dex_name, key[2], key[1])] = (pair, 1 - position)
+        return entry
+
+    def add_pool_deployer(self, dex_name, deployer, init_code_hash):
+        self.deployers[dex_name] = (deployer, init_code_hash)
+
+    def has_pool_deployer(self, dex_name):
+        return dex_name in self.deployers
+
+    def resolve_pool(self, dex_name, token_a, token_b, fee):
+        # Same as resolve for the V3 pool of one fee tier
+        key = (dex_name, to_address_bytes(token_a), to_address_bytes(token_b), fee)
+        entry = self.index.get(key)
+        if entry is not None:
+            return entry
+        deployer = self.deployers.get(dex_name)
+        if deployer is None:
+            return None
+        pool = compute_pool_address(deployer[0], deployer[1], token_a, token_b, fee)
+        position = 0 if key[1] < key[2] else 1
+        entry = (pool, position)
+        self.index[key] = entry
+        self.index[(dex_name, key[2], key[1], fee)] = (pool, 1 - position)
+        return entry
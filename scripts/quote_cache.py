@@ -0,0 +1,62 @@
+import math
+from collections import OrderedDict
+
+
+class QuoteCache:
+    # Aggregator quotes for the current block. Amounts within bucket_step of
+    # each other share a bucket, so near-duplicate requests reuse one quote.
+    # Nothing is cached until the first new head arrives.
+    def __init__(self, max_size=1024, bucket_step=0.001, metrics=None):
+        self.max_size = max_size
+        self.log_step = math.log1p(bucket_step)
+        self.metrics = metrics
+        self.entries = OrderedDict()
+        self.block_number = None
+        self.hits = 0
+        self.misses = 0
+
+    def bucket(self, amount):
+        return int(math.log(amount) / self.log_step)
+
+    def key(self, src_token, dest_token, amount):
+        return (src_token.lower(), dest_token.lower(), self.bucket(amount))
+
+    def new_head(self, block_number):
+        # Reserves moved, every quote from the previous block is stale
+        if block_number != self.block_number:
+            self.entries.clear()
+            self.block_number = block_number
+
+    def count(self, result):
+        if self.metrics is not None:
+            self.metrics.quote_cache.inc(result)
+
+    def get(self, src_token, dest_token, amount):
+        if amount <= 0 or self.block_number is None:
+            return None
+        key = self.key(src_token, dest_token, amount)
+        quote = self.entries.get(key)
+        # Never hand back a quote that spends more than the caller has
+        if quote is None or quote.src_amount > amount:
+            self.misses += 1
+            self.count("miss")
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.count("hit")
+        return quote
+
+    def put(self, src_token, dest_token, block_number, quote):
+        # block_number is the head the quote was requested at, a quote that
+        # arrives after the next head is already stale
+        if (
+            quote.src_amount <= 0
+            or block_number is None
+            or block_number != self.block_number
+        ):
+            return
+        key = self.key(src_token, dest_token, quote.src_amount)
+        self.entries[key] = quote
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
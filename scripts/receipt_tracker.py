@@ -0,0 +1,116 @@
+import asyncio
+import traceback
+from scripts.mempool_stream import to_int
+from scripts.node_client import RPCError
+
+SUCCESS = "success"
+REVERTED = "reverted"
+DROPPED = "dropped"
+# Pipeline step counted for each outcome
+STEPS = {SUCCESS: "mined", REVERTED: "reverted", DROPPED: "dropped"}
+
+
+class PendingTransaction:
+    def __init__(self, transaction_hash, nonce, sent_block, description):
+        self.transaction_hash = transaction_hash
+        self.nonce = nonce
+        self.sent_block = sent_block
+        self.description = description
+
+
+class ReceiptTracker:
+    # Follows our submitted transactions in the background so the workers can
+    # go straight back to the mempool after sending. Every new head from the
+    # gas oracle looks up the receipts of all of them in one JSON-RPC batch.
+    def __init__(
+        self,
+        node,
+        log,
+        nonce_manager,
+        drop_after_blocks=20,
+        metrics=None,
+        broadcaster=None,
+    ):
+        self.node = node
+        self.log = log
+        self.nonce_manager = nonce_manager
+        self.drop_after_blocks = drop_after_blocks
+        self.metrics = metrics
+        self.broadcaster = broadcaster
+        self.pending = {}
+        self.results = {SUCCESS: 0, REVERTED: 0, DROPPED: 0}
+        self.last_block = None
+        self.head = asyncio.Event()
+
+    def track(self, transaction_hash, nonce, description=""):
+        self.pending[transaction_hash] = PendingTransaction(
+            transaction_hash, nonce, self.last_block, description
+        )
+
+    def record(self, pending, result, block_number=None):
+        del self.pending[pending.transaction_hash]
+        self.results[result] += 1
+        if self.metrics is not None:
+            self.metrics.count(STEPS[result])
+        if self.broadcaster is not None:
+            self.broadcaster.record_outcome(pending.transaction_hash, result)
+        if result == DROPPED:
+            self.nonce_manager.drop(pending.nonce)
+            self.log.warning(
+                f"Arbitrage transaction dropped: {pending.transaction_hash.hex()} {pending.description}"
+            )
+            return
+        self.nonce_manager.confirm(pending.nonce)
+        if result == SUCCESS:
+            self.log.success(
+                f"Arbitrage transaction mined in block {block_number}: {pending.transaction_hash.hex()} {pending.description}"
+            )
+        else:
+            self.log.error(
+                f"Arbitrage transaction reverted in block {block_number}: {pending.transaction_hash.hex()} {pending.description}"
+            )
+
+    def new_head(self, block_number):
+        # Head listener of the gas oracle, heads that arrive while a check is
+        # running are folded into the next one
+        self.last_block = block_number
+        self.head.set()
+
+    async def check(self, block_number):
+        pending_transactions = list(self.pending.values())
+        receipts = await self.node.batch(
+            [
+                ("eth_getTransactionReceipt", [pending.transaction_hash.hex()])
+                for pending in pending_transactions
+            ]
+        )
+        for pending, receipt in zip(pending_transactions, receipts):
+            if pending.sent_block is None:
+                pending.sent_block = block_number
+            if isinstance(receipt, RPCError):
+                self.log.warning(
+                    f"Receipt of {pending.transaction_hash.hex()}: {receipt}"
+                )
+                continue
+            if receipt is None:
+                # Not mined yet
+                if block_number - pending.sent_block >= self.drop_after_blocks:
+                    self.record(pending, DROPPED)
+                continue
+            self.record(
+                pending,
+                SUCCESS if to_int(receipt["status"]) == 1 else REVERTED,
+                to_int(receipt["blockNumber"]),
+            )
+
+    async def run(self):
+        while True:
+            await self.head.wait()
+            self.head.clear()
+            if not self.pending:
+                continue
+            try:
+                await self.check(self.last_block)
+            except Exception as e:
+                self.log.error(f"Error in receipt tracker: {e}")
+                traceback.print_exc()
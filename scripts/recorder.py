@@ -0,0 +1,126 @@
+import gzip
+import json
+import time
+from eth_abi import decode
+from hexbytes import HexBytes
+from scripts.multicall import (
+    AGGREGATE3_RESULT_TYPES,
+    AGGREGATE3_SELECTOR,
+    AGGREGATE3_TYPES,
+    MULTICALL3_ADDRESS,
+)
+
+# Record kinds, one gzipped JSON line each: [seconds since start, kind, payload]
+TRANSACTION = "tx"
+RESERVES = "reserves"
+HTTP = "http"
+RPC = "rpc"
+CALL = "call"
+
+# Node traffic that only keeps the live bot's subscriptions alive
+UNRECORDED_METHODS = {
+    "eth_newFilter",
+    "eth_getFilterChanges",
+    "eth_uninstallFilter",
+    "eth_sendRawTransaction",
+}
+
+
+def to_json_value(value):
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    if isinstance(value, dict):
+        return {key: to_json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    return value
+
+
+def canonical(value):
+    # Requests are matched on replay by their JSON form
+    return json.dumps(to_json_value(value), sort_keys=True, separators=(",", ":"))
+
+
+def multicall_calls(params):
+    # The individual reads of a plain aggregate3 eth_call, or None. Replay
+    # serves them one by one, since batches depend on timing and concurrency.
+    if len(params) != 2 or not isinstance(params[0], dict):
+        return None
+    transaction = params[0]
+    if str(transaction.get("to", "")).lower() != MULTICALL3_ADDRESS.lower():
+        return None
+    data = bytes(HexBytes(transaction.get("data", b"")))
+    if data[:4] != AGGREGATE3_SELECTOR:
+        return None
+    (calls,) = decode(AGGREGATE3_TYPES, data[4:])
+    return [(target, call_data) for target, _, call_data in calls]
+
+
+def read_recording(filename):
+    with gzip.open(filename, "rt") as recording:
+        for line in recording:
+            yield json.loads(line)
+
+
+class Recorder:
+    # Appends the mempool, reserve updates, node responses and aggregator
+    # responses the bot sees, so a session can be replayed offline.
+    def __init__(self, filename):
+        self.file = gzip.open(filename, "at")
+        self.start = time.monotonic()
+
+    def write(self, kind, payload):
+        elapsed = round(time.monotonic() - self.start, 6)
+        self.file.write(
+            json.dumps([elapsed, kind, to_json_value(payload)], separators=(",", ":"))
+            + "\n"
+        )
+
+    def record_transaction(self, transaction):
+        self.write(TRANSACTION, transaction)
+
+    def record_reserves(self, pair, reserve0, reserve1, block_number):
+        self.write(RESERVES, [pair, reserve0, reserve1, block_number])
+
+    def record_http(self, aggregator, method, url, params, json_body, response):
+        self.write(
+            HTTP,
+            {
+                "key": canonical([aggregator, method, url, params, json_body]),
+                "response": response,
+            },
+        )
+
+    def record_rpc(self, method, params, response):
+        calls = multicall_calls(params) if method == "eth_call" else None
+        if calls is not None and "result" in response:
+            (results,) = decode(
+                AGGREGATE3_RESULT_TYPES, bytes(HexBytes(response["result"]))
+            )
+            for (target, call_data), (success, return_data) in zip(calls, results):
+                self.write(
+                    CALL,
+                    {
+                        "key": canonical([target.lower(), call_data]),
+                        "success": success,
+                        "return_data": return_data,
+                    },
+                )
+            return
+        self.write(RPC, {"key": canonical([method, params]), "response": response})
+
+    def middleware(self, make_request, w3):
+        # web3 middleware that records every node response as it is returned
+        def record_request(method, params):
+            response = make_request(method, params)
+            if method not in UNRECORDED_METHODS:
+                try:
+                    self.record_rpc(method, params, response)
+                except Exception:
+                    pass
+            return response
+
+        return record_request
+
+    def close(self):
+        self.file.close()
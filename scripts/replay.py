@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+from functools import wraps
+from eth_abi import encode
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.providers.base import BaseProvider
+from scripts import back_runner
+from scripts.gas_oracle import percentile
+from scripts.http_client import HTTPStatusError
+from scripts.multicall import AGGREGATE3_RESULT_TYPES
+from scripts.node_client import RPCError
+from scripts.recorder import (
+    CALL,
+    HTTP,
+    RESERVES,
+    RPC,
+    TRANSACTION,
+    canonical,
+    multicall_calls,
+    read_recording,
+)
+
+# Stages timed on replay, in pipeline order
+STAGES = [
+    "initial_checks",
+    "decode_input_v2",
+    "build_v2_swap",
+    "simulate_backrun",
+    "quote_candidate",
+]
+# Answers for requests that depend on our own account rather than the chain
+DEFAULT_RESULTS = {
+    "eth_chainId": "0x38",
+    "eth_getTransactionCount": "0x0",
+    "eth_blockNumber": "0x0",
+}
+# Replay never signs for real, any key will do
+REPLAY_PRIVATE_KEY = "0x" + "11" * 32
+
+FILTERED = "filtered"
+NO_ARBITRAGE = "no_arbitrage"
+EXECUTE = "execute"
+ERROR = "error"
+
+
+class ReplayProvider(BaseProvider):
+    # Serves recorded node responses. Multicall batches are answered read by
+    # read, since replay does not reproduce the live bot's batching.
+    def __init__(self, responses, calls):
+        self.responses = responses
+        self.calls = calls
+        self.misses = 0
+
+    def make_request(self, method, params):
+        calls = multicall_calls(params) if method == "eth_call" else None
+        if calls is not None:
+            results = []
+            for target, call_data in calls:
+                result = self.calls.get(canonical([target.lower(), call_data]))
+                if result is None:
+                    self.misses += 1
+                    result = (False, b"")
+                results.append(result)
+            return {
+                "jsonrpc": "2.0",
+                "id": 0,
+                "result": "0x" + encode(AGGREGATE3_RESULT_TYPES, [results]).hex(),
+            }
+        response = self.responses.get(canonical([method, params]))
+        if response is not None:
+            return response
+        if method in DEFAULT_RESULTS:
+            return {"jsonrpc": "2.0", "id": 0, "result": DEFAULT_RESULTS[method]}
+        self.misses += 1
+        return {
+            "jsonrpc": "2.0",
+            "id": 0,
+            "error": {"code": -32000, "message": f"{method} not recorded"},
+        }
+
+    def is_connected(self, show_traceback=False):
+        return True
+
+
+class ReplayHttpClient:
+    # Stands in for HttpClient with the recorded aggregator responses
+    def __init__(self, responses):
+        self.responses = responses
+        self.misses = 0
+
+    async def request(self, aggregator, method, url, params=None, json=None):
+        key = canonical([aggregator, method, url, params, json])
+        if key not in self.responses:
+            self.misses += 1
+            raise HTTPStatusError(aggregator, 404, "not recorded")
+        return self.responses[key]
+
+    async def get(self, aggregator, url, params=None, headers=None):
+        return await self.request(aggregator, "GET", url, params=params)
+
+    async def post(self, aggregator, url, params=None, json=None, headers=None):
+        return await self.request(aggregator, "POST", url, params=params, json=json)
+
+    async def close(self):
+        pass
+
+
+class ReplayNodeClient:
+    # Stands in for NodeClient, answering each request of a batch from the
+    # recorded node responses like the provider does
+    def __init__(self, provider):
+        self.provider = provider
+
+    async def batch(self, requests):
+        results = []
+        for method, params in requests:
+            response = self.provider.make_request(method, params)
+            if "error" in response:
+                results.append(RPCError(method, response["error"]))
+            else:
+                results.append(response["result"])
+        return results
+
+    async def request(self, method, params):
+        (result,) = await self.batch([(method, params)])
+        if isinstance(result, RPCError):
+            raise result
+        return result
+
+    async def close(self):
+        pass
+
+
+def latency_summary(samples):
+    samples = sorted(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p90_ms": round(percentile(samples, 90) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+
+
+class Replay:
+    # Feeds a recording through the back runner's pipeline against the
+    # recorded node and aggregators, at recorded speed or as fast as possible.
+    def __init__(self, filename, speed=None, workers=None):
+        self.speed = speed
+        self.workers = workers
+        self.events = []
+        rpc_responses = {}
+        call_results = {}
+        http_responses = {}
+        for elapsed, kind, payload in read_recording(filename):
+            if kind in (TRANSACTION, RESERVES):
+                self.events.append((elapsed, kind, payload))
+            elif kind == RPC:
+                rpc_responses[payload["key"]] = payload["response"]
+            elif kind == CALL:
+                call_results[payload["key"]] = (
+                    payload["success"],
+                    bytes(HexBytes(payload["return_data"])),
+                )
+            elif kind == HTTP:
+                http_responses[payload["key"]] = payload["response"]
+        self.provider = ReplayProvider(rpc_responses, call_results)
+        self.http = ReplayHttpClient(http_responses)
+        self.node = ReplayNodeClient(self.provider)
+        self.latencies = defaultdict(list)
+        self.decisions = {}
+
+    def install(self, config, dex_config):
+        config = {
+            **config,
+            "test_private_key": REPLAY_PRIVATE_KEY,
+            "production_private_key": REPLAY_PRIVATE_KEY,
+            # A replay must not read or overwrite the live boot snapshot
+            "boot_snapshot_filename": None,
+        }
+        back_runner.setup(config, dex_config, Web3(self.provider), "")
+        back_runner.fetcher.http = self.http
+        back_runner.node = self.node
+        back_runner.transaction_simulator.node = self.node
+        back_runner.boot(config)
+        if self.workers is None:
+            self.workers = back_runner.worker_count
+        for stage in STAGES:
+            setattr(back_runner, stage, self.timed(stage, getattr(back_runner, stage)))
+        back_runner.initial_checks = self.checked(back_runner.initial_checks)
+        back_runner.execute_transaction = self.execute_transaction
+
+    def timed(self, stage, function):
+        @wraps(function)
+        async def timed_stage(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.latencies[stage].append(time.perf_counter() - start)
+
+        return timed_stage
+
+    def checked(self, initial_checks):
+        @wraps(initial_checks)
+        async def checked_initial_checks(transaction_details):
+            result = await initial_checks(transaction_details)
+            if not result[0]:
+                self.decisions[transaction_details["hash"]] = FILTERED
+            return result
+
+        return checked_initial_checks
+
+    async def execute_transaction(self, opportunity, transaction, swap_type):
+        # Everything up to signing ran, record the decision instead of sending
+        self.decisions[transaction.transaction_hash] = EXECUTE
+        back_runner.log.info(
+            f"Replay would send: loan {opportunity.loan_amount} "
+            f"{opportunity.loan_token.symbol}, gas price {opportunity.gas_price}"
+        )
+
+    async def process(self, transaction, semaphore):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await back_runner.processTransaction(transaction)
+            except Exception as e:
+                self.decisions[transaction["hash"]] = ERROR
+                back_runner.log.error(f"Replay error: {e}")
+            self.decisions.setdefault(transaction["hash"], NO_ARBITRAGE)
+            self.latencies["total"].append(time.perf_counter() - start)
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.workers)
+        tasks = []
+        start = time.perf_counter()
+        for elapsed, kind, payload in self.events:
+            if self.speed is not None:
+                delay = elapsed / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if kind == RESERVES:
+                back_runner.fetcher.reserve_store.update(*payload)
+                # No heads are recorded, the reserve updates stand in for them
+                quote_cache = back_runner.fetcher.quote_cache
+                quote_cache.new_head(max(payload[-1], quote_cache.block_number or 0))
+                continue
+            payload["hash"] = HexBytes(payload["hash"])
+            tasks.append(asyncio.create_task(self.process(payload, semaphore)))
+        await asyncio.gather(*tasks)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, seconds):
+        transactions = len(self.latencies["total"])
+        return {
+            "transactions": transactions,
+            "seconds": round(seconds, 3),
+            "transactions_per_second": (
+                round(transactions / seconds, 1) if seconds else None
+            ),
+            "stages": {
+                stage: latency_summary(samples)
+                for stage, samples in self.latencies.items()
+                if samples
+            },
+            "decisions": dict(Counter(self.decisions.values())),
+            "unrecorded": {
+                "node": self.provider.misses,
+                "aggregator": self.http.misses,
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay a recorded mempool session through the back runner offline"
+    )
+    parser.add_argument("recording")
+    parser.add_argument("--config", default="config/bot_config.json")
+    parser.add_argument("--dex-config", default="config/dex_config.json")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=None,
+        help="Multiple of the recorded pace, as fast as possible when omitted",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    config = back_runner.load_file(args.config)
+    back_runner.log.remove()
+    back_runner.log.add(sys.stderr, level="ERROR")
+    replay = Replay(args.recording, args.speed, args.workers)
+    replay.install(config, back_runner.load_file(args.dex_config))
+    print(json.dumps(asyncio.run(replay.run()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import asyncio
+import itertools
+import json
+import traceback
+import websockets
+from hexbytes import HexBytes
+from web3 import Web3
+from scripts.mempool_stream import to_int
+from scripts.token_registry import checksum_address
+
+SYNC_TOPIC = Web3.keccak(text="Sync(uint112,uint112)").hex()
+
+
+def format_log(raw_log):
+    # Same shape as w3.eth.get_logs for the fields the stores read
+    return {
+        "address": checksum_address(raw_log["address"]),
+        "topics": [HexBytes(topic) for topic in raw_log["topics"]],
+        "data": HexBytes(raw_log["data"]),
+        "blockNumber": to_int(raw_log["blockNumber"]),
+        "logIndex": to_int(raw_log["logIndex"]),
+    }
+
+
+class LogWatcher:
+    # Follows the logs of the watched contracts on an eth_subscribe("logs")
+    # stream of its own, like the mempool stream and the gas oracle. Adding a
+    # contract subscribes again with the new address list, and the logs
+    # missed in between are replayed with one eth_getLogs over the node
+    # client. Subclasses set topics and handle each log.
+    topics = []
+    name = "log watcher"
+
+    def __init__(self, ws_url, log, node=None, min_backoff=0.5, max_backoff=30):
+        self.ws_url = ws_url
+        self.log = log
+        self.node = node
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.watched = set()
+        self.last_block = None
+        # First block of the logs to replay once the next subscription is live
+        self.backfill_from = None
+        self.request_ids = itertools.count(1)
+        self.subscribe_id = None
+        self.subscription = None
+        self.changed = asyncio.Event()
+
+    def watch(self, address):
+        if address not in self.watched:
+            self.watched.add(address)
+            if self.last_block is not None:
+                self.replay_from(self.last_block + 1)
+            self.changed.set()
+
+    def replay_from(self, block_number):
+        if self.backfill_from is None or block_number < self.backfill_from:
+            self.backfill_from = block_number
+
+    def handle_log(self, entry):
+        raise NotImplementedError
+
+    async def backfill(self):
+        # Replay every log emitted for the watched contracts since
+        # backfill_from in one eth_getLogs instead of a read per contract. The
+        # subscription is live by now, so nothing falls between the two.
+        from_block = self.backfill_from
+        self.backfill_from = None
+        try:
+            head = to_int(await self.node.request("eth_blockNumber", []))
+            if from_block is not None and from_block <= head:
+                entries = await self.node.request(
+                    "eth_getLogs",
+                    [
+                        {
+                            "address": sorted(self.watched),
+                            "topics": self.topics,
+                            "fromBlock": hex(from_block),
+                            "toBlock": hex(head),
+                        }
+                    ],
+                )
+                for entry in entries:
+                    self.handle_log(format_log(entry))
+                self.log.debug(f"{self.name} backfilled {len(entries)} logs")
+        except Exception:
+            # Tried again on the next subscription
+            if from_block is not None:
+                self.replay_from(from_block)
+            raise
+        if self.last_block is None or head > self.last_block:
+            self.last_block = head
+
+    async def run(self):
+        backoff = self.min_backoff
+        while True:
+            try:
+                async with websockets.connect(
+                    self.ws_url, max_size=None, ping_interval=20
+                ) as ws:
+                    backoff = self.min_backoff
+                    self.subscription = None
+                    if self.last_block is not None:
+                        # Anything emitted while we were disconnected
+                        self.replay_from(self.last_block + 1)
+                    if self.watched:
+                        self.changed.set()
+                    await self.stream(ws)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.log.error(f"{self.name} disconnected: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def stream(self, ws):
+        follower = asyncio.create_task(self.follow(ws))
+        try:
+            async for message in ws:
+                await self.handle_message(ws, json.loads(message))
+        finally:
+            follower.cancel()
+
+    async def follow(self, ws):
+        # Subscribes again whenever a contract is added, the old subscription
+        # is dropped once the new one is live
+        try:
+            while True:
+                await self.changed.wait()
+                self.changed.clear()
+                if not self.watched:
+                    continue
+                self.subscribe_id = next(self.request_ids)
+                await ws.send(
+                    json.dumps(
+                        {
+                            "jsonrpc": "2.0",
+                            "id": self.subscribe_id,
+                            "method": "eth_subscribe",
+                            "params": [
+                                "logs",
+                                {
+                                    "address": sorted(self.watched),
+                                    "topics": self.topics,
+                                },
+                            ],
+                        }
+                    )
+                )
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.log.error(f"Error subscribing the {self.name}: {e}")
+            traceback.print_exc()
+
+    async def unsubscribe(self, ws, subscription):
+        await ws.send(
+            json.dumps(
+                {
+                    "jsonrpc": "2.0",
+                    "id": next(self.request_ids),
+                    "method": "eth_unsubscribe",
+                    "params": [subscription],
+                }
+            )
+        )
+
+    async def handle_message(self, ws, message):
+        if message.get("method") == "eth_subscription":
+            entry = message["params"]["result"]
+            # Logs of a reorged block come again from the new one
+            if not entry.get("removed"):
+                self.handle_log(format_log(entry))
+            return
+        if "error" in message:
+            if message.get("id") == self.subscribe_id:
+                raise ConnectionError(f"eth_subscribe failed: {message['error']}")
+            return
+        result = message.get("result")
+        if not isinstance(result, str):
+            # eth_unsubscribe acknowledged
+            return
+        if message.get("id") != self.subscribe_id:
+            # Overtaken by a later subscribe before it went live
+            await self.unsubscribe(ws, result)
+            return
+        previous, self.subscription = self.subscription, result
+        if previous is not None:
+            await self.unsubscribe(ws, previous)
+        self.log.info(f"{self.name} subscribed to {len(self.watched)} contracts")
+        await self.backfill()
+
+
+class ReserveStore(LogWatcher):
+    topics = [SYNC_TOPIC]
+    name = "Reserve store"
+
+    def __init__(self, ws_url, log, node=None):
+        super().__init__(ws_url, log, node)
+        self.reserves = {}
+        self.recorder = None
+
+    def get(self, pair):
+        return self.reserves.get(pair)
+
+    def update(self, pair, reserve0, reserve1, block_number):
+        current = self.reserves.get(pair)
+        if current is not None and current[2] > block_number:
+            return
+        self.reserves[pair] = (reserve0, reserve1, block_number)
+        if self.recorder is not None:
+            self.recorder.record_reserves(pair, reserve0, reserve1, block_number)
+
+    def seed(self, pair, reserve0, reserve1):
+        # Reserves read directly from the pair; any later Sync log supersedes them
+        self.update(pair, reserve0, reserve1, self.last_block or 0)
+
+    def handle_log(self, entry):
+        data = bytes(entry["data"])
+        # Sync(uint112 reserve0, uint112 reserve1), both padded to 32 bytes
+        reserve0 = int.from_bytes(data[0:32], "big")
+        reserve1 = int.from_bytes(data[32:64], "big")
+        block_number = entry["blockNumber"]
+        self.update(entry["address"], reserve0, reserve1, block_number)
+        if self.last_block is None or block_number > self.last_block:
+            self.last_block = block_number
@@ -0,0 +1,261 @@
+from math import isqrt
+from scripts import amm
+from scripts.v3_math import FEE_DENOMINATOR, Q96
+
+
+class Pool:
+    # A V2 pair seen from the loan token: reserve_loan is the loan token side
+    def __init__(
+        self, dex_name, pair, reserve_loan, reserve_token, fee, fee_denominator
+    ):
+        self.dex_name = dex_name
+        self.pair = pair
+        self.reserve_loan = reserve_loan
+        self.reserve_token = reserve_token
+        self.fee = fee
+        self.fee_denominator = fee_denominator
+
+    def buy(self, amount_in):
+        # Loan token in, token out
+        return amm.get_amount_out(
+            amount_in,
+            self.reserve_loan,
+            self.reserve_token,
+            self.fee,
+            self.fee_denominator,
+        )
+
+    def sell(self, token_amount):
+        # Token in, loan token out
+        return amm.get_amount_out(
+            token_amount,
+            self.reserve_token,
+            self.reserve_loan,
+            self.fee,
+            self.fee_denominator,
+        )
+
+
+class V3Pool:
+    # A V3 pool seen from the loan token, quoted across its cached ticks
+    def __init__(self, dex_name, pair, state, loan_is_token0):
+        self.dex_name = dex_name
+        self.pair = pair
+        self.state = state
+        self.loan_is_token0 = loan_is_token0
+        self.fee = state.fee
+        self.fee_denominator = FEE_DENOMINATOR
+
+    @property
+    def reserve_loan(self):
+        # Virtual reserve of the loan token in the current tick range
+        if self.loan_is_token0:
+            return self.state.liquidity * Q96 // self.state.sqrt_price_x96
+        return self.state.liquidity * self.state.sqrt_price_x96 // Q96
+
+    def buy(self, amount_in):
+        return self.state.get_amount_out(amount_in, self.loan_is_token0)
+
+    def sell(self, token_amount):
+        return self.state.get_amount_out(token_amount, not self.loan_is_token0)
+
+
+class Backrun:
+    def __init__(self, buy_pool, sell_pool, amount_in, token_amount, amount_out):
+        self.buy_pool = buy_pool
+        self.sell_pool = sell_pool
+        self.amount_in = amount_in
+        self.token_amount = token_amount
+        self.amount_out = amount_out
+        self.profit = amount_out - amount_in
+
+
+class Hop:
+    # One pair of a victim's path, token_in -> token_out, with its reserves
+    # before the victim's swap. simulate_path fills in the amounts.
+    def __init__(self, dex_name, pair, reserve_in, reserve_out, fee, fee_denominator):
+        self.dex_name = dex_name
+        self.pair = pair
+        self.reserve_in = reserve_in
+        self.reserve_out = reserve_out
+        self.fee = fee
+        self.fee_denominator = fee_denominator
+        self.amount_in = None
+        self.amount_out = None
+
+    def get_amount_out(self, amount_in):
+        return amm.get_amount_out(
+            amount_in, self.reserve_in, self.reserve_out, self.fee, self.fee_denominator
+        )
+
+    def get_amount_in(self, amount_out):
+        return amm.get_amount_in(
+            amount_out,
+            self.reserve_in,
+            self.reserve_out,
+            self.fee,
+            self.fee_denominator,
+        )
+
+    def pool_after(self, loan_is_input):
+        # The pair once the victim's swap went through, from the loan token side
+        reserve_in = self.reserve_in + self.amount_in
+        reserve_out = self.reserve_out - self.amount_out
+        if not loan_is_input:
+            reserve_in, reserve_out = reserve_out, reserve_in
+        return Pool(
+            self.dex_name,
+            self.pair,
+            reserve_in,
+            reserve_out,
+            self.fee,
+            self.fee_denominator,
+        )
+
+
+class V3Hop:
+    # One V3 pool of a victim's path with its state before the victim's swap.
+    # simulate_path fills in the amounts and the state the swap leaves.
+    def __init__(self, dex_name, pair, state, zero_for_one):
+        self.dex_name = dex_name
+        self.pair = pair
+        self.state = state
+        self.zero_for_one = zero_for_one
+        self.amount_in = None
+        self.amount_out = None
+        self.state_after = None
+
+    def get_amount_out(self, amount_in):
+        _, amount_out, self.state_after = self.state.swap_state(
+            self.zero_for_one, amount_in
+        )
+        return amount_out
+
+    def get_amount_in(self, amount_out):
+        amount_in, _, self.state_after = self.state.swap_state(
+            self.zero_for_one, -amount_out
+        )
+        return amount_in
+
+    def pool_after(self, loan_is_input):
+        # The pool once the victim's swap went through, from the loan token side
+        return V3Pool(
+            self.dex_name,
+            self.pair,
+            self.state_after,
+            self.zero_for_one == loan_is_input,
+        )
+
+
+def simulate_path(hops, amount_in=None, amount_out=None):
+    # The victim's swap hop by hop, like the router's getAmountsOut for an
+    # exact input and getAmountsIn for an exact output. Raises ValueError where
+    # the router would revert.
+    if amount_in is not None:
+        for hop in hops:
+            hop.amount_in = amount_in
+            amount_in = hop.get_amount_out(amount_in)
+            hop.amount_out = amount_in
+    else:
+        for hop in reversed(hops):
+            hop.amount_out = amount_out
+            amount_out = hop.get_amount_in(amount_out)
+            hop.amount_in = amount_out
+    return hops
+
+
+def apply_swap(pool, amount_in):
+    # The pool after a loan token -> token swap of amount_in, as the victim does
+    amount_out = amm.get_amount_out(
+        amount_in, pool.reserve_loan, pool.reserve_token, pool.fee, pool.fee_denominator
+    )
+    return Pool(
+        pool.dex_name,
+        pool.pair,
+        pool.reserve_loan + amount_in,
+        pool.reserve_token - amount_out,
+        pool.fee,
+        pool.fee_denominator,
+    )
+
+
+def optimal_amount_in(buy_pool, sell_pool):
+    # Buying on one pool and selling on the other behaves like a single pool:
+    #   out(x) = N x / (M + K x)
+    # with N = ga gb a_out b_out, M = a_in b_in, K = ga (b_in + gb a_out), so the
+    # profit out(x) - x peaks at x = (sqrt(N M) - M) / K. Everything is scaled by
+    # the fee denominators to stay in integers.
+    a_in = buy_pool.reserve_loan
+    a_out = buy_pool.reserve_token
+    b_in = sell_pool.reserve_token
+    b_out = sell_pool.reserve_loan
+    fee_a = buy_pool.fee_denominator - buy_pool.fee
+    fee_b = sell_pool.fee_denominator - sell_pool.fee
+    denominators = buy_pool.fee_denominator * sell_pool.fee_denominator
+    root = isqrt(fee_a * fee_b * a_in * a_out * b_in * b_out * denominators)
+    numerator = root - a_in * b_in * denominators
+    if numerator <= 0:
+        return 0
+    return numerator // (fee_a * (sell_pool.fee_denominator * b_in + fee_b * a_out))
+
+
+def simulate(buy_pool, sell_pool, amount_in):
+    # Exact pool arithmetic for both legs, or None if a leg would revert or run
+    # past the ticks a V3 pool has cached
+    try:
+        token_amount = buy_pool.buy(amount_in)
+        amount_out = sell_pool.sell(token_amount)
+    except ValueError:
+        return None
+    return Backrun(buy_pool, sell_pool, amount_in, token_amount, amount_out)
+
+
+def search_amount_in(buy_pool, sell_pool, high):
+    # No closed form once a V3 pool is involved, but the profit is still
+    # concave in the amount in: ternary search it on [0, high] down to a
+    # millionth of the range. An amount that cannot be simulated counts as too
+    # large.
+    def profit(amount_in):
+        backrun = simulate(buy_pool, sell_pool, amount_in)
+        return None if backrun is None else backrun.profit
+
+    precision = max(high >> 20, 1)
+    # The profit starts at zero, if it does not rise right away it never does
+    probe = profit(precision)
+    if probe is None or probe <= 0:
+        return 0
+    low = precision
+    while high - low > precision:
+        third = (high - low) // 3
+        left = profit(low + third)
+        right = profit(high - third)
+        if right is not None and (left is None or left < right):
+            low += third
+        else:
+            high -= third
+    return low
+
+
+def find_best_backrun(victim_pool, other_pools, max_amount_in=None):
+    # Try buying on every other DEX and selling into the victim's pool, and the
+    # opposite direction, each at its own optimal size.
+    best = None
+    for pool in other_pools:
+        for buy_pool, sell_pool in ((pool, victim_pool), (victim_pool, pool)):
+            if isinstance(buy_pool, Pool) and isinstance(sell_pool, Pool):
+                amount_in = optimal_amount_in(buy_pool, sell_pool)
+            else:
+                high = min(buy_pool.reserve_loan, sell_pool.reserve_loan)
+                if max_amount_in is not None:
+                    high = min(high, max_amount_in)
+                amount_in = search_amount_in(buy_pool, sell_pool, high)
+            if max_amount_in is not None:
+                amount_in = min(amount_in, max_amount_in)
+            if amount_in <= 0:
+                continue
+            backrun = simulate(buy_pool, sell_pool, amount_in)
+            if backrun is not None and (best is None or backrun.profit > best.profit):
+                best = backrun
+    if best is None or best.profit <= 0:
+        return None
+    return best
@@ -0,0 +1,194 @@
+from eth_abi.decoding import ContextFramesBytesIO, TupleDecoder
+from eth_abi.registry import registry
+from eth_utils import keccak
+from scripts.universal_router import decode_execute
+from scripts.v3_router import decode_swap_router
+
+# UniswapV2 router swaps we can back-run, with their argument names. Exact-input
+# swaps carry amountOutMin, exact-output swaps carry amountOut.
+SWAP_FUNCTIONS = {
+    "swapExactTokensForTokens": (
+        ("uint256", "amountIn"),
+        ("uint256", "amountOutMin"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapExactTokensForETH": (
+        ("uint256", "amountIn"),
+        ("uint256", "amountOutMin"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapExactETHForTokens": (
+        ("uint256", "amountOutMin"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapExactTokensForTokensSupportingFeeOnTransferTokens": (
+        ("uint256", "amountIn"),
+        ("uint256", "amountOutMin"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapExactTokensForETHSupportingFeeOnTransferTokens": (
+        ("uint256", "amountIn"),
+        ("uint256", "amountOutMin"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapExactETHForTokensSupportingFeeOnTransferTokens": (
+        ("uint256", "amountOutMin"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapTokensForExactTokens": (
+        ("uint256", "amountOut"),
+        ("uint256", "amountInMax"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapTokensForExactETH": (
+        ("uint256", "amountOut"),
+        ("uint256", "amountInMax"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+    "swapETHForExactTokens": (
+        ("uint256", "amountOut"),
+        ("address[]", "path"),
+        ("address", "to"),
+        ("uint256", "deadline"),
+    ),
+}
+# Exact-input swaps whose input amount is the native value sent with the call
+VALUE_IN_FUNCTIONS = (
+    "swapExactETHForTokens",
+    "swapExactETHForTokensSupportingFeeOnTransferTokens",
+)
+
+
+def function_selector(name, types):
+    return keccak(text=f"{name}({','.join(types)})")[:4]
+
+
+class SwapFunction:
+    def __init__(self, name, arguments):
+        types = [argument_type for argument_type, _ in arguments]
+        self.name = name
+        self.argument_names = [argument_name for _, argument_name in arguments]
+        self.selector = function_selector(name, types)
+        self.value_in = name in VALUE_IN_FUNCTIONS
+        # Only V3 swaps carry a fee tier per hop
+        self.fees = None
+        # strict=False matches the Solidity decoder, which tolerates dirty padding
+        self.decoder = TupleDecoder(
+            decoders=[registry.get_decoder(type_str, strict=False) for type_str in types]
+        )
+
+    def decode(self, data, value=0):
+        values = self.decoder(ContextFramesBytesIO(data))
+        arguments = dict(zip(self.argument_names, values))
+        if self.value_in and value:
+            arguments["amountIn"] = value
+        return arguments
+
+
+SWAPS = {}
+for _name, _arguments in SWAP_FUNCTIONS.items():
+    _swap = SwapFunction(_name, _arguments)
+    SWAPS[_swap.selector] = _swap
+
+
+class SwapDecoder:
+    def __init__(self):
+        self.routers = {}
+        # Universal Router address -> {leg version: dex}
+        self.universal_routers = {}
+        # V3 SwapRouter address -> dex
+        self.v3_routers = {}
+
+    def is_routed(self, key):
+        return (
+            key in self.routers
+            or key in self.universal_routers
+            or key in self.v3_routers
+        )
+
+    def add_router(self, router, dex):
+        # False when the address already routes to another DEX, which keeps it
+        key = bytes.fromhex(router[2:])
+        if self.is_routed(key):
+            return False
+        self.routers[key] = dex
+        return True
+
+    def add_v3_router(self, router, dex):
+        # exactInput* and exactOutput* swaps, alone or in a multicall, are
+        # backrun on the pools of dex
+        key = bytes.fromhex(router[2:])
+        if self.is_routed(key):
+            return False
+        self.v3_routers[key] = dex
+        return True
+
+    def add_universal_router(self, router, v2_dex=None, v3_dex=None):
+        # V2 and V3 legs of an execute call are backrun on the pairs of
+        # v2_dex and the pools of v3_dex
+        key = bytes.fromhex(router[2:])
+        if self.is_routed(key):
+            return False
+        self.universal_routers[key] = {2: v2_dex, 3: v3_dex}
+        return True
+
+    def decode_universal(self, dexes, data, value):
+        # The first swap leg on a known DEX
+        for leg in decode_execute(data, value):
+            dex = dexes.get(leg.version)
+            if dex is not None:
+                return dex, leg, leg.arguments
+        return None
+
+    def decode(self, to, data, value=0):
+        # Returns (dex, swap function, arguments) or None. The router and
+        # selector lookups are plain dict hits, so the bulk of the mempool is
+        # dropped before any ABI decoding happens. A Universal Router or V3
+        # SwapRouter call gives one of its legs as the swap function instead.
+        if to is None:
+            return None
+        router = bytes.fromhex(to[2:])
+        dex = self.routers.get(router)
+        if dex is None:
+            dexes = self.universal_routers.get(router)
+            v3_dex = self.v3_routers.get(router)
+            if dexes is None and v3_dex is None:
+                return None
+            if isinstance(data, str):
+                data = bytes.fromhex(data[2:])
+            try:
+                if dexes is not None:
+                    return self.decode_universal(dexes, data, value)
+                # The first swap, a multicall rarely bundles more than one
+                for leg in decode_swap_router(data):
+                    return v3_dex, leg, leg.arguments
+            except ValueError:
+                return None
+            return None
+        if isinstance(data, str):
+            if len(data) < 10:
+                return None
+            swap = SWAPS.get(bytes.fromhex(data[2:10]))
+            if swap is None:
+                return None
+            return dex, swap, swap.decode(bytes.fromhex(data[10:]), value)
+        swap = SWAPS.get(bytes(data[:4]))
+        if swap is None:
+            return None
+        return dex, swap, swap.decode(bytes(data[4:]), value)
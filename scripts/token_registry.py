@@ -0,0 +1,95 @@
+from functools import lru_cache
+from web3 import Web3
+from scripts.pair_resolver import to_address_bytes
+
+
+@lru_cache(maxsize=65536)
+def checksum_address(address):
+    # Web3.to_checksum_address hashes the address on every call. Routers,
+    # tokens and busy senders come round again and again, so each spelling
+    # is checksummed once and the same string is handed back after that.
+    return Web3.to_checksum_address(address)
+
+
+class Token:
+    __slots__ = (
+        "symbol",
+        "address",
+        "key",
+        "decimals",
+        "profit",
+        "vault",
+        "max_loan_amount",
+        "abi",
+    )
+
+    def __init__(self, symbol, token_info, vault=None, profit=None, loan_amount=None):
+        self.symbol = symbol
+        self.address = checksum_address(token_info["address"])
+        self.key = to_address_bytes(self.address)
+        self.decimals = token_info["decimals"]
+        self.profit = profit
+        self.vault = vault
+        self.max_loan_amount = None
+        self.abi = None
+
+    @property
+    def is_loan_token(self):
+        return self.vault is not None
+
+
+class Decoded_Token:
+    # A token seen in a victim's path that is not in the token lists
+    __slots__ = ("address", "key", "abi")
+
+    def __init__(self, address):
+        self.address = checksum_address(address)
+        self.key = to_address_bytes(self.address)
+        self.abi = None
+
+
+class TokenRegistry:
+    # Tokens keyed by their 20 byte address, so a lookup takes any spelling
+    # of the address without checksumming or lowercasing it.
+    def __init__(self):
+        self.tokens = {}
+        self.loan_tokens = {}
+
+    def add(self, token):
+        # A loan token replaces the plain entry for the same address
+        self.tokens[token.key] = token
+        if token.is_loan_token:
+            self.loan_tokens[token.key] = token
+        return token
+
+    def add_token_list(self, token_list):
+        # token_list is the symbol -> {address, decimals} mapping of tokens.json
+        for symbol, token_info in token_list.items():
+            key = to_address_bytes(token_info["address"])
+            if key not in self.loan_tokens:
+                self.add(Token(symbol, token_info))
+
+    def get(self, address):
+        return self.tokens.get(to_address_bytes(address))
+
+    def token(self, address):
+        # The known token at address, or a bare one for a token we have no
+        # entry for
+        token = self.tokens.get(to_address_bytes(address))
+        return token if token is not None else Decoded_Token(address)
+
+    def loan_token(self, address):
+        return self.loan_tokens.get(to_address_bytes(address))
+
+    def is_loan_token(self, address):
+        return to_address_bytes(address) in self.loan_tokens
+
+    def vault(self, address):
+        token = self.loan_tokens.get(to_address_bytes(address))
+        return token.vault if token is not None else None
+
+    def __contains__(self, address):
+        return to_address_bytes(address) in self.tokens
+
+    def __len__(self):
+        return len(self.tokens)
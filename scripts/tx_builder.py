@@ -0,0 +1,97 @@
+import rlp
+from eth_keys import keys
+from eth_utils import keccak
+
+EXECUTE_FLASH_ARBITRAGE_SELECTOR = keccak(
+    text="executeFlashArbitrage(address,uint256,address,address,bytes,bytes)"
+)[:4]
+# Six head words, so the first bytes argument starts right after them
+FIRST_BYTES_OFFSET = 6 * 32
+
+
+def address_word(address):
+    return b"\x00" * 12 + bytes.fromhex(address[2:])
+
+
+def uint_word(value):
+    return value.to_bytes(32, "big")
+
+
+def encode_bytes(data):
+    padding = -len(data) % 32
+    return uint_word(len(data)) + data + b"\x00" * padding
+
+
+class FlashArbitrageEncoder:
+    # Calldata for executeFlashArbitrage(lender, loanAmount, destToken,
+    # loanToken, calldata1, calldata2), with the selector and lender word built
+    # once. Token words are cached per address.
+    def __init__(self, lender):
+        self.prefix = EXECUTE_FLASH_ARBITRAGE_SELECTOR + address_word(lender)
+        self.address_words = {}
+
+    def token_word(self, address):
+        word = self.address_words.get(address)
+        if word is None:
+            word = address_word(address)
+            self.address_words[address] = word
+        return word
+
+    def encode(self, loan_amount, dest_token, loan_token, calldata1, calldata2):
+        first = encode_bytes(calldata1)
+        return b"".join(
+            (
+                self.prefix,
+                uint_word(loan_amount),
+                self.token_word(dest_token),
+                self.token_word(loan_token),
+                uint_word(FIRST_BYTES_OFFSET),
+                uint_word(FIRST_BYTES_OFFSET + len(first)),
+                first,
+                encode_bytes(calldata2),
+            )
+        )
+
+
+class LegacySigner:
+    # EIP-155 legacy transactions to one contract. The key object, recipient
+    # and chain id are fixed, only nonce, gas price and data change per call.
+    def __init__(self, private_key, chain_id, to, gas_limit):
+        self.private_key = keys.PrivateKey(
+            bytes.fromhex(private_key.removeprefix("0x"))
+        )
+        self.chain_id = chain_id
+        self.to = bytes.fromhex(to[2:])
+        self.gas_limit = gas_limit
+
+    def sign(self, nonce, gas_price, data, value=0, gas_limit=None):
+        gas_limit = self.gas_limit if gas_limit is None else gas_limit
+        fields = [nonce, gas_price, gas_limit, self.to, value, data]
+        message_hash = keccak(rlp.encode(fields + [self.chain_id, 0, 0]))
+        signature = self.private_key.sign_msg_hash(message_hash)
+        v = signature.v + self.chain_id * 2 + 35
+        raw_transaction = rlp.encode(fields + [v, signature.r, signature.s])
+        return raw_transaction, keccak(raw_transaction)
+
+
+class FlashArbitrageTransactions:
+    def __init__(self, arbitrage_address, lender, private_key, chain_id, gas_limit):
+        self.encoder = FlashArbitrageEncoder(lender)
+        self.signer = LegacySigner(private_key, chain_id, arbitrage_address, gas_limit)
+
+    def build(
+        self,
+        nonce,
+        gas_price,
+        loan_amount,
+        dest_token,
+        loan_token,
+        calldata1,
+        calldata2,
+        gas_limit=None,
+    ):
+        # Returns (raw signed transaction, transaction hash)
+        data = self.encoder.encode(
+            loan_amount, dest_token, loan_token, calldata1, calldata2
+        )
+        return self.signer.sign(nonce, gas_price, data, gas_limit=gas_limit)
@@ -0,0 +1,351 @@
+from eth_abi import decode, encode
+from eth_utils import keccak, to_checksum_address
+from scripts.multicall import (
+    AGGREGATE3_RESULT_TYPES,
+    AGGREGATE3_SELECTOR,
+    AGGREGATE3_TYPES,
+    MULTICALL3_ADDRESS,
+    function_selector,
+)
+from scripts.node_client import RPCError
+from scripts.tx_builder import address_word, uint_word
+
+BALANCE_OF_SELECTOR = function_selector("balanceOf(address)")
+ERROR_SELECTOR = function_selector("Error(string)")
+# UniswapV2Pair packs reserve0, reserve1 and blockTimestampLast into slot 8
+V2_RESERVES_SLOT = 8
+# PancakeV3Pool's slot0 takes two slots, its uint32 feeProtocol does not fit
+# after the observation fields, so liquidity sits at slot 5
+V3_SLOT0_SLOT = 0
+V3_LIQUIDITY_SLOT = 5
+# Storage slots tried for a token's balance mapping, solc puts it early
+BALANCE_SLOT_CANDIDATES = range(10)
+BALANCE_PROBE_VALUE = 0xB0B0
+# Tokens probed per eth_call when the balance slots are worked out at boot
+BALANCE_PROBE_BATCH = 100
+
+
+def slot_key(slot):
+    return "0x" + uint_word(slot).hex()
+
+
+def slot_value(value):
+    return "0x" + uint_word(value).hex()
+
+
+def mapping_slot(key_address, slot):
+    # Storage slot of mapping[key_address] for a mapping declared at slot
+    return int.from_bytes(keccak(address_word(key_address) + uint_word(slot)), "big")
+
+
+def reserves_word(reserve0, reserve1, timestamp=0):
+    return reserve0 | reserve1 << 112 | timestamp << 224
+
+
+def slot0_words(sqrt_price_x96, tick, extra):
+    # The two words of a PancakeV3Pool's slot0: the price, tick and observation
+    # fields, then feeProtocol and unlocked
+    index, cardinality, cardinality_next, fee_protocol, unlocked = extra
+    word0 = (
+        sqrt_price_x96
+        | (tick & 0xFFFFFF) << 160
+        | index << 184
+        | cardinality << 200
+        | cardinality_next << 216
+    )
+    return word0, fee_protocol | int(unlocked) << 32
+
+
+def merge_overrides(*overrides):
+    # eth_call takes one entry per account, stateDiffs for the same account
+    # (the loan token is often one of the pair's tokens) are combined
+    merged = {}
+    for override in overrides:
+        for address, fields in override.items():
+            state_diff = merged.setdefault(address, {"stateDiff": {}})["stateDiff"]
+            state_diff.update(fields["stateDiff"])
+    return merged
+
+
+def hex_data(data):
+    return "0x" + bytes(data).hex()
+
+
+def revert_reason(return_data):
+    if return_data[:4] == ERROR_SELECTOR:
+        try:
+            return decode(["string"], return_data[4:])[0]
+        except Exception:
+            pass
+    return "0x" + bytes(return_data).hex()
+
+
+class SimulationCandidate:
+    # One fully built arbitrage: both aggregator legs for one loan size
+    def __init__(self, loan_amount, calldata1, calldata2, expected_amount_out=None):
+        self.loan_amount = loan_amount
+        self.calldata1 = calldata1
+        self.calldata2 = calldata2
+        self.expected_amount_out = expected_amount_out
+
+
+class SimulationResult:
+    def __init__(self, candidate, success, profit=0, gas_used=None, error=None):
+        self.candidate = candidate
+        self.success = success
+        self.profit = profit
+        self.gas_used = gas_used
+        self.error = error
+
+
+class TransactionSimulator:
+    # eth_calls the real executeFlashArbitrage transaction against the pending
+    # block with the victim's swap applied through state overrides.
+    #
+    # The contract sends its profit to the owner and returns nothing, so the
+    # call goes through Multicall3 with the contract's owner slot pointed at
+    # Multicall3: the loan token balance of Multicall3 before and after the
+    # arbitrage is the realised profit.
+    #
+    # Everything goes to the node over HTTP through the node client, the
+    # eth_call and eth_estimateGas of every candidate in one JSON-RPC batch.
+    def __init__(
+        self,
+        node,
+        log,
+        encoder,
+        account_address,
+        arbitrage_address,
+        owner_slot=0,
+        multicall_address=MULTICALL3_ADDRESS,
+    ):
+        self.node = node
+        self.log = log
+        self.encoder = encoder
+        self.account_address = to_checksum_address(account_address)
+        self.arbitrage_address = to_checksum_address(arbitrage_address)
+        self.owner_slot = owner_slot
+        self.multicall_address = to_checksum_address(multicall_address)
+        # Token -> storage slot of its balance mapping, None when not found
+        self.balance_slots = {}
+
+    def probe_request(self, tokens):
+        # One eth_call reading balanceOf(Multicall3) on every token, with a
+        # different marker written to Multicall3's entry of each candidate
+        # mapping slot: the marker read back names the slot. The entries are
+        # hashed locations, so overriding all of them at once is harmless.
+        override = {
+            token: {
+                "stateDiff": {
+                    slot_key(mapping_slot(self.multicall_address, slot)): slot_value(
+                        BALANCE_PROBE_VALUE + slot
+                    )
+                    for slot in BALANCE_SLOT_CANDIDATES
+                }
+            }
+            for token in tokens
+        }
+        data = BALANCE_OF_SELECTOR + address_word(self.multicall_address)
+        multicall_data = AGGREGATE3_SELECTOR + encode(
+            AGGREGATE3_TYPES, [[(token, True, data) for token in tokens]]
+        )
+        return (
+            "eth_call",
+            [
+                {"to": self.multicall_address, "data": hex_data(multicall_data)},
+                "latest",
+                override,
+            ],
+        )
+
+    async def load_balance_slots(self, tokens):
+        # Run at boot for every token a backrun pair can hold, so no victim
+        # waits on a probe. Tokens are probed BALANCE_PROBE_BATCH to an
+        # eth_call, all of the calls in one batch.
+        tokens = sorted({to_checksum_address(token) for token in tokens})
+        chunks = [
+            tokens[index : index + BALANCE_PROBE_BATCH]
+            for index in range(0, len(tokens), BALANCE_PROBE_BATCH)
+        ]
+        try:
+            responses = await self.node.batch(
+                [self.probe_request(chunk) for chunk in chunks]
+            )
+        except Exception as e:
+            self.log.warning(f"Balance slots could not be probed: {e!r}")
+            return self.balance_slots
+        missing = []
+        for chunk, response in zip(chunks, responses):
+            if isinstance(response, RPCError):
+                self.log.warning(f"Balance slot probe failed: {response}")
+                continue
+            (results,) = decode(AGGREGATE3_RESULT_TYPES, bytes.fromhex(response[2:]))
+            for token, (success, return_data) in zip(chunk, results):
+                marker = int.from_bytes(return_data[:32], "big") - BALANCE_PROBE_VALUE
+                if success and marker in BALANCE_SLOT_CANDIDATES:
+                    self.balance_slots[token] = marker
+                else:
+                    self.balance_slots[token] = None
+                    missing.append(token)
+        if missing:
+            self.log.warning(f"No balance slot found for {len(missing)} tokens")
+        return self.balance_slots
+
+    def balance_slot(self, token):
+        return self.balance_slots.get(token)
+
+    def has_balance_slot(self, token):
+        return self.balance_slots.get(token) is not None
+
+    def balance_override(self, token, holder, balance):
+        slot = self.balance_slot(token)
+        if slot is None:
+            return {}
+        return {
+            token: {
+                "stateDiff": {slot_key(mapping_slot(holder, slot)): slot_value(balance)}
+            }
+        }
+
+    def pair_override(self, pair, token0, token1, reserve0, reserve1):
+        # The pair after the victim: reserves and the token balances backing
+        # them, otherwise the pair's K check sees the old balances
+        return merge_overrides(
+            {
+                pair: {
+                    "stateDiff": {
+                        slot_key(V2_RESERVES_SLOT): slot_value(
+                            reserves_word(reserve0, reserve1)
+                        )
+                    }
+                }
+            },
+            self.balance_override(token0, pair, reserve0),
+            self.balance_override(token1, pair, reserve1),
+        )
+
+    def v3_pool_override(self, pool, state):
+        # The pool after the victim: slot0 and the active liquidity. Swaps
+        # check the balance a callback adds, not the pool's whole balance, so
+        # its token balances stay as they are. None for a state that was not
+        # read with all of its slot0.
+        if state.slot0_extra is None:
+            return None
+        word0, word1 = slot0_words(state.sqrt_price_x96, state.tick, state.slot0_extra)
+        return {
+            pool: {
+                "stateDiff": {
+                    slot_key(V3_SLOT0_SLOT): slot_value(word0),
+                    slot_key(V3_SLOT0_SLOT + 1): slot_value(word1),
+                    slot_key(V3_LIQUIDITY_SLOT): slot_value(state.liquidity),
+                }
+            }
+        }
+
+    def owner_override(self):
+        return {
+            self.arbitrage_address: {
+                "stateDiff": {
+                    slot_key(self.owner_slot): slot_value(
+                        int.from_bytes(address_word(self.multicall_address), "big")
+                    )
+                }
+            }
+        }
+
+    def requests(self, candidate, dest_token, loan_token, state_override):
+        # The candidate's profit read through Multicall3, and the gas of the
+        # transaction exactly as it would be signed and sent
+        data = self.encoder.encode(
+            candidate.loan_amount,
+            dest_token,
+            loan_token,
+            candidate.calldata1,
+            candidate.calldata2,
+        )
+        balance_call = (
+            loan_token,
+            False,
+            BALANCE_OF_SELECTOR + address_word(self.multicall_address),
+        )
+        multicall_data = AGGREGATE3_SELECTOR + encode(
+            AGGREGATE3_TYPES,
+            [[balance_call, (self.arbitrage_address, True, data), balance_call]],
+        )
+        return [
+            (
+                "eth_call",
+                [
+                    {
+                        "from": self.account_address,
+                        "to": self.multicall_address,
+                        "data": hex_data(multicall_data),
+                    },
+                    "pending",
+                    merge_overrides(state_override, self.owner_override()),
+                ],
+            ),
+            (
+                "eth_estimateGas",
+                [
+                    {
+                        "from": self.account_address,
+                        "to": self.arbitrage_address,
+                        "data": hex_data(data),
+                    },
+                    "pending",
+                    state_override,
+                ],
+            ),
+        ]
+
+    @staticmethod
+    def result(candidate, call_response, gas_response):
+        if isinstance(call_response, RPCError):
+            return SimulationResult(candidate, False, error=str(call_response))
+        try:
+            (results,) = decode(
+                AGGREGATE3_RESULT_TYPES, bytes.fromhex(call_response[2:])
+            )
+        except Exception as e:
+            return SimulationResult(candidate, False, error=str(e))
+        (_, before), (success, arbitrage_data), (_, after) = results
+        if not success:
+            return SimulationResult(
+                candidate, False, error=revert_reason(arbitrage_data)
+            )
+        profit = int.from_bytes(after[:32], "big") - int.from_bytes(before[:32], "big")
+        if isinstance(gas_response, RPCError):
+            return SimulationResult(candidate, False, profit, error=str(gas_response))
+        return SimulationResult(candidate, True, profit, int(gas_response, 16))
+
+    async def simulate_all(self, candidates, dest_token, loan_token, state_override):
+        # Every loan size at once: one JSON-RPC batch with the eth_call and
+        # eth_estimateGas of each candidate, results in candidate order
+        requests = []
+        for candidate in candidates:
+            requests.extend(
+                self.requests(candidate, dest_token, loan_token, state_override)
+            )
+        try:
+            responses = await self.node.batch(requests)
+        except Exception as e:
+            return [
+                SimulationResult(candidate, False, error=str(e) or type(e).__name__)
+                for candidate in candidates
+            ]
+        return [
+            self.result(candidate, call_response, gas_response)
+            for candidate, call_response, gas_response in zip(
+                candidates, responses[0::2], responses[1::2]
+            )
+        ]
+
+    @staticmethod
+    def best(results, min_profit):
+        profitable = [
+            result
+            for result in results
+            if result.success and result.profit > min_profit
+        ]
+        return max(profitable, key=lambda result: result.profit, default=None)
@@ -0,0 +1,197 @@
+from scripts.token_registry import checksum_address
+
+# execute(bytes commands, bytes[] inputs, uint256 deadline) and the variant
+# without a deadline
+EXECUTE_SELECTORS = (bytes.fromhex("3593564c"), bytes.fromhex("24856bc3"))
+# The low 6 bits of a command byte are its type, the top bit allows a revert
+COMMAND_TYPE_MASK = 0x3F
+V3_SWAP_EXACT_IN = 0x00
+V3_SWAP_EXACT_OUT = 0x01
+V2_SWAP_EXACT_IN = 0x08
+V2_SWAP_EXACT_OUT = 0x09
+WRAP_ETH = 0x0B
+UNWRAP_WETH = 0x0C
+COMMAND_NAMES = {
+    V3_SWAP_EXACT_IN: "V3_SWAP_EXACT_IN",
+    V3_SWAP_EXACT_OUT: "V3_SWAP_EXACT_OUT",
+    V2_SWAP_EXACT_IN: "V2_SWAP_EXACT_IN",
+    V2_SWAP_EXACT_OUT: "V2_SWAP_EXACT_OUT",
+    WRAP_ETH: "WRAP_ETH",
+    UNWRAP_WETH: "UNWRAP_WETH",
+}
+# Head words of each command's inputs: (address recipient, uint256 amount)
+# for wraps, then uint256 limit, the path offset and bool payerIsUser for swaps
+HEAD_WORDS = {
+    V3_SWAP_EXACT_IN: 5,
+    V3_SWAP_EXACT_OUT: 5,
+    V2_SWAP_EXACT_IN: 5,
+    V2_SWAP_EXACT_OUT: 5,
+    WRAP_ETH: 2,
+    UNWRAP_WETH: 2,
+}
+# An amount of 2**255 spends whatever the router holds at that point
+CONTRACT_BALANCE = 1 << 255
+# A V3 path is token (20 bytes) then fee (3 bytes) and token for every hop
+ADDRESS_LENGTH = 20
+FEE_LENGTH = 3
+
+
+def read_word(data, offset):
+    end = offset + 32
+    if end > len(data):
+        raise ValueError(f"Calldata ends before offset {end}")
+    return int.from_bytes(data[offset:end], "big")
+
+
+def read_words(data, offset, count):
+    end = offset + 32 * count
+    if end > len(data):
+        raise ValueError(f"Calldata ends before offset {end}")
+    return [
+        int.from_bytes(data[start : start + 32], "big")
+        for start in range(offset, end, 32)
+    ]
+
+
+def read_address(data, offset):
+    return checksum_address("0x" + data[offset + 12 : offset + 32].hex())
+
+
+def read_bytes(data, offset):
+    # (start, end) of a dynamic bytes value whose length word is at offset
+    length = read_word(data, offset)
+    start = offset + 32
+    if start + length > len(data):
+        raise ValueError(f"Calldata ends before offset {start + length}")
+    return start, start + length
+
+
+def read_address_array(data, offset):
+    length = read_word(data, offset)
+    if offset + 32 * (length + 1) > len(data):
+        raise ValueError(f"Calldata ends before offset {offset + 32 * (length + 1)}")
+    return [read_address(data, offset + 32 * (index + 1)) for index in range(length)]
+
+
+def read_v3_path(data, start, end):
+    # ([token, ...], [fee, ...]) of a packed V3 path
+    hop_length = ADDRESS_LENGTH + FEE_LENGTH
+    if end - start < ADDRESS_LENGTH or (end - start - ADDRESS_LENGTH) % hop_length:
+        raise ValueError("Malformed V3 path")
+    tokens = []
+    fees = []
+    offset = start
+    while True:
+        tokens.append(
+            checksum_address("0x" + data[offset : offset + ADDRESS_LENGTH].hex())
+        )
+        offset += ADDRESS_LENGTH
+        if offset == end:
+            return tokens, fees
+        fees.append(int.from_bytes(data[offset : offset + FEE_LENGTH], "big"))
+        offset += FEE_LENGTH
+
+
+class SwapLeg:
+    # One command of an execute call, normalized like the V2 router swaps:
+    # arguments holds amountIn when the input is known, amountOutMin or
+    # amountOut, and the path from the input token to the output token. V3
+    # legs also carry the fee of each hop. Wraps and unwraps have an empty
+    # path and their amount as amountIn.
+    __slots__ = (
+        "command",
+        "name",
+        "version",
+        "exact_input",
+        "payer_is_user",
+        "arguments",
+        "fees",
+    )
+
+    def __init__(
+        self, command, version, exact_input, payer_is_user, arguments, fees=None
+    ):
+        self.command = command
+        self.name = COMMAND_NAMES[command]
+        self.version = version
+        self.exact_input = exact_input
+        self.payer_is_user = payer_is_user
+        self.arguments = arguments
+        self.fees = fees
+
+    @property
+    def is_swap(self):
+        return self.version is not None
+
+
+def decode_command(command, data, start):
+    head = read_words(data, start, HEAD_WORDS[command])
+    if command in (WRAP_ETH, UNWRAP_WETH):
+        return SwapLeg(command, None, True, False, {"amountIn": head[1], "path": []})
+    _, amount, limit, path_offset, payer_is_user = head
+    path_offset += start
+    payer_is_user = payer_is_user != 0
+    exact_input = command in (V3_SWAP_EXACT_IN, V2_SWAP_EXACT_IN)
+    fees = None
+    if command in (V2_SWAP_EXACT_IN, V2_SWAP_EXACT_OUT):
+        version = 2
+        path = read_address_array(data, path_offset)
+    else:
+        version = 3
+        path, fees = read_v3_path(data, *read_bytes(data, path_offset))
+        if not exact_input:
+            # Exact output paths are encoded from the output token back
+            path.reverse()
+            fees.reverse()
+    if exact_input:
+        arguments = {"amountIn": amount, "amountOutMin": limit, "path": path}
+    else:
+        arguments = {"amountOut": amount, "amountInMax": limit, "path": path}
+    return SwapLeg(command, version, exact_input, payer_is_user, arguments, fees)
+
+
+def decode_execute(data, value=0):
+    # Walks the commands of an execute call and yields a SwapLeg for each swap,
+    # wrap and unwrap, reading only their fixed head words and paths; any
+    # other command is skipped without being decoded. value is the native
+    # amount sent, which a wrap of the whole balance passes on to the swaps.
+    # Raises ValueError on calldata that is not an execute call.
+    if len(data) < 4 or bytes(data[:4]) not in EXECUTE_SELECTORS:
+        raise ValueError("Not a Universal Router execute call")
+    data = bytes(data[4:])
+    commands_offset, inputs_offset = read_words(data, 0, 2)
+    commands_start, commands_end = read_bytes(data, commands_offset)
+    commands = data[commands_start:commands_end]
+    # Offsets of the inputs are relative to the first one
+    inputs_start = inputs_offset + 32
+    input_offsets = read_words(data, inputs_offset, len(commands) + 1)
+    if input_offsets[0] != len(commands):
+        raise ValueError("Commands and inputs differ in length")
+    # What the router holds of the wrapped native token, while it is known
+    balance = None
+    for index, command in enumerate(commands):
+        command &= COMMAND_TYPE_MASK
+        if command not in COMMAND_NAMES:
+            continue
+        start, _ = read_bytes(data, inputs_start + input_offsets[index + 1])
+        leg = decode_command(command, data, start)
+        arguments = leg.arguments
+        if command == WRAP_ETH:
+            amount = arguments["amountIn"]
+            balance = value if amount == CONTRACT_BALANCE else amount
+            arguments["amountIn"] = balance
+        elif leg.is_swap and not leg.payer_is_user:
+            amount = arguments.get("amountIn")
+            if amount == CONTRACT_BALANCE:
+                amount = balance
+                balance = None
+            elif amount is not None and balance is not None:
+                balance = max(balance - amount, 0)
+            else:
+                balance = None
+            # A zero input spends tokens sent to the pair by an earlier leg
+            if amount:
+                arguments["amountIn"] = amount
+            else:
+                arguments.pop("amountIn", None)
+        yield leg
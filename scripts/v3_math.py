@@ -0,0 +1,393 @@
+from functools import lru_cache
+
+# Integer ports of the Uniswap V3 core libraries PancakeSwap V3 inherits
+# (TickMath, SqrtPriceMath, SwapMath and the swap loop of the pool), so a
+# local quote matches the pool to the wei.
+MIN_TICK = -887272
+MAX_TICK = 887272
+MIN_SQRT_RATIO = 4295128739
+MAX_SQRT_RATIO = 1461446703485210103287273052203988822378723970342
+Q96 = 1 << 96
+MAX_UINT256 = (1 << 256) - 1
+FEE_DENOMINATOR = 1000000
+# PancakeSwap V3 fee tiers, in hundredths of a basis point, and tick spacings
+FEE_TIERS = {100: 1, 500: 10, 2500: 50, 10000: 200}
+
+# getSqrtRatioAtTick multiplies these in for each bit set in |tick|
+TICK_RATIO_FACTORS = (
+    (0x2, 0xFFF97272373D413259A46990580E213A),
+    (0x4, 0xFFF2E50F5F656932EF12357CF3C7FDCC),
+    (0x8, 0xFFE5CACA7E10E4E61C3624EAA0941CD0),
+    (0x10, 0xFFCB9843D60F6159C9DB58835C926644),
+    (0x20, 0xFF973B41FA98C081472E6896DFB254C0),
+    (0x40, 0xFF2EA16466C96A3843EC78B326B52861),
+    (0x80, 0xFE5DEE046A99A2A811C461F1969C3053),
+    (0x100, 0xFCBE86C7900A88AEDCFFC83B479AA3A4),
+    (0x200, 0xF987A7253AC413176F2B074CF7815E54),
+    (0x400, 0xF3392B0822B70005940C7A398E4B70F3),
+    (0x800, 0xE7159475A2C29B7443B29C7FA6E889D9),
+    (0x1000, 0xD097F3BDFD2022B8845AD8F792AA5825),
+    (0x2000, 0xA9F746462D870FDF8A65DC1F90E061E5),
+    (0x4000, 0x70D869A156D2A1B890BB3DF62BAF32F7),
+    (0x8000, 0x31BE135F97D08FD981231505542FCFA6),
+    (0x10000, 0x9AA508B5B7A84E1C677DE54F3E99BC9),
+    (0x20000, 0x5D6AF8DEDB81196699C329225EE604),
+    (0x40000, 0x2216E584F5FA1EA926041BEDFE98),
+    (0x80000, 0x48A170391F7DC42444E8FA2),
+)
+
+
+def mul_div(a, b, denominator):
+    return a * b // denominator
+
+
+def mul_div_rounding_up(a, b, denominator):
+    return -(-a * b // denominator)
+
+
+def div_rounding_up(a, b):
+    return -(-a // b)
+
+
+@lru_cache(maxsize=8192)
+def get_sqrt_ratio_at_tick(tick):
+    absolute_tick = abs(tick)
+    if absolute_tick > MAX_TICK:
+        raise ValueError("T")
+    ratio = (
+        0xFFFCB933BD6FAD37AA2D162D1A594001
+        if absolute_tick & 0x1
+        else 0x100000000000000000000000000000000
+    )
+    for bit, factor in TICK_RATIO_FACTORS:
+        if absolute_tick & bit:
+            ratio = (ratio * factor) >> 128
+    if tick > 0:
+        ratio = MAX_UINT256 // ratio
+    # Q128.128 to Q64.96, rounding up
+    return (ratio >> 32) + (0 if ratio % (1 << 32) == 0 else 1)
+
+
+def get_tick_at_sqrt_ratio(sqrt_price_x96):
+    # The greatest tick whose ratio is at most sqrt_price_x96, as the contract's
+    # log2 approximation computes it; a search over the exact inverse gives the
+    # same tick.
+    if not MIN_SQRT_RATIO <= sqrt_price_x96 < MAX_SQRT_RATIO:
+        raise ValueError("R")
+    low, high = MIN_TICK, MAX_TICK
+    while low < high:
+        middle = (low + high + 1) >> 1
+        if get_sqrt_ratio_at_tick(middle) <= sqrt_price_x96:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+def get_next_sqrt_price_from_amount0_rounding_up(sqrt_price, liquidity, amount, add):
+    if amount == 0:
+        return sqrt_price
+    numerator1 = liquidity << 96
+    product = amount * sqrt_price
+    if add:
+        denominator = numerator1 + product
+        return mul_div_rounding_up(numerator1, sqrt_price, denominator)
+    if numerator1 <= product:
+        raise ValueError("INSUFFICIENT_LIQUIDITY")
+    return mul_div_rounding_up(numerator1, sqrt_price, numerator1 - product)
+
+
+def get_next_sqrt_price_from_amount1_rounding_down(sqrt_price, liquidity, amount, add):
+    if add:
+        return sqrt_price + (amount << 96) // liquidity
+    quotient = div_rounding_up(amount << 96, liquidity)
+    if sqrt_price <= quotient:
+        raise ValueError("INSUFFICIENT_LIQUIDITY")
+    return sqrt_price - quotient
+
+
+def get_next_sqrt_price_from_input(sqrt_price, liquidity, amount_in, zero_for_one):
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount0_rounding_up(
+            sqrt_price, liquidity, amount_in, True
+        )
+    return get_next_sqrt_price_from_amount1_rounding_down(
+        sqrt_price, liquidity, amount_in, True
+    )
+
+
+def get_next_sqrt_price_from_output(sqrt_price, liquidity, amount_out, zero_for_one):
+    if zero_for_one:
+        return get_next_sqrt_price_from_amount1_rounding_down(
+            sqrt_price, liquidity, amount_out, False
+        )
+    return get_next_sqrt_price_from_amount0_rounding_up(
+        sqrt_price, liquidity, amount_out, False
+    )
+
+
+def get_amount0_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity, round_up):
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    numerator1 = liquidity << 96
+    numerator2 = sqrt_ratio_b - sqrt_ratio_a
+    if round_up:
+        return div_rounding_up(
+            mul_div_rounding_up(numerator1, numerator2, sqrt_ratio_b), sqrt_ratio_a
+        )
+    return mul_div(numerator1, numerator2, sqrt_ratio_b) // sqrt_ratio_a
+
+
+def get_amount1_delta(sqrt_ratio_a, sqrt_ratio_b, liquidity, round_up):
+    if sqrt_ratio_a > sqrt_ratio_b:
+        sqrt_ratio_a, sqrt_ratio_b = sqrt_ratio_b, sqrt_ratio_a
+    if round_up:
+        return mul_div_rounding_up(liquidity, sqrt_ratio_b - sqrt_ratio_a, Q96)
+    return mul_div(liquidity, sqrt_ratio_b - sqrt_ratio_a, Q96)
+
+
+def compute_swap_step(sqrt_price, sqrt_price_target, liquidity, amount_remaining, fee):
+    # One step of a swap towards sqrt_price_target, a positive amount_remaining
+    # is an exact input and a negative one an exact output. Returns
+    # (next sqrt price, amount in, amount out, fee amount).
+    zero_for_one = sqrt_price >= sqrt_price_target
+    exact_in = amount_remaining >= 0
+    if exact_in:
+        amount_remaining_less_fee = mul_div(
+            amount_remaining, FEE_DENOMINATOR - fee, FEE_DENOMINATOR
+        )
+        if zero_for_one:
+            amount_in = get_amount0_delta(
+                sqrt_price_target, sqrt_price, liquidity, True
+            )
+        else:
+            amount_in = get_amount1_delta(
+                sqrt_price, sqrt_price_target, liquidity, True
+            )
+        if amount_remaining_less_fee >= amount_in:
+            sqrt_price_next = sqrt_price_target
+        else:
+            sqrt_price_next = get_next_sqrt_price_from_input(
+                sqrt_price, liquidity, amount_remaining_less_fee, zero_for_one
+            )
+    else:
+        if zero_for_one:
+            amount_out = get_amount1_delta(
+                sqrt_price_target, sqrt_price, liquidity, False
+            )
+        else:
+            amount_out = get_amount0_delta(
+                sqrt_price, sqrt_price_target, liquidity, False
+            )
+        if -amount_remaining >= amount_out:
+            sqrt_price_next = sqrt_price_target
+        else:
+            sqrt_price_next = get_next_sqrt_price_from_output(
+                sqrt_price, liquidity, -amount_remaining, zero_for_one
+            )
+
+    reached_target = sqrt_price_target == sqrt_price_next
+    if zero_for_one:
+        if not (reached_target and exact_in):
+            amount_in = get_amount0_delta(sqrt_price_next, sqrt_price, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = get_amount1_delta(
+                sqrt_price_next, sqrt_price, liquidity, False
+            )
+    else:
+        if not (reached_target and exact_in):
+            amount_in = get_amount1_delta(sqrt_price, sqrt_price_next, liquidity, True)
+        if not (reached_target and not exact_in):
+            amount_out = get_amount0_delta(
+                sqrt_price, sqrt_price_next, liquidity, False
+            )
+
+    if not exact_in and amount_out > -amount_remaining:
+        amount_out = -amount_remaining
+    if exact_in and sqrt_price_next != sqrt_price_target:
+        # Whatever is left of the input after the step is the fee
+        fee_amount = amount_remaining - amount_in
+    else:
+        fee_amount = mul_div_rounding_up(amount_in, fee, FEE_DENOMINATOR - fee)
+    return sqrt_price_next, amount_in, amount_out, fee_amount
+
+
+class PoolState:
+    # What a swap reads from a V3 pool: slot0, the active liquidity and the
+    # initialized ticks. The tick bitmap is kept word by word as the pool
+    # stores it, and only the words that were loaded are known; a swap that
+    # would leave them raises instead of guessing.
+    def __init__(self, sqrt_price_x96, tick, liquidity, fee, tick_spacing=None):
+        self.sqrt_price_x96 = sqrt_price_x96
+        self.tick = tick
+        self.liquidity = liquidity
+        self.fee = fee
+        self.tick_spacing = tick_spacing if tick_spacing is not None else FEE_TIERS[fee]
+        self.bitmap = {}
+        # tick -> [liquidity gross, liquidity net]
+        self.ticks = {}
+        # Chain position (block number, log index) the state reflects
+        self.position = (0, 0)
+        # The slot0 fields a swap does not read (observation index,
+        # cardinality, next cardinality, fee protocol and unlocked), kept to
+        # write all of slot0 into a state override
+        self.slot0_extra = None
+
+    def word_position(self, tick):
+        return (tick // self.tick_spacing) >> 8
+
+    def set_word(self, word_position, word):
+        self.bitmap[word_position] = word
+
+    def set_tick(self, tick, liquidity_gross, liquidity_net):
+        self.ticks[tick] = [liquidity_gross, liquidity_net]
+
+    def flip_tick(self, tick):
+        compressed = tick // self.tick_spacing
+        word_position = compressed >> 8
+        self.bitmap[word_position] ^= 1 << (compressed & 0xFF)
+
+    def update_position(self, tick_lower, tick_upper, liquidity_delta):
+        # Mint (positive) or Burn (negative) of liquidity_delta on a range
+        for tick, upper in ((tick_lower, False), (tick_upper, True)):
+            if self.word_position(tick) not in self.bitmap:
+                continue
+            gross, net = self.ticks.get(tick, (0, 0))
+            gross_after = gross + liquidity_delta
+            net_after = net - liquidity_delta if upper else net + liquidity_delta
+            if (gross == 0) != (gross_after == 0):
+                self.flip_tick(tick)
+            if gross_after == 0:
+                self.ticks.pop(tick, None)
+            else:
+                self.ticks[tick] = [gross_after, net_after]
+        if tick_lower <= self.tick < tick_upper:
+            self.liquidity += liquidity_delta
+
+    def next_initialized_tick_within_one_word(self, tick, lte):
+        compressed = tick // self.tick_spacing
+        if not lte:
+            compressed += 1
+        word_position = compressed >> 8
+        bit_position = compressed & 0xFF
+        word = self.bitmap.get(word_position)
+        if word is None:
+            raise ValueError(f"Tick bitmap word {word_position} is not cached")
+        if lte:
+            masked = word & ((1 << (bit_position + 1)) - 1)
+            if masked:
+                next_compressed = compressed - (
+                    bit_position - (masked.bit_length() - 1)
+                )
+                return next_compressed * self.tick_spacing, True
+            return (compressed - bit_position) * self.tick_spacing, False
+        masked = word & ~((1 << bit_position) - 1) & ((1 << 256) - 1)
+        if masked:
+            least_significant_bit = (masked & -masked).bit_length() - 1
+            next_compressed = compressed + (least_significant_bit - bit_position)
+            return next_compressed * self.tick_spacing, True
+        return (compressed + (255 - bit_position)) * self.tick_spacing, False
+
+    def swap(self, zero_for_one, amount_specified, sqrt_price_limit_x96=None):
+        # The pool's swap loop without touching the state. A positive
+        # amount_specified is an exact input. Returns (amount0, amount1) from
+        # the pool's side: positive is paid in, negative paid out.
+        amount0, amount1, _ = self.run_swap(
+            zero_for_one, amount_specified, sqrt_price_limit_x96
+        )
+        return amount0, amount1
+
+    def swap_state(self, zero_for_one, amount_specified):
+        # The swap applied to a copy of the state, as the victim's swap leaves
+        # the pool for the backrun. Returns (amount in, amount out, state
+        # after), or raises where the pool would not fill the whole amount.
+        amount0, amount1, (sqrt_price, tick, liquidity) = self.run_swap(
+            zero_for_one, amount_specified, exact_tick=True
+        )
+        amount_in, amount_out = (
+            (amount0, -amount1) if zero_for_one else (amount1, -amount0)
+        )
+        if (amount_in if amount_specified > 0 else amount_out) < abs(amount_specified):
+            raise ValueError("SPL")
+        state = PoolState(sqrt_price, tick, liquidity, self.fee, self.tick_spacing)
+        # A swap leaves the ticks as they are, Mint and Burn replace entries
+        state.bitmap = dict(self.bitmap)
+        state.ticks = dict(self.ticks)
+        state.position = self.position
+        state.slot0_extra = self.slot0_extra
+        return amount_in, amount_out, state
+
+    def run_swap(
+        self,
+        zero_for_one,
+        amount_specified,
+        sqrt_price_limit_x96=None,
+        exact_tick=False,
+    ):
+        # Returns (amount0, amount1, (sqrt price, tick, liquidity) after it)
+        if amount_specified == 0:
+            raise ValueError("AS")
+        if sqrt_price_limit_x96 is None:
+            sqrt_price_limit_x96 = (
+                MIN_SQRT_RATIO + 1 if zero_for_one else MAX_SQRT_RATIO - 1
+            )
+        exact_input = amount_specified > 0
+        amount_remaining = amount_specified
+        amount_calculated = 0
+        sqrt_price = self.sqrt_price_x96
+        tick = self.tick
+        liquidity = self.liquidity
+        while amount_remaining != 0 and sqrt_price != sqrt_price_limit_x96:
+            sqrt_price_start = sqrt_price
+            tick_next, initialized = self.next_initialized_tick_within_one_word(
+                tick, zero_for_one
+            )
+            tick_next = min(max(tick_next, MIN_TICK), MAX_TICK)
+            sqrt_price_next = get_sqrt_ratio_at_tick(tick_next)
+            if (
+                sqrt_price_next < sqrt_price_limit_x96
+                if zero_for_one
+                else sqrt_price_next > sqrt_price_limit_x96
+            ):
+                sqrt_price_target = sqrt_price_limit_x96
+            else:
+                sqrt_price_target = sqrt_price_next
+            sqrt_price, amount_in, amount_out, fee_amount = compute_swap_step(
+                sqrt_price, sqrt_price_target, liquidity, amount_remaining, self.fee
+            )
+            if exact_input:
+                amount_remaining -= amount_in + fee_amount
+                amount_calculated -= amount_out
+            else:
+                amount_remaining += amount_out
+                amount_calculated += amount_in + fee_amount
+            if sqrt_price == sqrt_price_next:
+                if initialized:
+                    tick_info = self.ticks.get(tick_next)
+                    if tick_info is None:
+                        raise ValueError(f"Tick {tick_next} is not cached")
+                    liquidity_net = tick_info[1]
+                    liquidity += -liquidity_net if zero_for_one else liquidity_net
+                tick = tick_next - 1 if zero_for_one else tick_next
+            elif exact_tick and sqrt_price != sqrt_price_start:
+                # A step that stopped short used up the amount or hit the
+                # limit, so only the state after the swap reads this tick
+                tick = get_tick_at_sqrt_ratio(sqrt_price)
+        after = (sqrt_price, tick, liquidity)
+        if zero_for_one == exact_input:
+            return amount_specified - amount_remaining, amount_calculated, after
+        return amount_calculated, amount_specified - amount_remaining, after
+
+    def get_amount_out(self, amount_in, zero_for_one):
+        amount0, amount1 = self.swap(zero_for_one, amount_in)
+        amount_out = -(amount1 if zero_for_one else amount0)
+        if (amount0 if zero_for_one else amount1) < amount_in:
+            # The price limit stopped the swap before the input was used up
+            raise ValueError("SPL")
+        return amount_out
+
+    def get_amount_in(self, amount_out, zero_for_one):
+        amount0, amount1 = self.swap(zero_for_one, -amount_out)
+        if -(amount1 if zero_for_one else amount0) < amount_out:
+            raise ValueError("SPL")
+        return amount0 if zero_for_one else amount1
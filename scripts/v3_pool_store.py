@@ -0,0 +1,185 @@
+import asyncio
+from web3 import Web3
+from scripts.multicall import (
+    block_number_call,
+    liquidity_call,
+    slot0_call,
+    tick_bitmap_call,
+    ticks_call,
+)
+from scripts.reserve_store import LogWatcher
+from scripts.v3_math import PoolState
+
+# PancakeSwap V3 adds the protocol fees to Swap, Uniswap V3 forks do not; the
+# fields read here sit at the same offsets in both
+PANCAKE_SWAP_TOPIC = Web3.keccak(
+    text="Swap(address,address,int256,int256,uint160,uint128,int24,uint128,uint128)"
+)
+SWAP_TOPIC = Web3.keccak(
+    text="Swap(address,address,int256,int256,uint160,uint128,int24)"
+)
+MINT_TOPIC = Web3.keccak(
+    text="Mint(address,address,int24,int24,uint128,uint256,uint256)"
+)
+BURN_TOPIC = Web3.keccak(text="Burn(address,int24,int24,uint128,uint256,uint256)")
+# Later than any log of the block a snapshot was read at
+END_OF_BLOCK = 1 << 32
+
+
+def word(data, index):
+    return int.from_bytes(data[32 * index : 32 * (index + 1)], "big", signed=True)
+
+
+class V3PoolStore(LogWatcher):
+    # slot0, liquidity and the initialized ticks around the price of every V3
+    # pool the bot has priced. A pool is read once, at one block, and kept up
+    # to date from its Swap, Mint and Burn logs from there on.
+    topics = [
+        [
+            PANCAKE_SWAP_TOPIC.hex(),
+            SWAP_TOPIC.hex(),
+            MINT_TOPIC.hex(),
+            BURN_TOPIC.hex(),
+        ]
+    ]
+    name = "V3 pool store"
+
+    def __init__(self, ws_url, log, multicall, node=None, words=2):
+        super().__init__(ws_url, log, node)
+        self.multicall = multicall
+        # Bitmap words loaded on each side of the current one
+        self.words = words
+        self.pools = {}
+        # Pools that are not deployed, so they are not read again
+        self.absent = set()
+        self.lock = asyncio.Lock()
+
+    def get(self, pool):
+        return self.pools.get(pool)
+
+    async def load(self, pools):
+        # {pool: PoolState or None} for [(pool, fee)], reading the ones not
+        # cached yet
+        async with self.lock:
+            cold = [
+                (pool, fee)
+                for pool, fee in pools
+                if pool not in self.pools and pool not in self.absent
+            ]
+            if cold:
+                # On the loop thread, the websocket provider is not safe to
+                # share with worker threads
+                block_number, states, failed = self.read(cold)
+                for pool, _ in cold:
+                    state = states.get(pool)
+                    if state is None:
+                        # A pool that was not read in full is tried again
+                        if pool not in failed:
+                            self.absent.add(pool)
+                        continue
+                    self.pools[pool] = state
+                    self.watch(pool)
+                # Logs since the snapshot block are replayed once the pools
+                # are subscribed, those of that block are in the snapshot
+                if block_number is not None:
+                    self.replay_from(block_number + 1)
+        return {pool: self.pools.get(pool) for pool, _ in pools}
+
+    def read(self, pools):
+        # Three multicalls pinned to one block: slot0 and liquidity, the bitmap
+        # words around the price, then the initialized ticks in them. Returns
+        # the block, the states read and the pools left out because a read
+        # they need failed.
+        calls = [block_number_call(self.multicall.address)]
+        for pool, _ in pools:
+            calls.append(slot0_call(pool))
+            calls.append(liquidity_call(pool))
+        results = self.multicall.aggregate(calls)
+        if results[0] is None:
+            # Nothing to pin the reads to, every pool is tried again later
+            self.log.warning("Could not read the block number for V3 pools")
+            return None, {}, {pool for pool, _ in pools}
+        block_number = results[0][0]
+        states = {}
+        for index, (pool, fee) in enumerate(pools):
+            slot0 = results[1 + 2 * index]
+            liquidity = results[2 + 2 * index]
+            if slot0 is None or liquidity is None or slot0[0] == 0:
+                continue
+            state = PoolState(slot0[0], slot0[1], liquidity[0], fee)
+            state.slot0_extra = tuple(slot0[2:])
+            state.position = (block_number, END_OF_BLOCK)
+            states[pool] = state
+
+        words = []
+        for pool, state in states.items():
+            center = state.word_position(state.tick)
+            for word_position in range(center - self.words, center + self.words + 1):
+                words.append((pool, word_position))
+        results = self.multicall.aggregate(
+            [tick_bitmap_call(pool, word_position) for pool, word_position in words],
+            block_number,
+        )
+        ticks = []
+        for (pool, word_position), result in zip(words, results):
+            if result is None:
+                continue
+            state = states[pool]
+            bitmap = result[0]
+            state.set_word(word_position, bitmap)
+            while bitmap:
+                bit = (bitmap & -bitmap).bit_length() - 1
+                bitmap &= bitmap - 1
+                ticks.append((pool, ((word_position << 8) + bit) * state.tick_spacing))
+        results = self.multicall.aggregate(
+            [ticks_call(pool, tick) for pool, tick in ticks], block_number
+        )
+        failed = set()
+        for (pool, tick), result in zip(ticks, results):
+            if result is None:
+                # A swap crossing the tick would have nothing to go on
+                failed.add(pool)
+            elif pool in states:
+                states[pool].set_tick(tick, result[0], result[1])
+        for pool in failed:
+            states.pop(pool, None)
+            self.log.warning(f"Could not read the ticks of V3 pool {pool}")
+        self.log.debug(
+            f"Read {len(states)} V3 pools with {len(ticks)} ticks at block {block_number}"
+        )
+        return block_number, states, failed
+
+    def handle_log(self, entry):
+        block_number = entry["blockNumber"]
+        if self.last_block is None or block_number > self.last_block:
+            self.last_block = block_number
+        pool = entry["address"]
+        state = self.pools.get(pool)
+        position = (block_number, entry["logIndex"])
+        if state is None or position <= state.position:
+            return
+        topic = bytes(entry["topics"][0])
+        data = bytes(entry["data"])
+        if topic in (PANCAKE_SWAP_TOPIC, SWAP_TOPIC):
+            state.sqrt_price_x96 = word(data, 2)
+            state.liquidity = word(data, 3)
+            state.tick = word(data, 4)
+            center = state.word_position(state.tick)
+            if any(
+                word_position not in state.bitmap
+                for word_position in (center - 1, center, center + 1)
+            ):
+                # The price is running out of loaded ticks, read it afresh
+                del self.pools[pool]
+                return
+        elif topic in (MINT_TOPIC, BURN_TOPIC):
+            tick_lower = int.from_bytes(entry["topics"][2], "big", signed=True)
+            tick_upper = int.from_bytes(entry["topics"][3], "big", signed=True)
+            if topic == MINT_TOPIC:
+                # Mint(sender, amount, amount0, amount1) in the data
+                liquidity_delta = word(data, 1)
+            else:
+                # Burn(amount, amount0, amount1) in the data
+                liquidity_delta = -word(data, 0)
+            state.update_position(tick_lower, tick_upper, liquidity_delta)
+        state.position = position
@@ -0,0 +1,82 @@
+from eth_utils import keccak
+from scripts.universal_router import (
+    V3_SWAP_EXACT_IN,
+    V3_SWAP_EXACT_OUT,
+    SwapLeg,
+    read_address,
+    read_bytes,
+    read_v3_path,
+    read_word,
+    read_words,
+)
+
+# ExactInputSingleParams and ExactOutputSingleParams: tokenIn, tokenOut, fee,
+# recipient, deadline, the amount, its limit and sqrtPriceLimitX96
+SINGLE_PARAMS = "(address,address,uint24,address,uint256,uint256,uint256,uint160)"
+# ExactInputParams and ExactOutputParams: path, recipient, deadline, the amount
+# and its limit
+PATH_PARAMS = "(bytes,address,uint256,uint256,uint256)"
+
+
+def selector(signature):
+    return keccak(text=signature)[:4]
+
+
+# The V3 SwapRouter swaps we can back-run: (command they act as, single pool)
+SWAP_SELECTORS = {
+    selector(f"exactInputSingle({SINGLE_PARAMS})"): (V3_SWAP_EXACT_IN, True),
+    selector(f"exactOutputSingle({SINGLE_PARAMS})"): (V3_SWAP_EXACT_OUT, True),
+    selector(f"exactInput({PATH_PARAMS})"): (V3_SWAP_EXACT_IN, False),
+    selector(f"exactOutput({PATH_PARAMS})"): (V3_SWAP_EXACT_OUT, False),
+}
+# multicall(bytes[] data) and the variant with a deadline first
+MULTICALL_SELECTORS = {
+    selector("multicall(bytes[])"): 0,
+    selector("multicall(uint256,bytes[])"): 1,
+}
+
+
+def decode_swap(command, single, data):
+    # A SwapLeg like the Universal Router's V3 commands, data without selector
+    exact_input = command == V3_SWAP_EXACT_IN
+    if single:
+        fee, _, _, amount, limit, _ = read_words(data, 64, 6)
+        path = [read_address(data, 0), read_address(data, 32)]
+        fees = [fee]
+    else:
+        start = read_word(data, 0)
+        path_offset, _, _, amount, limit = read_words(data, start, 5)
+        path, fees = read_v3_path(data, *read_bytes(data, start + path_offset))
+        if not exact_input:
+            # Exact output paths are encoded from the output token back
+            path.reverse()
+            fees.reverse()
+    if exact_input:
+        arguments = {"amountIn": amount, "amountOutMin": limit, "path": path}
+    else:
+        arguments = {"amountOut": amount, "amountInMax": limit, "path": path}
+    return SwapLeg(command, 3, exact_input, True, arguments, fees)
+
+
+def decode_swap_router(data):
+    # Yields a SwapLeg for each swap of a V3 SwapRouter call, looking into
+    # multicall for the swaps it bundles with permits, refunds and unwraps.
+    # Any other call yields nothing. Raises ValueError on malformed calldata.
+    data = bytes(data)
+    swap = SWAP_SELECTORS.get(data[:4])
+    if swap is not None:
+        yield decode_swap(*swap, data[4:])
+        return
+    head = MULTICALL_SELECTORS.get(data[:4])
+    if head is None:
+        return
+    data = data[4:]
+    calls_offset = read_word(data, 32 * head)
+    # Offsets of the calls are relative to the first one
+    calls_start = calls_offset + 32
+    count = read_word(data, calls_offset)
+    for call_offset in read_words(data, calls_start, count):
+        start, end = read_bytes(data, calls_start + call_offset)
+        swap = SWAP_SELECTORS.get(data[start : start + 4])
+        if swap is not None:
+            yield decode_swap(*swap, data[start + 4 : end])
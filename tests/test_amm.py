@@ -0,0 +1,56 @@
+import unittest
+from scripts import amm
+from scripts.amm import FeeTable
+
+
+class TestAmm(unittest.TestCase):
+    def test_get_amount_out_pancakeswap(self):
+        amount_out = amm.get_amount_out(10**18, 100 * 10**18, 200 * 10**18, 25, 10000)
+        self.assertEqual(amount_out, 1975296418228173964)
+
+    def test_get_amount_out_biswap(self):
+        amount_out = amm.get_amount_out(10**18, 100 * 10**18, 200 * 10**18, 1, 1000)
+        self.assertEqual(amount_out, 1978237408291171199)
+
+    def test_get_amount_in_pancakeswap(self):
+        amount_in = amm.get_amount_in(10**18, 100 * 10**18, 200 * 10**18, 25, 10000)
+        self.assertEqual(amount_in, 503771992796060504)
+
+    def test_get_amount_in_covers_amount_out(self):
+        reserve_in = 1234567 * 10**18
+        reserve_out = 7654321 * 10**15
+        for amount_out in (1, 10**6, 10**15, 10**18, 10**21):
+            amount_in = amm.get_amount_in(amount_out, reserve_in, reserve_out)
+            self.assertGreaterEqual(
+                amm.get_amount_out(amount_in, reserve_in, reserve_out), amount_out
+            )
+
+    def test_get_amount_in_exceeds_reserves(self):
+        with self.assertRaises(ValueError):
+            amm.get_amount_in(10**18, 10**18, 10**18)
+
+    def test_get_amount_out_zero_amount(self):
+        with self.assertRaises(ValueError):
+            amm.get_amount_out(0, 10**18, 10**18)
+
+    def test_fee_table(self):
+        fee_table = FeeTable(
+            {
+                "PancakeSwapV2": {"fee": 25, "fee_denominator": 10000},
+                "BiSwapV2": {
+                    "fee": 1,
+                    "fee_denominator": 1000,
+                    "pair_fee_function": "swapFee",
+                },
+            }
+        )
+        self.assertEqual(fee_table.get("PancakeSwapV2"), (25, 10000))
+        self.assertEqual(fee_table.get("BiSwapV2", "0xpair"), (1, 1000))
+        self.assertEqual(fee_table.get_pair_fee_function("BiSwapV2"), ("swapFee", 1000))
+        self.assertIsNone(fee_table.get_pair_fee_function("PancakeSwapV2"))
+        fee_table.set_pair_fee("0xpair", 2, 1000)
+        self.assertEqual(fee_table.get("BiSwapV2", "0xpair"), (2, 1000))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import asyncio
+import unittest
+from math import isqrt
+from unittest.mock import MagicMock, patch
+from scripts import back_runner, simulator
+from scripts.metrics import Metrics
+from scripts.pair_resolver import PairResolver
+from scripts.token_registry import Token, TokenRegistry
+from scripts.tx_simulator import TransactionSimulator, slot_key
+from scripts.v3_math import PoolState, get_tick_at_sqrt_ratio
+
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+ACCOUNT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+ARBITRAGE = "0x31E3d0a099954C285e232387946B4190EEb5EB68"
+V3_DEX = {
+    "factory": "0x0BFbCF9fa4f9C56B0F40a671Ad40E0805A091865",
+    "router": "0x1b81D678ffb9C0263b24A97847620C99d213eB14",
+    "quoter": "0xB048Bbc1Ee6b733FFfCFb9e9CeF7375518e25997",
+    "pool_deployer": "0x41ff9AA7e16B8B1a8a8dc4f0eFacd93D02d071c9",
+    "init_code_hash": "0x6ce8eb472fa82df5469c6ab6d485f17c3ad13c8cd7af59b3d4a8026c5ce0f7e2",
+    "enabled": True,
+}
+
+
+def pool_state():
+    # WBNB/BUSD at 300 in the 0.05% tier, WBNB is token0, with about 1000 WBNB
+    # of virtual liquidity over +-2000 ticks
+    sqrt_price = isqrt(300 * 2**192)
+    tick = get_tick_at_sqrt_ratio(sqrt_price)
+    state = PoolState(sqrt_price, tick, 0, 500)
+    tick_lower = (tick - 2000) // 10 * 10
+    tick_upper = (tick + 2000) // 10 * 10
+    for word_position in range(
+        state.word_position(tick_lower) - 1, state.word_position(tick_upper) + 2
+    ):
+        state.set_word(word_position, 0)
+    state.update_position(tick_lower, tick_upper, 1000 * 10**18 * sqrt_price >> 96)
+    state.slot0_extra = (0, 1, 1, 0, True)
+    return state
+
+
+class StubPools:
+    def __init__(self, states):
+        self.states = states
+        self.loaded = []
+
+    async def load(self, pools):
+        self.loaded.append(pools)
+        return {pool: self.states.get(pool) for pool, _ in pools}
+
+
+class TestV3Victims(unittest.TestCase):
+    def setUp(self):
+        self.registry = TokenRegistry()
+        self.registry.add(Token("WBNB", {"address": WBNB, "decimals": 18}, vault=WBNB))
+        self.dex = back_runner.Dex("PancakeSwapV3", V3_DEX)
+        resolver = PairResolver()
+        resolver.add_pool_deployer(
+            self.dex.name, V3_DEX["pool_deployer"], V3_DEX["init_code_hash"]
+        )
+        self.pool, _ = resolver.resolve_pool(self.dex.name, WBNB, BUSD, 500)
+        self.state = pool_state()
+        self.fetcher = MagicMock()
+        self.fetcher.pair_resolver = resolver
+        self.fetcher.v3_pools = StubPools({self.pool: self.state})
+        self.metrics = Metrics()
+        patcher = patch.multiple(
+            back_runner,
+            fetcher=self.fetcher,
+            token_registry=self.registry,
+            metrics=self.metrics,
+            transaction_simulator=TransactionSimulator(
+                None, MagicMock(), None, ACCOUNT, ARBITRAGE
+            ),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def victim(self, path, fees, amount_in=10 * 10**18):
+        transaction = back_runner.Decoded_Transaction(None, None, b"\1" * 32, 10**9)
+        transaction.path = [self.registry.token(address) for address in path]
+        transaction.fees = fees
+        transaction.amount_in = amount_in
+        transaction.amount_out = 1
+        return transaction
+
+    def test_victim_pool_is_the_pool_after_the_swap(self):
+        # The victim sells BUSD for WBNB, WBNB is the loan token
+        [opportunity] = asyncio.run(
+            back_runner.simulate_victim_v3(
+                self.dex, self.victim([BUSD, WBNB], [500], 3000 * 10**18)
+            )
+        )
+        self.assertEqual(self.fetcher.v3_pools.loaded, [[(self.pool, 500)]])
+        self.assertEqual(opportunity.pair_contract, self.pool)
+        self.assertEqual(opportunity.loan_token.address, WBNB)
+        self.assertEqual(opportunity.dest_token.address, BUSD)
+        victim_pool = opportunity.victim_pool
+        self.assertIsInstance(victim_pool, simulator.V3Pool)
+        self.assertTrue(victim_pool.loan_is_token0)
+        # BUSD in, so WBNB got dearer in BUSD and the cached state is untouched
+        self.assertGreater(victim_pool.state.sqrt_price_x96, self.state.sqrt_price_x96)
+        self.assertIsNot(victim_pool.state, self.state)
+        state_diff = back_runner.victim_override(opportunity)[self.pool]["stateDiff"]
+        self.assertEqual(set(state_diff), {slot_key(0), slot_key(1), slot_key(5)})
+
+    def test_unknown_pool_is_rejected(self):
+        self.fetcher.v3_pools.states.clear()
+        self.assertEqual(
+            asyncio.run(
+                back_runner.simulate_victim_v3(
+                    self.dex, self.victim([WBNB, BUSD], [500])
+                )
+            ),
+            [],
+        )
+        self.assertEqual(self.metrics.rejections.values, {"no_reserves": 1})
+
+    def test_unknown_fee_tier_is_rejected(self):
+        self.assertEqual(
+            asyncio.run(
+                back_runner.simulate_victim_v3(
+                    self.dex, self.victim([WBNB, BUSD], [3000])
+                )
+            ),
+            [],
+        )
+        self.assertEqual(self.fetcher.v3_pools.loaded, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
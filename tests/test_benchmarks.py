@@ -0,0 +1,31 @@
+import asyncio
+import tempfile
+import unittest
+from benchmarks.bench_hot_path import HotPath, compare
+from scripts import back_runner
+
+
+class TestHotPathBenchmarks(unittest.TestCase):
+    def test_every_benchmark_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            hot_path = HotPath(directory)
+            # Three swaps for each enabled V2 router
+            self.assertEqual(len(hot_path.swaps), 3 * len(back_runner.dexs))
+            self.assertNotIn(None, hot_path.decoded)
+            for name, function in hot_path.benchmarks().items():
+                with self.subTest(name):
+                    if asyncio.iscoroutinefunction(function):
+                        asyncio.run(function())
+                    else:
+                        function()
+            hot_path.fetcher.pair_db.close()
+
+    def test_compare_reports_regressions(self):
+        baseline = {"fast": 0.2, "slow": 100.0}
+        results = {"fast": 0.4, "slow": 130.0, "new": 5.0}
+        # "fast" doubled but stays within timer noise
+        self.assertEqual(compare(results, baseline, 0.25), ["slow"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+import aiohttp
+from scripts.boot import BOOT_SNAPSHOT_VERSION, BootLoader, abi_targets
+from scripts.token_registry import Token
+
+FLASHLOAN = "0xEe7e961f77066c5E995615ae7e7E8e4366d9eC5A"
+TOKEN = "0x1111111111111111111111111111111111111111"
+FACTORY = "0x2222222222222222222222222222222222222222"
+ROUTER = "0x3333333333333333333333333333333333333333"
+INIT_CODE_HASH = "0x" + "ab" * 32
+
+
+class StubBscScan:
+    # Answers every ABI request after a short delay, tracking concurrency
+    def __init__(self, refused=()):
+        self.refused = refused
+        self.urls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def get(self, aggregator, url, params=None, headers=None):
+        self.urls.append(url)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        address = url.split("address=")[1].split("&")[0]
+        if address in self.refused:
+            raise aiohttp.ClientConnectionError("Connection refused")
+        return {"status": "1", "result": f'[{{"name": "{address}"}}]'}
+
+    async def close(self):
+        pass
+
+
+class StubDex:
+    def __init__(self, name, router=ROUTER):
+        self.name = name
+        self.factory = FACTORY
+        self.router = router
+        self.quoter = None
+        self.init_code_hash = None
+        self.factory_abi = None
+        self.router_abi = None
+        self.quoter_abi = None
+
+
+class TestBootLoader(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.snapshot_filename = os.path.join(self.directory.name, "boot.json")
+        self.config = {
+            "bsc_api_key": "KEY",
+            "bsc_mainnet_api_url": "https://bscscan.test/api?address=",
+            "boot_snapshot_filename": self.snapshot_filename,
+        }
+        self.factory_calls = 0
+        self.max_loan_amount = [10**22]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_fetcher(self):
+        fetcher = MagicMock()
+        fetcher.multicall.gather = AsyncMock(return_value=[self.max_loan_amount])
+
+        def register_pair_factory(dex):
+            if dex.init_code_hash is None:
+                self.factory_calls += 1
+                dex.init_code_hash = INIT_CODE_HASH
+
+        fetcher.register_pair_factory.side_effect = register_pair_factory
+        return fetcher
+
+    def boot(self, router=ROUTER, refused=()):
+        token = Token("TEST", {"address": TOKEN, "decimals": 18}, FLASHLOAN, 1)
+        dex = StubDex("BootTestSwapV2", router)
+        fetcher = self.make_fetcher()
+        loader = BootLoader(self.config, MagicMock(), fetcher)
+        loader.http = StubBscScan(refused)
+        asyncio.run(loader.load([token], [dex], FLASHLOAN))
+        return loader, token, dex
+
+    def test_cold_start_fetches_concurrently_and_writes_snapshot(self):
+        loader, token, dex = self.boot()
+        self.assertEqual(len(loader.http.urls), 3)
+        self.assertGreater(loader.http.max_in_flight, 1)
+        self.assertEqual(token.max_loan_amount, 10**22)
+        self.assertIn(ROUTER, dex.router_abi)
+        self.assertEqual(dex.init_code_hash, INIT_CODE_HASH)
+        with open(self.snapshot_filename, "r") as json_file:
+            snapshot = json.load(json_file)
+        self.assertEqual(snapshot["version"], BOOT_SNAPSHOT_VERSION)
+        self.assertEqual(len(snapshot["abis"]), 3)
+        self.assertEqual(snapshot["init_code_hashes"], {dex.name: INIT_CODE_HASH})
+
+    def test_warm_start_reads_snapshot(self):
+        self.boot()
+        self.factory_calls = 0
+        loader, token, dex = self.boot()
+        self.assertEqual(loader.http.urls, [])
+        self.assertEqual(self.factory_calls, 0)
+        self.assertEqual(dex.init_code_hash, INIT_CODE_HASH)
+        self.assertIn(TOKEN, token.abi)
+        # Flash loan limits are live state and always read
+        self.assertEqual(token.max_loan_amount, 10**22)
+
+    def test_moved_contract_rebuilds_snapshot(self):
+        self.boot()
+        moved = "0x4444444444444444444444444444444444444444"
+        loader, _, dex = self.boot(router=moved)
+        self.assertEqual(len(loader.http.urls), 3)
+        self.assertIn(moved, dex.router_abi)
+
+    def test_refused_connection_skips_the_abi(self):
+        loader, token, dex = self.boot(refused=(ROUTER,))
+        self.assertIsNone(dex.router_abi)
+        self.assertIn(TOKEN, token.abi)
+        # Incomplete, so the next start tries again
+        self.assertFalse(os.path.exists(self.snapshot_filename))
+
+    def test_failed_flash_loan_read_skips_the_token(self):
+        self.max_loan_amount = None
+        loader, token, _ = self.boot()
+        self.assertEqual(token.max_loan_amount, 0)
+        loader.log.warning.assert_called()
+
+    def test_pair_abi_is_read_from_the_repo(self):
+        dex = StubDex("PancakeSwapV2")
+        [pair_target] = [
+            target for target in abi_targets([], [dex]) if target[2] == "pair_abi"
+        ]
+        self.assertEqual(
+            pair_target, ("abi/PancakeSwapV2_pair_abi.json", dex, "pair_abi", None)
+        )
+        # No file to read, no BscScan lookup either
+        self.assertEqual(len(abi_targets([], [StubDex("BootTestSwapV2")])), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,190 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import MagicMock
+from aiohttp import web
+from eth_utils import keccak
+from hexbytes import HexBytes
+from scripts.broadcaster import (
+    MAX_FAILURES,
+    NODE,
+    BroadcastError,
+    Broadcaster,
+    http_url,
+)
+from scripts.metrics import Metrics
+from scripts.receipt_tracker import DROPPED, SUCCESS
+
+RAW_TRANSACTION = HexBytes(b"\xf8\x6b" + b"\x01" * 107)
+TRANSACTION_HASH = HexBytes(keccak(RAW_TRANSACTION))
+
+
+class MockEndpoints:
+    # Local JSON-RPC endpoints answering after their own delay, with a result
+    # or an error
+    def __init__(self, replies):
+        self.replies = replies
+        self.requests = {name: [] for name in replies}
+
+    async def handle(self, request):
+        name = request.match_info["name"]
+        body = await request.json()
+        self.requests[name].append(body)
+        delay, error = self.replies[name]
+        await asyncio.sleep(delay)
+        if error is not None:
+            return web.json_response(
+                {"jsonrpc": "2.0", "id": body["id"], "error": {"message": error}}
+            )
+        return web.json_response(
+            {"jsonrpc": "2.0", "id": body["id"], "result": TRANSACTION_HASH.hex()}
+        )
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/{name}", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return [
+            {"name": name, "url": f"http://127.0.0.1:{port}/{name}"}
+            for name in self.replies
+        ]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class TestBroadcaster(unittest.TestCase):
+    def run_broadcasts(self, replies, count=1, extra_endpoints=()):
+        # Broadcasts count times, waiting for the slower endpoints in between.
+        # The node is the endpoint named NODE.
+        async def run():
+            endpoints = MockEndpoints(replies)
+            urls = await endpoints.start()
+            node_url = next(url["url"] for url in urls if url["name"] == NODE)
+            broadcaster = Broadcaster(
+                node_url,
+                MagicMock(),
+                [url for url in urls if url["name"] != NODE] + list(extra_endpoints),
+                metrics=Metrics(),
+            )
+            results = []
+            try:
+                for _ in range(count):
+                    try:
+                        results.append(await broadcaster.broadcast(RAW_TRANSACTION))
+                    except BroadcastError as e:
+                        results.append(e)
+                    await asyncio.gather(*broadcaster.tasks)
+            finally:
+                await broadcaster.close()
+                await endpoints.stop()
+            return broadcaster, endpoints, results
+
+        return asyncio.run(run())
+
+    def test_first_acceptance_returns(self):
+        broadcaster, endpoints, [result] = self.run_broadcasts(
+            {
+                NODE: (0.1, None),
+                "relay": (0.0, None),
+                "slow": (0.3, None),
+                "failing": (0.0, "rejected"),
+            }
+        )
+        self.assertEqual(result, (TRANSACTION_HASH, "relay"))
+        for name in (NODE, "slow"):
+            self.assertEqual(
+                endpoints.requests[name],
+                [
+                    {
+                        "jsonrpc": "2.0",
+                        "id": 1,
+                        "method": "eth_sendRawTransaction",
+                        "params": [RAW_TRANSACTION.hex()],
+                    }
+                ],
+            )
+        # The slower endpoints still finished and were measured
+        series = broadcaster.metrics.stage_seconds.series
+        self.assertEqual(
+            set(series), {f"accepted_by_{name}" for name in (NODE, "relay", "slow")}
+        )
+        self.assertLess(series["accepted_by_relay"][-1], series["accepted_by_node"][-1])
+        self.assertLess(series["accepted_by_node"][-1], series["accepted_by_slow"][-1])
+        self.assertEqual(len(broadcaster.accepted_by[TRANSACTION_HASH]), 3)
+
+    def test_known_transaction_counts_as_accepted(self):
+        _, _, [result] = self.run_broadcasts(
+            {NODE: (0.0, "already known"), "relay": (0.3, "rejected")}
+        )
+        self.assertEqual(result, (TRANSACTION_HASH, NODE))
+
+    def test_all_endpoints_reject(self):
+        _, _, [error] = self.run_broadcasts(
+            {NODE: (0.0, "nonce too low"), "relay": (0.0, "underpriced")}
+        )
+        self.assertIsInstance(error, BroadcastError)
+        self.assertEqual(error.errors, {NODE: "nonce too low", "relay": "underpriced"})
+
+    def test_inclusion_outcomes(self):
+        broadcaster, _, _ = self.run_broadcasts(
+            {NODE: (0.0, None), "relay": (0.0, None)}, count=2
+        )
+        broadcaster.record_outcome(TRANSACTION_HASH, SUCCESS)
+        broadcaster.record_outcome(TRANSACTION_HASH, DROPPED)
+        # Both broadcasts share the hash, so both endpoints accepted it twice
+        self.assertEqual(
+            broadcaster.metrics.events.values,
+            {"included_by_node": 2, "included_by_relay": 2},
+        )
+        self.assertNotIn(TRANSACTION_HASH, broadcaster.accepted_by)
+
+    def test_late_acceptance_after_outcome_is_ignored(self):
+        async def run():
+            endpoints = MockEndpoints({NODE: (0.0, None), "slow": (0.2, None)})
+            urls = await endpoints.start()
+            broadcaster = Broadcaster(urls[0]["url"], MagicMock(), urls[1:])
+            try:
+                await broadcaster.broadcast(RAW_TRANSACTION)
+                broadcaster.record_outcome(TRANSACTION_HASH, SUCCESS)
+                await asyncio.gather(*broadcaster.tasks)
+            finally:
+                await broadcaster.close()
+                await endpoints.stop()
+            return broadcaster
+
+        self.assertEqual(asyncio.run(run()).accepted_by, {})
+
+    def test_rejected_transaction_is_not_kept(self):
+        broadcaster, _, _ = self.run_broadcasts({NODE: (0.0, "nonce too low")})
+        self.assertEqual(broadcaster.accepted_by, {})
+
+    def test_unreachable_relay_is_skipped(self):
+        # Nothing listens on port 9
+        unreachable = {"name": "down", "url": "http://127.0.0.1:9/", "timeout": 0.5}
+        broadcaster, _, results = self.run_broadcasts(
+            {NODE: (0.0, "nonce too low")},
+            count=MAX_FAILURES + 1,
+            extra_endpoints=[unreachable],
+        )
+        down = broadcaster.endpoints[1]
+        self.assertEqual(down.failures, MAX_FAILURES)
+        self.assertFalse(down.available(time.perf_counter()))
+        # Only the node was left to turn down the last one
+        self.assertEqual(set(results[0].errors), {NODE, "down"})
+        self.assertEqual(set(results[-1].errors), {NODE})
+
+    def test_node_url(self):
+        self.assertEqual(
+            http_url("wss://bsc.node:8545/key"), "https://bsc.node:8545/key"
+        )
+        self.assertEqual(http_url("ws://127.0.0.1:8546"), "http://127.0.0.1:8546")
+        self.assertEqual(http_url("https://bsc.node"), "https://bsc.node")
+
+
+if __name__ == "__main__":
+    unittest.main()
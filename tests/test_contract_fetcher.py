@@ -1,122 +1,83 @@
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, MagicMock
-import Web3
-import requests
 from scripts.contract_fetcher import ContractFetcher
 
+PAIR_ABI = [{"name": "getReserves", "type": "function", "inputs": []}]
+
 
 class TestContractFetcher(unittest.TestCase):
     def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
         self.config = {
-            "bsc_api_key": "{API_KEY}",
-            "bsc_mainnet_api_url": "https://api.bscscan.com/api?module=contract&action=getabi&address=",
+            "pair_db_filename": os.path.join(self.directory.name, "pairs.db"),
         }
         self.log = MagicMock()
         self.w3 = MagicMock()
 
         self.fetcher = ContractFetcher(self.config, self.log, self.w3)
 
-    def test_fetch_contract_abi_success(self):
-        with patch("requests.get") as mock_get:
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = {"status": "1", "result": "some_abi_data"}
-            mock_get.return_value = mock_response
-
-            abi = self.fetcher.fetch_contract_abi(
-                "0xc35DADB65012eC5796536bD9864eD8773aBc74C4"
-            )
-            self.assertEqual(
-                abi,
-                '"[{"inputs":[{"internalType":"address","name":"_feeToSetter","type":"address"}],"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"token0","type":"address"},{"indexed":true,"internalType":"address","name":"token1","type":"address"},{"indexed":false,"internalType":"address","name":"pair","type":"address"},{"indexed":false,"internalType":"uint256","name":"","type":"uint256"}],"name":"PairCreated","type":"event"},{"inputs":[{"internalType":"uint256","name":"","type":"uint256"}],"name":"allPairs","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"allPairsLength","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"tokenA","type":"address"},{"internalType":"address","name":"tokenB","type":"address"}],"name":"createPair","outputs":[{"internalType":"address","name":"pair","type":"address"}],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"feeTo","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"feeToSetter","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"","type":"address"},{"internalType":"address","name":"","type":"address"}],"name":"getPair","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"migrator","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"pairCodeHash","outputs":[{"internalType":"bytes32","name":"","type":"bytes32"}],"stateMutability":"pure","type":"function"},{"inputs":[{"internalType":"address","name":"_feeTo","type":"address"}],"name":"setFeeTo","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_feeToSetter","type":"address"}],"name":"setFeeToSetter","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_migrator","type":"address"}],"name":"setMigrator","outputs":[],"stateMutability":"nonpayable","type":"function"}]"',
-            )
-
-    def test_fetch_contract_abi_failure(self):
-        with patch("requests.get") as mock_get:
-            mock_response = MagicMock()
-            mock_response.status_code = 404
-            mock_response.json.return_value = {"status": "0"}
-            mock_get.return_value = mock_response
-
-            abi = self.fetcher.fetch_contract_abi("dummy_address")
-            self.assertIsNone(abi)
-            self.log.debug.assert_called_with("ABI API Response: {'status': '0'}")
-
-    def test_get_abi_file_exists(self):
-        with patch("os.path.exists", return_value=True), patch(
-            "builtins.open", unittest.mock.mock_open(read_data='{"key": "value"}')
-        ) as mock_file:
-            dex = MagicMock(name="Uniswap", factory="0x1", quoter="0x2")
-            self.fetcher.get_abi(dex)
-            mock_file.assert_called_with("abi/Uniswap_factory_abi.json", "r")
-            self.assertEqual(dex.factory_abi, {"key": "value"})
-
-    def test_get_abi_fetch_online(self):
-        with patch("os.path.exists", return_value=False), patch(
-            "requests.get"
-        ) as mock_get, patch("builtins.open", unittest.mock.mock_open()) as mock_file:
-            dex = MagicMock(name="Uniswap", factory="0x1", quoter="0x2")
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = {"status": "1", "result": "some_abi_data"}
-            mock_get.return_value = mock_response
+    def tearDown(self):
+        self.fetcher.pair_db.close()
+        self.directory.cleanup()
 
-            self.fetcher.get_abi(dex)
-            mock_file.assert_called_with("abi/Uniswap_factory_abi.json", "w")
-            self.assertEqual(dex.factory_abi, "some_abi_data")
+    def make_dex(self):
+        dex = MagicMock(factory="0x858E3312ed3A876947EA49d572A7C42DE08af7EE")
+        dex.name = "Uniswap"
+        dex.quoter = None
+        return dex
 
     def test_save_content_to_json(self):
         with patch("builtins.open", unittest.mock.mock_open()) as mock_file:
             self.fetcher.save_content_to_json("abi/file.json", {"key": "value"})
             mock_file.assert_called_with("abi/file.json", "w")
             handle = mock_file()
-            handle.write.assert_called_once()
+            written = "".join(call.args[0] for call in handle.write.call_args_list)
+            self.assertEqual(written, '{"key": "value"}')
 
     def test_get_pair_contract_and_abi(self):
-        with patch("os.path.exists", return_value=False), patch(
-            "builtins.open", unittest.mock.mock_open()
-        ), patch("contract_fetcher.requests.get") as mock_get:
-            mock_factory_contract = MagicMock()
-            self.fetcher.w3.eth.contract.return_value = mock_factory_contract
-            mock_factory_contract.functions.getPair.return_value.call.return_value = (
-                "0xCB99FE720124129520f7a09Ca3CBEF78D58Ed934"
-            )
-
-            mock_response = MagicMock()
-            mock_response.status_code = 200
-            mock_response.json.return_value = {"status": "1", "result": "pair_abi_data"}
-            mock_get.return_value = mock_response
-
-            dex = MagicMock(
-                name="Uniswap",
-                factory_abi='"[{"inputs":[{"internalType":"address","name":"_feeToSetter","type":"address"}],"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"token0","type":"address"},{"indexed":true,"internalType":"address","name":"token1","type":"address"},{"indexed":false,"internalType":"address","name":"pair","type":"address"},{"indexed":false,"internalType":"uint256","name":"","type":"uint256"}],"name":"PairCreated","type":"event"},{"inputs":[{"internalType":"uint256","name":"","type":"uint256"}],"name":"allPairs","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"allPairsLength","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"tokenA","type":"address"},{"internalType":"address","name":"tokenB","type":"address"}],"name":"createPair","outputs":[{"internalType":"address","name":"pair","type":"address"}],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"feeTo","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"feeToSetter","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"","type":"address"},{"internalType":"address","name":"","type":"address"}],"name":"getPair","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"migrator","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"pairCodeHash","outputs":[{"internalType":"bytes32","name":"","type":"bytes32"}],"stateMutability":"pure","type":"function"},{"inputs":[{"internalType":"address","name":"_feeTo","type":"address"}],"name":"setFeeTo","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_feeToSetter","type":"address"}],"name":"setFeeToSetter","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_migrator","type":"address"}],"name":"setMigrator","outputs":[],"stateMutability":"nonpayable","type":"function"}]"',
-                factory="0xc35DADB65012eC5796536bD9864eD8773aBc74C4",
-            )
-            token1 = MagicMock(address="0xae13d989daC2f0dEbFf460aC112a837C89BAa7cd")
-            token2 = MagicMock(address="0x7ef95a0FEE0Dd31b22626fA2e10Ee6A223F8a684")
-
-            self.fetcher.get_pair_contract_and_abi(dex, token1, token2)
-
-            self.fetcher.w3.eth.contract.assert_called_with(
-                address="0xaCAac9311b0096E04Dfe96b6D87dec867d3883Dc",
-                abi='"[{"inputs":[{"internalType":"address","name":"_feeToSetter","type":"address"}],"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"token0","type":"address"},{"indexed":true,"internalType":"address","name":"token1","type":"address"},{"indexed":false,"internalType":"address","name":"pair","type":"address"},{"indexed":false,"internalType":"uint256","name":"","type":"uint256"}],"name":"PairCreated","type":"event"},{"inputs":[{"internalType":"uint256","name":"","type":"uint256"}],"name":"allPairs","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"allPairsLength","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"tokenA","type":"address"},{"internalType":"address","name":"tokenB","type":"address"}],"name":"createPair","outputs":[{"internalType":"address","name":"pair","type":"address"}],"stateMutability":"nonpayable","type":"function"},{"inputs":[],"name":"feeTo","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"feeToSetter","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[{"internalType":"address","name":"","type":"address"},{"internalType":"address","name":"","type":"address"}],"name":"getPair","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"migrator","outputs":[{"internalType":"address","name":"","type":"address"}],"stateMutability":"view","type":"function"},{"inputs":[],"name":"pairCodeHash","outputs":[{"internalType":"bytes32","name":"","type":"bytes32"}],"stateMutability":"pure","type":"function"},{"inputs":[{"internalType":"address","name":"_feeTo","type":"address"}],"name":"setFeeTo","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_feeToSetter","type":"address"}],"name":"setFeeToSetter","outputs":[],"stateMutability":"nonpayable","type":"function"},{"inputs":[{"internalType":"address","name":"_migrator","type":"address"}],"name":"setMigrator","outputs":[],"stateMutability":"nonpayable","type":"function"}]"',
-            )
-            mock_factory_contract.functions.getPair.assert_called_with(
-                "0xae13d989daC2f0dEbFf460aC112a837C89BAa7cd",
-                "0x7ef95a0FEE0Dd31b22626fA2e10Ee6A223F8a684",
-            )
-            mock_get.assert_called_once()
-            handle = unittest.mock.mock_open().return_value
-            handle.write.assert_called()
-
-            self.assertEqual(
-                dex.pair_contract, "0xaCAac9311b0096E04Dfe96b6D87dec867d3883Dc"
-            )
-            self.assertEqual(
-                dex.pair_abi,
-                '"[{"inputs":[],"payable":false,"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"owner","type":"address"},{"indexed":true,"internalType":"address","name":"spender","type":"address"},{"indexed":false,"internalType":"uint256","name":"value","type":"uint256"}],"name":"Approval","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"sender","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount0","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount1","type":"uint256"},{"indexed":true,"internalType":"address","name":"to","type":"address"}],"name":"Burn","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"sender","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount0","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount1","type":"uint256"}],"name":"Mint","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"sender","type":"address"},{"indexed":false,"internalType":"uint256","name":"amount0In","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount1In","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount0Out","type":"uint256"},{"indexed":false,"internalType":"uint256","name":"amount1Out","type":"uint256"},{"indexed":true,"internalType":"address","name":"to","type":"address"}],"name":"Swap","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"internalType":"uint112","name":"reserve0","type":"uint112"},{"indexed":false,"internalType":"uint112","name":"reserve1","type":"uint112"}],"name":"Sync","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"internalType":"address","name":"from","type":"address"},{"indexed":true,"internalType":"address","name":"to","type":"address"},{"indexed":false,"internalType":"uint256","name":"value","type":"uint256"}],"name":"Transfer","type":"event"},{"constant":true,"inputs":[],"name":"DOMAIN_SEPARATOR","outputs":[{"internalType":"bytes32","name":"","type":"bytes32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"MINIMUM_LIQUIDITY","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"PERMIT_TYPEHASH","outputs":[{"internalType":"bytes32","name":"","type":"bytes32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"internalType":"address","name":"","type":"address"},{"internalType":"address","name":"","type":"address"}],"name":"allowance","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"spender","type":"address"},{"internalType":"uint256","name":"value","type":"uint256"}],"name":"approve","outputs":[{"internalType":"bool","name":"","type":"bool"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"internalType":"address","name":"","type":"address"}],"name":"balanceOf","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"to","type":"address"}],"name":"burn","outputs":[{"internalType":"uint256","name":"amount0","type":"uint256"},{"internalType":"uint256","name":"amount1","type":"uint256"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"decimals","outputs":[{"internalType":"uint8","name":"","type":"uint8"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"devFee","outputs":[{"internalType":"uint32","name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"factory","outputs":[{"internalType":"address","name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"getReserves","outputs":[{"internalType":"uint112","name":"_reserve0","type":"uint112"},{"internalType":"uint112","name":"_reserve1","type":"uint112"},{"internalType":"uint32","name":"_blockTimestampLast","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"_token0","type":"address"},{"internalType":"address","name":"_token1","type":"address"}],"name":"initialize","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"kLast","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"to","type":"address"}],"name":"mint","outputs":[{"internalType":"uint256","name":"liquidity","type":"uint256"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"name","outputs":[{"internalType":"string","name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"internalType":"address","name":"","type":"address"}],"name":"nonces","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"owner","type":"address"},{"internalType":"address","name":"spender","type":"address"},{"internalType":"uint256","name":"value","type":"uint256"},{"internalType":"uint256","name":"deadline","type":"uint256"},{"internalType":"uint8","name":"v","type":"uint8"},{"internalType":"bytes32","name":"r","type":"bytes32"},{"internalType":"bytes32","name":"s","type":"bytes32"}],"name":"permit","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"price0CumulativeLast","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"price1CumulativeLast","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"uint32","name":"_devFee","type":"uint32"}],"name":"setDevFee","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"internalType":"uint32","name":"_swapFee","type":"uint32"}],"name":"setSwapFee","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"to","type":"address"}],"name":"skim","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"internalType":"uint256","name":"amount0Out","type":"uint256"},{"internalType":"uint256","name":"amount1Out","type":"uint256"},{"internalType":"address","name":"to","type":"address"},{"internalType":"bytes","name":"data","type":"bytes"}],"name":"swap","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"swapFee","outputs":[{"internalType":"uint32","name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"symbol","outputs":[{"internalType":"string","name":"","type":"string"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[],"name":"sync","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"token0","outputs":[{"internalType":"address","name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"token1","outputs":[{"internalType":"address","name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"totalSupply","outputs":[{"internalType":"uint256","name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"to","type":"address"},{"internalType":"uint256","name":"value","type":"uint256"}],"name":"transfer","outputs":[{"internalType":"bool","name":"","type":"bool"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"internalType":"address","name":"from","type":"address"},{"internalType":"address","name":"to","type":"address"},{"internalType":"uint256","name":"value","type":"uint256"}],"name":"transferFrom","outputs":[{"internalType":"bool","name":"","type":"bool"}],"payable":false,"stateMutability":"nonpayable","type":"function"}]"',
-            )
-
+        dex = self.make_dex()
+        dex.pair_abi = PAIR_ABI
+        self.fetcher.pair_resolver.add_factory(
+            dex.name,
+            dex.factory,
+            "0xfea293c909d87cd4153593f077b76bb7e94340200f4ee84211ae8e4f9bd7ffdf",
+        )
+        opportunity = MagicMock(dex=dex)
+        token1 = MagicMock(address="0xae13d989daC2f0dEbFf460aC112a837C89BAa7cd")
+        token2 = MagicMock(address="0x7ef95a0FEE0Dd31b22626fA2e10Ee6A223F8a684")
+        pair, _ = self.fetcher.pair_resolver.resolve(
+            dex.name, token1.address, token2.address
+        )
+
+        self.fetcher.get_pair_contract_and_abi(opportunity, token1, token2)
+        self.fetcher.get_pair_contract_and_abi(opportunity, token2, token1)
+
+        # Derived and described without a call to the chain or BscScan
+        self.w3.eth.contract.assert_not_called()
+        self.assertEqual(opportunity.pair_contract, pair)
+        self.assertEqual(opportunity.pair_abi, PAIR_ABI)
+        # Stored once the pair answered a reserves read
+        self.assertIsNone(
+            self.fetcher.pair_db.get_pair("Uniswap", token1.address, token2.address)
+        )
+        self.fetcher.confirm_pair("Uniswap", token2.address, token1.address)
+        self.assertEqual(self.fetcher.pending_pairs, {})
+        self.assertEqual(
+            self.fetcher.pair_db.get_pair("Uniswap", token1.address, token2.address),
+            (pair, PAIR_ABI),
+        )
+
+    def test_unresolved_pair_is_not_looked_up(self):
+        dex = self.make_dex()
+        dex.quoter = "0x" + "00" * 20
+        opportunity = MagicMock(dex=dex, pair_contract=None)
+        token1 = MagicMock(address="0xae13d989daC2f0dEbFf460aC112a837C89BAa7cd")
+        token2 = MagicMock(address="0x7ef95a0FEE0Dd31b22626fA2e10Ee6A223F8a684")
+        self.fetcher.get_pair_contract_and_abi(opportunity, token1, token2)
+        self.w3.eth.contract.assert_not_called()
+        self.assertIsNone(opportunity.pair_contract)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock
+from scripts.gas_oracle import GasOracle
+
+GWEI = 10**9
+
+
+def block(number, gas_prices):
+    return {
+        "number": hex(number),
+        "transactions": [{"gasPrice": hex(gas_price)} for gas_price in gas_prices],
+    }
+
+
+class FakeWebSocket:
+    def __init__(self, messages):
+        self.messages = [json.dumps(message) for message in messages]
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.messages:
+            raise StopAsyncIteration
+        return self.messages.pop(0)
+
+
+class TestGasOracle(unittest.TestCase):
+    def setUp(self):
+        self.oracle = GasOracle(
+            "wss://node", MagicMock(), 10 * GWEI, min_gas_price=GWEI, history_blocks=2
+        )
+
+    def test_bid_matches_victim(self):
+        self.assertEqual(self.oracle.bid(3 * GWEI), 3 * GWEI)
+        self.assertIsNone(self.oracle.bid(11 * GWEI))
+        self.assertIsNone(self.oracle.bid(GWEI // 2))
+
+    def test_floor_from_recent_blocks(self):
+        # The zero-priced system transaction is ignored
+        self.oracle.observe_block(block(100, [0] + [3 * GWEI] * 9 + [5 * GWEI]))
+        self.assertEqual(self.oracle.head, 100)
+        self.assertEqual(self.oracle.floor, 3 * GWEI)
+        self.assertIsNone(self.oracle.bid(2 * GWEI))
+
+    def test_old_blocks_roll_off(self):
+        self.oracle.observe_block(block(100, [5 * GWEI] * 10))
+        self.oracle.observe_block(block(101, [2 * GWEI] * 10))
+        self.oracle.observe_block(block(102, [2 * GWEI] * 10))
+        self.assertEqual(self.oracle.floor, 2 * GWEI)
+
+    def test_mempool_samples(self):
+        for _ in range(10):
+            self.oracle.observe_pending(4 * GWEI)
+        self.oracle.observe_block(block(100, []))
+        self.assertEqual(self.oracle.floor, 4 * GWEI)
+
+    def test_new_heads_reach_listeners(self):
+        heads = []
+        self.oracle.head_listeners.append(heads.append)
+        ws = FakeWebSocket(
+            [
+                {
+                    "jsonrpc": "2.0",
+                    "method": "eth_subscription",
+                    "params": {"result": {"number": hex(100)}},
+                }
+            ]
+        )
+        asyncio.run(self.oracle.stream(ws))
+        self.assertEqual(heads, [100])
+        self.assertEqual(ws.sent[0]["method"], "eth_getBlockByNumber")
+        self.assertEqual(ws.sent[0]["params"], [hex(100), True])
+
+
+if __name__ == "__main__":
+    unittest.main()
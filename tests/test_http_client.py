@@ -0,0 +1,81 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock
+from scripts.contract_fetcher import ContractFetcher, SwapQuote
+from scripts.http_client import RateLimiter
+
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+
+
+class Token:
+    def __init__(self, address):
+        self.address = address
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_burst_then_rate(self):
+        async def run():
+            limiter = RateLimiter(rate=50, burst=2)
+            started_at = time.monotonic()
+            for _ in range(4):
+                await limiter.acquire()
+            return time.monotonic() - started_at
+
+        # Two requests go straight through, the next two wait 20ms each
+        self.assertGreaterEqual(asyncio.run(run()), 0.035)
+
+
+class TestRaceSwapQuotes(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.fetcher = ContractFetcher(
+            {"pair_db_filename": os.path.join(self.directory.name, "pairs.db")},
+            MagicMock(),
+            MagicMock(),
+        )
+        self.quotes = {
+            "paraswap": (0.01, 100),
+            "kyberswap": (0.02, 120),
+            "openocean": (1.0, 500),
+        }
+
+        async def get_swap_quote(aggregator, src_token, dest_token, src_amount):
+            delay, dest_amount = self.quotes[aggregator]
+            await asyncio.sleep(delay)
+            if dest_amount is None:
+                return None
+            return SwapQuote(aggregator, src_amount, dest_amount, {})
+
+        self.fetcher.get_swap_quote = get_swap_quote
+
+    def tearDown(self):
+        self.fetcher.pair_db.close()
+        self.directory.cleanup()
+
+    def race(self, aggregators, deadline=0.2):
+        return asyncio.run(
+            self.fetcher.race_swap_quotes(
+                Token(WBNB), Token(BUSD), 10, aggregators, deadline
+            )
+        )
+
+    def test_best_quote_within_deadline(self):
+        quote = self.race(["paraswap", "kyberswap", "openocean"])
+        # OpenOcean would be better but misses the deadline
+        self.assertEqual(quote.aggregator, "kyberswap")
+        self.assertEqual(quote.dest_amount, 120)
+
+    def test_failed_quotes_are_skipped(self):
+        self.quotes["kyberswap"] = (0.02, None)
+        self.assertEqual(self.race(["paraswap", "kyberswap"]).aggregator, "paraswap")
+
+    def test_no_quote(self):
+        self.assertIsNone(self.race(["openocean"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
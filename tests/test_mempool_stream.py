@@ -0,0 +1,92 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock
+from scripts.mempool_stream import MempoolStream, format_transaction
+
+RAW_TRANSACTION = {
+    "hash": "0x" + "ab" * 32,
+    "from": "0xf01a75a88c66da31390cbd87d305f1ac9ffbcd71",
+    "to": "0x10ed43c718714eb63d5aa57b78b54704e256024e",
+    "value": "0xde0b6b3a7640000",
+    "gas": "0x30d40",
+    "gasPrice": "0xb2d05e00",
+    "nonce": "0x7",
+    "input": "0x7ff36ab5",
+    "blockHash": None,
+    "blockNumber": None,
+}
+
+
+class FakeWebsocket:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+    async def recv(self):
+        return json.dumps(self.replies.pop(0))
+
+
+class TestMempoolStream(unittest.TestCase):
+    def setUp(self):
+        self.stream = MempoolStream("wss://node", MagicMock())
+        self.received = []
+
+    def test_format_transaction(self):
+        transaction = format_transaction(RAW_TRANSACTION)
+        self.assertEqual(transaction["to"], "0x10ED43C718714eb63d5aA57B78B54704E256024E")
+        self.assertEqual(transaction["value"], 10**18)
+        self.assertEqual(transaction["gasPrice"], 3 * 10**9)
+        self.assertEqual(transaction["hash"].hex(), RAW_TRANSACTION["hash"])
+        self.assertIsNone(transaction["blockNumber"])
+
+    def test_contract_creation_has_no_recipient(self):
+        self.assertIsNone(format_transaction({**RAW_TRANSACTION, "to": None})["to"])
+
+    def test_subscribe_falls_back_to_hashes(self):
+        ws = FakeWebsocket(
+            [
+                {"id": 1, "error": {"code": -32602, "message": "invalid argument"}},
+                {"id": 1, "result": "0x1"},
+            ]
+        )
+        asyncio.run(self.stream.subscribe(ws))
+        self.assertFalse(self.stream.full_transactions)
+        self.assertEqual(ws.sent[0]["params"], ["newPendingTransactions", True])
+        self.assertEqual(ws.sent[1]["params"], ["newPendingTransactions"])
+
+    def test_full_body_notification(self):
+        self.stream.handle_message(
+            {"method": "eth_subscription", "params": {"result": RAW_TRANSACTION}},
+            self.received.append,
+        )
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(self.stream.pending_hashes, [])
+
+    def test_hashes_are_batched(self):
+        for transaction_hash in ("0x01", "0x02"):
+            self.stream.handle_message(
+                {"method": "eth_subscription", "params": {"result": transaction_hash}},
+                self.received.append,
+            )
+        ws = FakeWebsocket([])
+        asyncio.run(self.stream.flush(ws))
+        self.assertEqual(len(ws.sent), 1)
+        self.assertEqual(
+            [request["params"] for request in ws.sent[0]], [["0x01"], ["0x02"]]
+        )
+        self.assertEqual(self.stream.pending_hashes, [])
+
+        # Transactions already mined or dropped come back as null
+        self.stream.handle_message(
+            [{"id": 2, "result": RAW_TRANSACTION}, {"id": 3, "result": None}],
+            self.received.append,
+        )
+        self.assertEqual(len(self.received), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import unittest
+import aiohttp
+from scripts.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.001, 0.01))
+
+    def test_histogram_buckets_are_cumulative(self):
+        for seconds in (0.0005, 0.001, 0.005, 0.5):
+            self.metrics.observe("quote", seconds)
+        lines = self.metrics.render().splitlines()
+        self.assertIn('backrun_stage_seconds_bucket{stage="quote",le="0.001"} 2', lines)
+        self.assertIn('backrun_stage_seconds_bucket{stage="quote",le="0.01"} 3', lines)
+        self.assertIn('backrun_stage_seconds_bucket{stage="quote",le="+Inf"} 4', lines)
+        self.assertIn('backrun_stage_seconds_count{stage="quote"} 4', lines)
+
+    def test_span_and_counters(self):
+        with self.metrics.span("decode"):
+            pass
+        self.metrics.count("decoded")
+        self.metrics.count("decoded")
+        self.metrics.reject("not_a_swap")
+        lines = self.metrics.render().splitlines()
+        self.assertIn('backrun_stage_seconds_count{stage="decode"} 1', lines)
+        self.assertIn('backrun_transactions_total{step="decoded"} 2', lines)
+        self.assertIn('backrun_rejections_total{reason="not_a_swap"} 1', lines)
+
+    def test_startup_gauge(self):
+        # Far beyond the top bucket, kept out of the stage histogram
+        self.metrics.startup_time("boot", 12.5)
+        self.metrics.startup_time("boot", 9.0)
+        lines = self.metrics.render().splitlines()
+        self.assertIn("# TYPE backrun_startup_seconds gauge", lines)
+        self.assertIn('backrun_startup_seconds{milestone="boot"} 9.0', lines)
+        self.assertEqual(self.metrics.stage_seconds.series, {})
+
+    def test_endpoint(self):
+        async def scrape():
+            await self.metrics.serve(port=0)
+            port = self.metrics.runner.addresses[0][1]
+            try:
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(
+                        f"http://127.0.0.1:{port}/metrics"
+                    ) as response:
+                        return response.headers["Content-Type"], await response.text()
+            finally:
+                await self.metrics.close()
+
+        self.metrics.count("submitted")
+        content_type, body = asyncio.run(scrape())
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn('backrun_transactions_total{step="submitted"} 1', body)
+
+
+if __name__ == "__main__":
+    unittest.main()
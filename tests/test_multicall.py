@@ -0,0 +1,162 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from eth_abi import decode, encode
+from scripts.contract_fetcher import ContractFetcher
+from scripts.multicall import (
+    AGGREGATE3_SELECTOR,
+    AGGREGATE3_TYPES,
+    Multicall,
+    get_reserves_call,
+    max_flash_loan_call,
+)
+
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+PANCAKE_PAIR = "0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16"
+BISWAP_PAIR = "0xaCAac9311b0096E04Dfe96b6D87dec867d3883Dc"
+KYOTO_FACTORY = "0x1c3E50DBBCd05831c3A695d45D2b5bCD691AD8D8"
+KYOTO_PAIR = "0x" + "12" * 20
+
+
+def reserves_result(reserve0, reserve1):
+    return encode(["uint112", "uint112", "uint32"], [reserve0, reserve1, 0])
+
+
+class FakeNode:
+    # Answers aggregate3 with one canned result per target address
+    def __init__(self, results):
+        self.results = results
+        self.batches = []
+
+    def call(self, transaction, block_identifier):
+        data = bytes(transaction["data"])
+        assert data[:4] == AGGREGATE3_SELECTOR
+        (calls,) = decode(AGGREGATE3_TYPES, data[4:])
+        self.batches.append(calls)
+        results = []
+        for target, _, _ in calls:
+            result = self.results.get(target.lower())
+            results.append((result is not None, result or b""))
+        return encode(["(bool,bytes)[]"], [results])
+
+
+class Dex:
+    def __init__(self, name, factory, quoter=None):
+        self.name = name
+        self.factory = factory
+        self.quoter = quoter
+
+
+class Token:
+    def __init__(self, address):
+        self.address = address
+
+
+class TestMulticall(unittest.TestCase):
+    def setUp(self):
+        self.w3 = MagicMock()
+        self.node = FakeNode(
+            {
+                PANCAKE_PAIR.lower(): reserves_result(5, 7),
+                BUSD.lower(): encode(["uint256"], [10**24]),
+            }
+        )
+        self.w3.eth.call.side_effect = self.node.call
+        self.multicall = Multicall(self.w3, MagicMock())
+
+    def test_aggregate(self):
+        results = self.multicall.aggregate(
+            [get_reserves_call(PANCAKE_PAIR), get_reserves_call(BISWAP_PAIR)]
+        )
+        self.assertEqual(results, [(5, 7, 0), None])
+
+    def test_concurrent_calls_share_one_eth_call(self):
+        async def run():
+            return await asyncio.gather(
+                self.multicall.call(get_reserves_call(PANCAKE_PAIR)),
+                self.multicall.call(max_flash_loan_call(BUSD, WBNB)),
+                self.multicall.call(get_reserves_call(BISWAP_PAIR)),
+            )
+
+        results = asyncio.run(run())
+        self.assertEqual(results, [(5, 7, 0), (10**24,), None])
+        self.assertEqual(len(self.node.batches), 1)
+        self.assertEqual(len(self.node.batches[0]), 3)
+
+    def test_failed_batch_reaches_every_caller(self):
+        self.w3.eth.call.side_effect = ConnectionError("node down")
+
+        async def run():
+            return await asyncio.gather(
+                self.multicall.call(get_reserves_call(PANCAKE_PAIR)),
+                self.multicall.call(get_reserves_call(BISWAP_PAIR)),
+                return_exceptions=True,
+            )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(isinstance(result, ConnectionError) for result in results))
+
+
+class TestReservesAllDexes(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.w3 = MagicMock()
+        self.node = FakeNode(
+            {
+                PANCAKE_PAIR.lower(): reserves_result(100, 200),
+                KYOTO_FACTORY.lower(): encode(["address"], [KYOTO_PAIR]),
+                KYOTO_PAIR.lower(): reserves_result(300, 400),
+            }
+        )
+        self.w3.eth.call.side_effect = self.node.call
+        self.fetcher = ContractFetcher(
+            {"pair_db_filename": os.path.join(self.directory.name, "pairs.db")},
+            MagicMock(),
+            self.w3,
+        )
+        self.fetcher.pair_resolver.add_factory(
+            "PancakeSwapV2",
+            "0xcA143Ce32Fe78f1f7019d7d551a6402fC5350c73",
+            "0x00fb7f630766e6a796048ea87d01acd3068e8ff67d078148a3fa3f4a84f69bd5",
+        )
+        self.fetcher.pair_resolver.add_factory(
+            "BiSwapV2",
+            "0x858E3312ed3A876947EA49d572A7C42DE08af7EE",
+            "0xfea293c909d87cd4153593f077b76bb7e94340200f4ee84211ae8e4f9bd7ffdf",
+        )
+
+    def tearDown(self):
+        self.fetcher.pair_db.close()
+        self.directory.cleanup()
+
+    def test_reserves_all_dexes(self):
+        dexes = [
+            Dex("PancakeSwapV2", "0xcA143Ce32Fe78f1f7019d7d551a6402fC5350c73"),
+            Dex("BiSwapV2", "0x858E3312ed3A876947EA49d572A7C42DE08af7EE"),
+            Dex("KyotoSwapV2", KYOTO_FACTORY),
+            Dex("UniSwapV3", "0x" + "00" * 20, quoter="0x" + "00" * 20),
+        ]
+        reserves = asyncio.run(
+            self.fetcher.get_reserves_all_dexes(dexes, Token(BUSD), Token(WBNB))
+        )
+        # WBNB is token0 of the pair, so BUSD's reserve comes second
+        self.assertEqual(reserves["PancakeSwapV2"], (PANCAKE_PAIR, 200, 100))
+        self.assertEqual(reserves["KyotoSwapV2"][1:], (400, 300))
+        # The BiSwap pair reverts in the fake node and is left out
+        self.assertNotIn("BiSwapV2", reserves)
+        # One getPair batch for Kyoto, one getReserves batch for every pair
+        self.assertEqual([len(batch) for batch in self.node.batches], [1, 3])
+        self.assertIn(PANCAKE_PAIR, self.fetcher.reserve_store.watched)
+
+        # Warm pairs come from the reserve store without another read
+        asyncio.run(
+            self.fetcher.get_reserves_all_dexes(dexes[:1], Token(WBNB), Token(BUSD))
+        )
+        self.assertEqual(len(self.node.batches), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
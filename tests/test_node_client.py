@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from aiohttp import web
+from scripts.node_client import NodeClient, RPCError
+
+
+class MockNode:
+    # Answers a JSON-RPC batch in reverse order, failing unknown methods
+    def __init__(self):
+        self.bodies = []
+
+    async def handle(self, request):
+        body = await request.json()
+        self.bodies.append(body)
+        responses = []
+        for item in reversed(body):
+            if item["method"] == "eth_blockNumber":
+                responses.append({"jsonrpc": "2.0", "id": item["id"], "result": "0x10"})
+            else:
+                responses.append(
+                    {
+                        "jsonrpc": "2.0",
+                        "id": item["id"],
+                        "error": {"code": -32601, "message": "method not found"},
+                    }
+                )
+        return web.json_response(responses)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        return f"ws://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class TestNodeClient(unittest.TestCase):
+    def run_client(self, requests):
+        async def run():
+            node = MockNode()
+            client = NodeClient(await node.start(), MagicMock())
+            client.recorder = MagicMock()
+            try:
+                return node, client, await requests(client)
+            finally:
+                await client.close()
+                await node.stop()
+
+        return asyncio.run(run())
+
+    def test_batch_in_request_order(self):
+        node, client, results = self.run_client(
+            lambda client: client.batch(
+                [("eth_blockNumber", []), ("eth_nothing", [1]), ("eth_blockNumber", [])]
+            )
+        )
+        # One HTTP request to the websocket URL's HTTP twin
+        self.assertEqual(len(node.bodies), 1)
+        self.assertTrue(client.url.startswith("http://"))
+        self.assertEqual(results[0], "0x10")
+        self.assertIsInstance(results[1], RPCError)
+        self.assertEqual(results[1].method, "eth_nothing")
+        self.assertEqual(results[2], "0x10")
+        self.assertEqual(client.recorder.record_rpc.call_count, 3)
+
+    def test_request_raises_node_errors(self):
+        async def requests(client):
+            with self.assertRaises(RPCError):
+                await client.request("eth_nothing", [])
+            return await client.request("eth_blockNumber", [])
+
+        _, _, result = self.run_client(requests)
+        self.assertEqual(result, "0x10")
+
+    def test_empty_batch_sends_nothing(self):
+        node, _, results = self.run_client(lambda client: client.batch([]))
+        self.assertEqual((node.bodies, results), ([], []))
+
+
+if __name__ == "__main__":
+    unittest.main()
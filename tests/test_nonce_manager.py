@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from scripts.nonce_manager import NonceManager
+
+ACCOUNT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+
+
+class TestNonceManager(unittest.TestCase):
+    def setUp(self):
+        self.w3 = MagicMock()
+        self.counts = {"latest": 7, "pending": 7}
+        self.w3.eth.get_transaction_count.side_effect = (
+            lambda address, block_identifier: self.counts[block_identifier]
+        )
+        self.nonces = NonceManager(self.w3, ACCOUNT, MagicMock())
+        self.nonces.sync()
+
+    def test_allocates_locally(self):
+        self.assertEqual([self.nonces.allocate() for _ in range(3)], [7, 8, 9])
+        self.assertEqual(self.w3.eth.get_transaction_count.call_count, 2)
+
+    def test_release_latest(self):
+        nonce = self.nonces.allocate()
+        self.nonces.release(nonce)
+        self.assertEqual(self.nonces.allocate(), 7)
+
+    def test_release_fills_gap_first(self):
+        first = self.nonces.allocate()
+        self.nonces.allocate()
+        self.nonces.release(first)
+        self.assertEqual(self.nonces.allocate(), 7)
+        self.assertEqual(self.nonces.allocate(), 9)
+
+    def test_resync_drops_lost_transactions(self):
+        for _ in range(3):
+            nonce = self.nonces.allocate()
+            self.nonces.track(nonce, f"0x{nonce}")
+        # 7 mined, 8 still pending, 9 not in the node's pending count
+        self.counts.update(latest=8, pending=9)
+        self.nonces.resync()
+        self.assertEqual(self.nonces.in_flight, {8: "0x8", 9: "0x9"})
+        self.assertEqual(self.nonces.allocate(), 10)
+        # Until the receipt tracker drops it
+        self.nonces.drop(9)
+        self.assertEqual(self.nonces.in_flight, {8: "0x8"})
+        self.assertEqual(self.nonces.allocate(), 9)
+
+    def test_resync_keeps_nonces_being_sent(self):
+        signed, failed, signing = [self.nonces.allocate() for _ in range(3)]
+        self.nonces.track(signed, "0x7")
+        # 8 is rejected while 9 is still being signed; the node has 7
+        self.counts.update(pending=8)
+        self.nonces.release(failed)
+        self.nonces.resync()
+        self.assertEqual(self.nonces.allocate(), 8)
+        self.assertEqual(self.nonces.allocate(), 10)
+        self.nonces.track(signing, "0x9")
+        self.assertEqual(self.nonces.in_flight, {7: "0x7", 9: "0x9"})
+
+    def test_stale_release_is_ignored(self):
+        first, second = self.nonces.allocate(), self.nonces.allocate()
+        # Another transaction of ours took 7 and 8 meanwhile
+        self.counts.update(pending=9)
+        self.nonces.resync()
+        self.nonces.release(first)
+        self.nonces.release(second)
+        self.assertEqual(self.nonces.allocate(), 9)
+        self.assertEqual(self.nonces.released, set())
+
+    def test_concurrent_workers(self):
+        # Workers allocate, then either broadcast or fail and resync, while
+        # the node queues every broadcast transaction
+        broadcast = {}
+
+        async def worker(index):
+            for attempt in range(5):
+                nonce = self.nonces.allocate()
+                await asyncio.sleep(0.001 * ((index + attempt) % 3))
+                if (index + attempt) % 4 == 0:
+                    self.nonces.release(nonce)
+                    self.nonces.resync()
+                    continue
+                self.assertNotIn(nonce, broadcast)
+                broadcast[nonce] = index
+                self.nonces.track(nonce, f"0x{nonce}")
+                # The node's pending count stops at the first gap
+                while self.counts["pending"] in broadcast:
+                    self.counts["pending"] += 1
+
+        async def run():
+            await asyncio.gather(*(worker(index) for index in range(4)))
+
+        asyncio.run(run())
+        # Nonces were broadcast once each, a gap left by the last failures is
+        # the next one handed out
+        used = sorted([*broadcast, *self.nonces.released])
+        self.assertEqual(used, list(range(7, 7 + len(used))))
+        self.assertLess(max(self.nonces.released, default=0), max(broadcast))
+        self.assertEqual(self.nonces.allocated, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+from scripts.pair_db import PairDatabase
+from scripts.import_pair_db import import_pairs
+
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+PAIR = "0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16"
+PAIR_ABI = [{"name": "getReserves", "type": "function", "inputs": []}]
+
+
+class TestPairDatabase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "pairs.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_add_and_reload(self):
+        pair_db = PairDatabase(self.filename)
+        pair_db.add_pair("PancakeSwapV2", BUSD, WBNB, PAIR, PAIR_ABI)
+        pair_db.add_pair("PancakeSwapV2", BUSD, "0x" + "11" * 20, "0xother", PAIR_ABI)
+        pair_db.close()
+
+        pair_db = PairDatabase(self.filename)
+        self.assertEqual(
+            pair_db.get_pair("PancakeSwapV2", WBNB, BUSD), (PAIR, PAIR_ABI)
+        )
+        self.assertEqual(
+            pair_db.get_pair("PancakeSwapV2", BUSD.lower(), WBNB), (PAIR, PAIR_ABI)
+        )
+        self.assertIsNone(pair_db.get_pair("BiSwapV2", BUSD, WBNB))
+        self.assertEqual(pair_db.get_dex_abi("PancakeSwapV2"), PAIR_ABI)
+        self.assertEqual(len(pair_db.abis), 1)
+        pair_db.close()
+
+    def test_import_pairs(self):
+        abi_dir = os.path.join(self.directory.name, "abi")
+        contract_dir = os.path.join(self.directory.name, "contract")
+        os.makedirs(abi_dir)
+        os.makedirs(contract_dir)
+        pair_db = PairDatabase(self.filename)
+        for name in (f"PancakeSwapV2_{BUSD}-{WBNB}", "BiSwapV2_BUSD-WBNB"):
+            with open(os.path.join(abi_dir, f"{name}_abi.json"), "w") as json_file:
+                json_file.write(
+                    '[{"name": "getReserves", "type": "function", "inputs": []}]'
+                )
+            with open(
+                os.path.join(contract_dir, f"{name}_contract.json"), "w"
+            ) as json_file:
+                json_file.write(f'"{PAIR}"')
+
+        imported, skipped, migrated_files = import_pairs(
+            pair_db,
+            abi_dir,
+            contract_dir,
+            {"BUSD": BUSD, "WBNB": WBNB},
+            log=lambda _: None,
+        )
+        self.assertEqual((imported, skipped, len(migrated_files)), (2, 0, 4))
+        self.assertEqual(pair_db.get_pair("BiSwapV2", WBNB, BUSD), (PAIR, PAIR_ABI))
+        self.assertEqual(len(pair_db.abis), 1)
+        pair_db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import json
+import unittest
+from scripts.pair_resolver import (
+    PairResolver,
+    compute_pair_address,
+    compute_pool_address,
+)
+
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+
+# BUSD-WBNB pairs as returned by factory.getPair
+BUSD_WBNB_PAIRS = {
+    "PancakeSwapV2": "0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16",
+    "BiSwapV2": "0xaCAac9311b0096E04Dfe96b6D87dec867d3883Dc",
+    "ApeSwapV2": "0x51e6D27FA57373d8d4C256231241053a70Cb1d93",
+    "NomiSwapV2": "0x33edc4c558c4bADFe050d79F565632CF910573B6",
+    "SushiSwapV2": "0xDc558D64c29721d74C4456CfB4363a6e6660A9Bb",
+}
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+# PancakeSwap V3 USDT-WBNB pools as returned by factory.getPool, by fee tier
+USDT_WBNB_POOLS = {
+    100: "0x172fcD41E0913e95784454622d1c3724f546f849",
+    500: "0x36696169C63e42cd08ce11f5deeBbCeBae652050",
+}
+
+
+class TestPairResolver(unittest.TestCase):
+    def setUp(self):
+        with open("config/dex_config.json", "r") as json_file:
+            self.dex_config = json.load(json_file)
+
+    def test_compute_pair_address(self):
+        for dex_name, pair in BUSD_WBNB_PAIRS.items():
+            dex_info = self.dex_config[dex_name]
+            self.assertEqual(
+                compute_pair_address(
+                    dex_info["factory"], dex_info["init_code_hash"], BUSD, WBNB
+                ),
+                pair,
+            )
+            self.assertEqual(
+                compute_pair_address(
+                    dex_info["factory"], dex_info["init_code_hash"], WBNB, BUSD
+                ),
+                pair,
+            )
+
+    def test_resolve_token_position(self):
+        resolver = PairResolver()
+        dex_info = self.dex_config["PancakeSwapV2"]
+        resolver.add_factory(
+            "PancakeSwapV2", dex_info["factory"], dex_info["init_code_hash"]
+        )
+        # WBNB (0xbb..) sorts before BUSD (0xe9..), so it is token0
+        self.assertEqual(
+            resolver.resolve("PancakeSwapV2", WBNB, BUSD),
+            (BUSD_WBNB_PAIRS["PancakeSwapV2"], 0),
+        )
+        self.assertEqual(
+            resolver.resolve("PancakeSwapV2", BUSD.lower(), WBNB.lower()),
+            (BUSD_WBNB_PAIRS["PancakeSwapV2"], 1),
+        )
+
+    def test_resolve_unknown_factory(self):
+        self.assertIsNone(PairResolver().resolve("KyotoSwapV2", BUSD, WBNB))
+
+    def test_compute_pool_address(self):
+        dex_info = self.dex_config["PancakeSwapV3"]
+        for fee, pool in USDT_WBNB_POOLS.items():
+            for token_a, token_b in ((USDT, WBNB), (WBNB, USDT)):
+                self.assertEqual(
+                    compute_pool_address(
+                        dex_info["pool_deployer"],
+                        dex_info["init_code_hash"],
+                        token_a,
+                        token_b,
+                        fee,
+                    ),
+                    pool,
+                )
+
+    def test_resolve_pool(self):
+        resolver = PairResolver()
+        dex_info = self.dex_config["PancakeSwapV3"]
+        self.assertIsNone(resolver.resolve_pool("PancakeSwapV3", USDT, WBNB, 500))
+        resolver.add_pool_deployer(
+            "PancakeSwapV3", dex_info["pool_deployer"], dex_info["init_code_hash"]
+        )
+        # USDT (0x55..) sorts before WBNB (0xbb..)
+        self.assertEqual(
+            resolver.resolve_pool("PancakeSwapV3", WBNB, USDT, 500),
+            (USDT_WBNB_POOLS[500], 1),
+        )
+        self.assertEqual(
+            resolver.resolve_pool("PancakeSwapV3", USDT, WBNB, 500),
+            (USDT_WBNB_POOLS[500], 0),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
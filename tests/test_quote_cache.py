@@ -0,0 +1,61 @@
+import unittest
+from scripts.contract_fetcher import SwapQuote
+from scripts.metrics import Metrics
+from scripts.quote_cache import QuoteCache
+
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+
+
+def quote(src_amount, dest_amount=1):
+    return SwapQuote("paraswap", src_amount, dest_amount, {})
+
+
+class TestQuoteCache(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics()
+        self.cache = QuoteCache(max_size=2, bucket_step=0.001, metrics=self.metrics)
+        self.cache.new_head(100)
+
+    def test_near_duplicate_amount_hits(self):
+        self.cache.put(WBNB, BUSD, 100, quote(10**18))
+        hit = self.cache.get(WBNB.lower(), BUSD, 10**18 + 10**14)
+        self.assertEqual(hit.src_amount, 10**18)
+        self.assertIsNone(self.cache.get(WBNB, BUSD, 2 * 10**18))
+        self.assertIsNone(self.cache.get(BUSD, WBNB, 10**18))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+        self.assertEqual(self.metrics.quote_cache.values, {"hit": 1, "miss": 2})
+        self.assertIn(
+            'backrun_quote_cache_total{result="miss"} 2', self.metrics.render()
+        )
+
+    def test_never_spends_more_than_requested(self):
+        self.cache.put(WBNB, BUSD, 100, quote(10**18 + 10**14))
+        self.assertIsNone(self.cache.get(WBNB, BUSD, 10**18))
+
+    def test_new_head_drops_entries(self):
+        self.cache.put(WBNB, BUSD, 100, quote(10**18))
+        self.cache.new_head(101)
+        self.assertIsNone(self.cache.get(WBNB, BUSD, 10**18))
+        self.assertEqual(len(self.cache.entries), 0)
+        # A quote requested before the head moved is not kept
+        self.cache.put(WBNB, BUSD, 100, quote(10**18))
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_nothing_cached_before_the_first_head(self):
+        cache = QuoteCache()
+        cache.put(WBNB, BUSD, None, quote(10**18))
+        self.assertIsNone(cache.get(WBNB, BUSD, 10**18))
+        self.assertEqual(len(cache.entries), 0)
+
+    def test_lru_eviction(self):
+        self.cache.put(WBNB, BUSD, 100, quote(10**18))
+        self.cache.put(WBNB, BUSD, 100, quote(2 * 10**18))
+        self.cache.get(WBNB, BUSD, 10**18)
+        self.cache.put(WBNB, BUSD, 100, quote(3 * 10**18))
+        self.assertIsNotNone(self.cache.get(WBNB, BUSD, 10**18))
+        self.assertIsNone(self.cache.get(WBNB, BUSD, 2 * 10**18))
+
+
+if __name__ == "__main__":
+    unittest.main()
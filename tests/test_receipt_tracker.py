@@ -0,0 +1,96 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from hexbytes import HexBytes
+from scripts.node_client import RPCError
+from scripts.receipt_tracker import DROPPED, REVERTED, SUCCESS, ReceiptTracker
+
+MINED = HexBytes(b"\x01" * 32)
+REVERTING = HexBytes(b"\x02" * 32)
+LOST = HexBytes(b"\x03" * 32)
+
+
+class FakeNode:
+    # Answers eth_getTransactionReceipt batches, null for unknown hashes
+    def __init__(self, receipts):
+        self.receipts = receipts
+        self.batches = []
+
+    async def batch(self, requests):
+        self.batches.append(requests)
+        return [self.receipts.get(params[0]) for _, params in requests]
+
+
+class TestReceiptTracker(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeNode(
+            {
+                MINED.hex(): {"status": "0x1", "blockNumber": hex(101)},
+                REVERTING.hex(): {"status": "0x0", "blockNumber": hex(101)},
+            }
+        )
+        self.nonce_manager = MagicMock()
+        self.tracker = ReceiptTracker(
+            self.node, MagicMock(), self.nonce_manager, drop_after_blocks=3
+        )
+        self.tracker.last_block = 100
+
+    def check(self, block_number):
+        asyncio.run(self.tracker.check(block_number))
+
+    def test_records_outcomes(self):
+        self.tracker.track(MINED, 7)
+        self.tracker.track(REVERTING, 8)
+        self.tracker.track(LOST, 9)
+        self.check(101)
+        # One batch for every pending transaction
+        self.assertEqual(len(self.node.batches), 1)
+        self.assertEqual(len(self.node.batches[0]), 3)
+        self.assertEqual(self.tracker.results, {SUCCESS: 1, REVERTED: 1, DROPPED: 0})
+        self.assertEqual(list(self.tracker.pending), [LOST])
+        self.nonce_manager.confirm.assert_any_call(7)
+        self.nonce_manager.confirm.assert_any_call(8)
+
+    def test_drop_resyncs_nonce(self):
+        self.tracker.track(LOST, 9)
+        self.check(102)
+        self.assertIn(LOST, self.tracker.pending)
+        self.check(103)
+        self.assertEqual(self.tracker.results[DROPPED], 1)
+        self.assertEqual(self.tracker.pending, {})
+        self.nonce_manager.drop.assert_called_once_with(9)
+
+    def test_outcomes_reach_the_broadcaster(self):
+        self.tracker.broadcaster = MagicMock()
+        self.tracker.track(REVERTING, 8)
+        self.check(101)
+        self.tracker.broadcaster.record_outcome.assert_called_once_with(
+            REVERTING, REVERTED
+        )
+
+    def test_failed_lookup_is_retried(self):
+        self.node.receipts[LOST.hex()] = RPCError("eth_getTransactionReceipt", "busy")
+        self.tracker.track(LOST, 9)
+        self.check(103)
+        self.assertIn(LOST, self.tracker.pending)
+        self.nonce_manager.drop.assert_not_called()
+
+    def test_new_heads_drive_checks(self):
+        async def follow_heads():
+            task = asyncio.create_task(self.tracker.run())
+            self.tracker.track(MINED, 7)
+            # Heads arriving together make one check at the latest
+            self.tracker.new_head(101)
+            self.tracker.new_head(102)
+            await asyncio.sleep(0)
+            await asyncio.sleep(0)
+            task.cancel()
+
+        asyncio.run(follow_heads())
+        self.assertEqual(len(self.node.batches), 1)
+        self.assertEqual(self.tracker.last_block, 102)
+        self.assertEqual(self.tracker.results[SUCCESS], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
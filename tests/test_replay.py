@@ -0,0 +1,224 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from eth_abi import encode
+from web3 import Web3
+from scripts import back_runner
+from scripts.multicall import (
+    AGGREGATE3_RESULT_TYPES,
+    AGGREGATE3_SELECTOR,
+    AGGREGATE3_TYPES,
+    MULTICALL3_ADDRESS,
+    max_flash_loan_call,
+)
+from scripts.pair_resolver import compute_pair_address
+from scripts.recorder import Recorder, read_recording
+from scripts.replay import EXECUTE, FILTERED, NO_ARBITRAGE, Replay
+from scripts.tx_simulator import (
+    BALANCE_PROBE_BATCH,
+    BALANCE_PROBE_VALUE,
+    TransactionSimulator,
+)
+
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+
+
+def load(filename):
+    with open(filename, "r") as json_file:
+        return json.load(json_file)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self):
+        self.config = load("config/bot_config.json")
+        self.dex_config = load("config/dex_config.json")
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "session.jsonl.gz")
+        self.record_session(
+            self.filename,
+            [
+                self.swap_transaction(
+                    "0x" + "01" * 32, self.dex_config["PancakeSwapV2"]["router"]
+                ),
+                self.swap_transaction("0x" + "02" * 32, BUSD),
+            ],
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def pair(self, dex_name, token_a=WBNB, token_b=USDT):
+        dex_info = self.dex_config[dex_name]
+        return compute_pair_address(
+            dex_info["factory"], dex_info["init_code_hash"], token_a, token_b
+        )
+
+    def swap_transaction(
+        self,
+        transaction_hash,
+        router,
+        fn_name="swapExactETHForTokens",
+        args=None,
+    ):
+        pancake = self.dex_config["PancakeSwapV2"]
+        contract = Web3().eth.contract(
+            address=pancake["router"],
+            abi=load("abi/PancakeSwapV2_router_abi.json"),
+        )
+        return {
+            "hash": transaction_hash,
+            "from": WBNB,
+            "to": router,
+            "value": 10**20,
+            "gas": 300000,
+            "gasPrice": 3 * 10**9,
+            "nonce": 0,
+            "input": contract.encode_abi(
+                fn_name=fn_name,
+                args=args or [10**20, [WBNB, USDT], WBNB, 2**40],
+            ),
+            "blockHash": None,
+            "blockNumber": None,
+        }
+
+    def record_session(self, filename, transactions):
+        recorder = Recorder(filename)
+        # maxFlashLoan reads at startup, recorded as one aggregate3 call
+        calls = [
+            max_flash_loan_call(self.config["flashloan_address"], token)
+            for token in (BUSD, WBNB)
+        ]
+        recorder.record_rpc(
+            "eth_call",
+            (
+                {
+                    "to": MULTICALL3_ADDRESS,
+                    "data": "0x"
+                    + (
+                        AGGREGATE3_SELECTOR
+                        + encode(
+                            AGGREGATE3_TYPES,
+                            [[(call.target, True, call.call_data) for call in calls]],
+                        )
+                    ).hex(),
+                },
+                "latest",
+            ),
+            {
+                "result": "0x"
+                + encode(
+                    AGGREGATE3_RESULT_TYPES,
+                    [[(True, encode(["uint256"], [10**22]))] * 2],
+                ).hex()
+            },
+        )
+        # Balance slot probes at boot, every token keeps its balances at slot 1
+        for method, params, chunk in self.balance_probes():
+            recorder.record_rpc(
+                method,
+                params,
+                {
+                    "result": "0x"
+                    + encode(
+                        AGGREGATE3_RESULT_TYPES,
+                        [
+                            [(True, encode(["uint256"], [BALANCE_PROBE_VALUE + 1]))]
+                            * len(chunk)
+                        ],
+                    ).hex()
+                },
+            )
+        recorder.record_reserves(self.pair("PancakeSwapV2"), 3 * 10**26, 10**24, 1)
+        recorder.record_reserves(self.pair("BiSwapV2"), 3 * 10**26, 2 * 10**24, 1)
+        recorder.record_reserves(
+            self.pair("PancakeSwapV2", WBNB, BUSD), 10**24, 3 * 10**26, 1
+        )
+        for transaction in transactions:
+            recorder.record_transaction(transaction)
+        recorder.close()
+
+    def balance_probes(self):
+        tokens = sorted(
+            {
+                Web3.to_checksum_address(token["address"])
+                for filename in ("loan_token_filename", "token_filename")
+                for token in load(self.config[filename]).values()
+            }
+        )
+        simulator = TransactionSimulator(
+            None, None, None, WBNB, self.config["arbitrage_address"]
+        )
+        for index in range(0, len(tokens), BALANCE_PROBE_BATCH):
+            chunk = tokens[index : index + BALANCE_PROBE_BATCH]
+            yield (*simulator.probe_request(chunk), chunk)
+
+    def test_recording_is_append_only(self):
+        kinds = [kind for _, kind, _ in read_recording(self.filename)]
+        probes = ["rpc"] * len(list(self.balance_probes()))
+        self.assertEqual(
+            kinds,
+            ["call", "call"]
+            + probes
+            + ["reserves", "reserves", "reserves", "tx", "tx"],
+        )
+
+    def test_replay_flat_out(self):
+        replay = Replay(self.filename, workers=2)
+        replay.install(self.config, self.dex_config)
+        self.assertEqual(
+            [token.max_loan_amount for token in back_runner.base_tokens],
+            [10**22, 10**22],
+        )
+        self.assertEqual(back_runner.transaction_simulator.balance_slot(USDT), 1)
+        # The Universal Router prices its legs on other venues, it is not one
+        router = self.dex_config["PancakeSwapUniversal"]["router"]
+        self.assertEqual(
+            {
+                version: dex.name
+                for version, dex in back_runner.swap_decoder.universal_routers[
+                    bytes.fromhex(router[2:])
+                ].items()
+            },
+            {2: "PancakeSwapV2", 3: "PancakeSwapV3"},
+        )
+        self.assertNotIn("PancakeSwapUniversal", [dex.name for dex in back_runner.dexs])
+        report = asyncio.run(replay.run())
+        self.assertEqual(report["transactions"], 2)
+        self.assertEqual(report["decisions"], {NO_ARBITRAGE: 1, FILTERED: 1})
+        self.assertNotIn(EXECUTE, report["decisions"])
+        # The backrun was sized locally, then the unrecorded quotes stopped it
+        self.assertEqual(report["stages"]["simulate_backrun"]["count"], 1)
+        self.assertGreater(report["unrecorded"]["aggregator"], 0)
+        self.assertEqual(report["stages"]["total"]["count"], 2)
+
+    def test_replay_multi_hop(self):
+        # USDT -> WBNB -> BUSD: the first pair is backrun with WBNB, the victim
+        # receives it there, the second has loan tokens on both sides
+        filename = os.path.join(self.directory.name, "multi_hop.jsonl.gz")
+        self.record_session(
+            filename,
+            [
+                self.swap_transaction(
+                    "0x" + "03" * 32,
+                    self.dex_config["PancakeSwapV2"]["router"],
+                    "swapExactTokensForTokens",
+                    [10**23, 1, [USDT, WBNB, BUSD], WBNB, 2**40],
+                )
+            ],
+        )
+        rejections = back_runner.metrics.rejections.values
+        both_loan_tokens = rejections.get("base_token_output", 0)
+        replay = Replay(filename, workers=1)
+        replay.install(self.config, self.dex_config)
+        report = asyncio.run(replay.run())
+        self.assertEqual(report["decisions"], {NO_ARBITRAGE: 1})
+        self.assertEqual(report["stages"]["simulate_backrun"]["count"], 1)
+        self.assertEqual(rejections["base_token_output"], both_loan_tokens + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,140 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import MagicMock
+from scripts.reserve_store import ReserveStore, SYNC_TOPIC
+
+PAIR = "0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16"
+
+
+def sync_log(reserve0, reserve1, block_number, address=PAIR):
+    return {
+        "address": address,
+        "data": reserve0.to_bytes(32, "big") + reserve1.to_bytes(32, "big"),
+        "blockNumber": block_number,
+    }
+
+
+def raw_sync_log(reserve0, reserve1, block_number, address=PAIR.lower()):
+    # As eth_getLogs and the logs subscription send it
+    data = reserve0.to_bytes(32, "big") + reserve1.to_bytes(32, "big")
+    return {
+        "address": address,
+        "topics": [SYNC_TOPIC],
+        "data": "0x" + data.hex(),
+        "blockNumber": hex(block_number),
+        "logIndex": "0x0",
+        "removed": False,
+    }
+
+
+class FakeNode:
+    def __init__(self, results):
+        self.results = results
+        self.requests = []
+
+    async def request(self, method, params):
+        self.requests.append((method, params))
+        return self.results[method]
+
+
+class FakeWebsocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, message):
+        self.sent.append(json.loads(message))
+
+
+class TestReserveStore(unittest.TestCase):
+    def setUp(self):
+        self.store = ReserveStore(None, MagicMock())
+
+    def test_sync_topic(self):
+        self.assertEqual(
+            SYNC_TOPIC,
+            "0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1",
+        )
+
+    def test_handle_log(self):
+        self.store.handle_log(sync_log(10**18, 2 * 10**18, 100))
+        self.assertEqual(self.store.get(PAIR), (10**18, 2 * 10**18, 100))
+        self.assertEqual(self.store.last_block, 100)
+
+    def test_stale_log_ignored(self):
+        self.store.handle_log(sync_log(5, 6, 101))
+        self.store.handle_log(sync_log(1, 2, 100))
+        self.assertEqual(self.store.get(PAIR), (5, 6, 101))
+
+    def test_seed_superseded_by_sync(self):
+        self.store.handle_log(sync_log(1, 2, 100, address="0xother"))
+        self.store.seed(PAIR, 7, 8)
+        self.assertEqual(self.store.get(PAIR), (7, 8, 100))
+        self.store.handle_log(sync_log(9, 10, 100))
+        self.assertEqual(self.store.get(PAIR), (9, 10, 100))
+
+    def test_backfill(self):
+        self.store.handle_log(sync_log(1, 2, 100))
+        self.store.watch(PAIR)
+        self.assertEqual(self.store.backfill_from, 101)
+        self.store.node = FakeNode(
+            {"eth_blockNumber": hex(105), "eth_getLogs": [raw_sync_log(3, 4, 103)]}
+        )
+        asyncio.run(self.store.backfill())
+        self.assertEqual(
+            self.store.node.requests[1],
+            (
+                "eth_getLogs",
+                [
+                    {
+                        "address": [PAIR],
+                        "topics": [SYNC_TOPIC],
+                        "fromBlock": hex(101),
+                        "toBlock": hex(105),
+                    }
+                ],
+            ),
+        )
+        self.assertEqual(self.store.get(PAIR), (3, 4, 103))
+        self.assertEqual((self.store.last_block, self.store.backfill_from), (105, None))
+
+    def test_failed_backfill_is_retried(self):
+        self.store.last_block = 100
+        self.store.watch(PAIR)
+        self.store.node = FakeNode({"eth_blockNumber": hex(105)})
+        with self.assertRaises(KeyError):
+            asyncio.run(self.store.backfill())
+        self.assertEqual((self.store.last_block, self.store.backfill_from), (100, 101))
+
+    def test_subscription(self):
+        ws = FakeWebsocket()
+        self.store.node = FakeNode({"eth_blockNumber": hex(100), "eth_getLogs": []})
+        self.store.subscribe_id = 1
+
+        async def deliver(*messages):
+            for message in messages:
+                await self.store.handle_message(ws, message)
+
+        notification = {
+            "method": "eth_subscription",
+            "params": {"subscription": "0xa", "result": raw_sync_log(5, 6, 101)},
+        }
+        asyncio.run(deliver({"id": 1, "result": "0xa"}, notification))
+        self.assertEqual(self.store.subscription, "0xa")
+        self.assertEqual(self.store.get(PAIR), (5, 6, 101))
+        # A reorged log is not applied
+        notification["params"]["result"] = dict(raw_sync_log(7, 8, 101), removed=True)
+        asyncio.run(deliver(notification))
+        self.assertEqual(self.store.get(PAIR), (5, 6, 101))
+        # A stale subscribe is dropped, the live one replaces the previous
+        self.store.subscribe_id = 3
+        asyncio.run(deliver({"id": 2, "result": "0xb"}, {"id": 3, "result": "0xc"}))
+        self.assertEqual(self.store.subscription, "0xc")
+        self.assertEqual([message["params"] for message in ws.sent], [["0xb"], ["0xa"]])
+        with self.assertRaises(ConnectionError):
+            self.store.subscribe_id = 4
+            asyncio.run(deliver({"id": 4, "error": {"message": "too many"}}))
+
+
+if __name__ == "__main__":
+    unittest.main()
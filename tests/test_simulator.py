@@ -0,0 +1,169 @@
+import unittest
+from math import isqrt
+from scripts import amm, simulator
+from scripts.simulator import Pool, V3Pool
+from scripts.v3_math import Q96, PoolState, get_tick_at_sqrt_ratio
+
+WBNB = 10**18
+
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        # Same 300 BUSD/WBNB price on both DEXes
+        self.pancake = Pool(
+            "PancakeSwapV2", "0xpancake", 1000 * WBNB, 300000 * WBNB, 25, 10000
+        )
+        self.biswap = Pool("BiSwapV2", "0xbiswap", 500 * WBNB, 150000 * WBNB, 1, 1000)
+
+    def test_no_backrun_without_price_gap(self):
+        self.assertEqual(simulator.optimal_amount_in(self.biswap, self.pancake), 0)
+        self.assertIsNone(simulator.find_best_backrun(self.pancake, [self.biswap]))
+
+    def test_apply_swap_matches_router(self):
+        pool = simulator.apply_swap(self.pancake, 10 * WBNB)
+        self.assertEqual(pool.reserve_loan, 1010 * WBNB)
+        # amountOut = amountIn * 9975 * reserveOut / (reserveIn * 10000 + amountIn * 9975)
+        self.assertEqual(300000 * WBNB - pool.reserve_token, 2962944627342260947053)
+
+    def test_optimal_amount_in_is_the_peak(self):
+        victim_pool = simulator.apply_swap(self.pancake, 50 * WBNB)
+        amount_in = simulator.optimal_amount_in(self.biswap, victim_pool)
+        self.assertGreater(amount_in, 0)
+        best = simulator.simulate(self.biswap, victim_pool, amount_in).profit
+        for delta in (WBNB // 100, WBNB // 10, WBNB):
+            for neighbour in (amount_in - delta, amount_in + delta):
+                profit = simulator.simulate(self.biswap, victim_pool, neighbour).profit
+                self.assertLessEqual(profit, best)
+
+    def test_find_best_backrun_sells_into_victim_pool(self):
+        # The victim buys BUSD on PancakeSwap, so BUSD is cheaper on BiSwap
+        victim_pool = simulator.apply_swap(self.pancake, 50 * WBNB)
+        backrun = simulator.find_best_backrun(victim_pool, [self.biswap])
+        self.assertEqual(backrun.buy_pool.dex_name, "BiSwapV2")
+        self.assertEqual(backrun.sell_pool.dex_name, "PancakeSwapV2")
+        self.assertGreater(backrun.profit, 0)
+        self.assertEqual(backrun.profit, backrun.amount_out - backrun.amount_in)
+
+    def test_max_amount_in(self):
+        victim_pool = simulator.apply_swap(self.pancake, 50 * WBNB)
+        backrun = simulator.find_best_backrun(victim_pool, [self.biswap], WBNB)
+        self.assertEqual(backrun.amount_in, WBNB)
+
+    def test_simulate_path_exact_input(self):
+        # WBNB -> BUSD -> WBNB through both pools
+        hops = [
+            simulator.Hop(
+                "PancakeSwapV2", "0xpancake", 1000 * WBNB, 300000 * WBNB, 25, 10000
+            ),
+            simulator.Hop("BiSwapV2", "0xbiswap", 150000 * WBNB, 500 * WBNB, 1, 1000),
+        ]
+        simulator.simulate_path(hops, amount_in=10 * WBNB)
+        self.assertEqual(hops[0].amount_out, 2962944627342260947053)
+        self.assertEqual(hops[1].amount_in, hops[0].amount_out)
+        self.assertEqual(
+            hops[1].amount_out,
+            amm.get_amount_out(hops[0].amount_out, 150000 * WBNB, 500 * WBNB, 1, 1000),
+        )
+        # The first pool is bought from on the loan token side, the second
+        # sold into from its token side
+        pancake = hops[0].pool_after(loan_is_input=True)
+        self.assertEqual(pancake.reserve_loan, 1010 * WBNB)
+        self.assertEqual(pancake.reserve_token, 300000 * WBNB - hops[0].amount_out)
+        biswap = hops[1].pool_after(loan_is_input=False)
+        self.assertEqual(biswap.reserve_loan, 500 * WBNB - hops[1].amount_out)
+        self.assertEqual(biswap.reserve_token, 150000 * WBNB + hops[0].amount_out)
+
+    def test_simulate_path_exact_output(self):
+        hops = [
+            simulator.Hop(
+                "PancakeSwapV2", "0xpancake", 1000 * WBNB, 300000 * WBNB, 25, 10000
+            ),
+            simulator.Hop("BiSwapV2", "0xbiswap", 150000 * WBNB, 500 * WBNB, 1, 1000),
+        ]
+        simulator.simulate_path(hops, amount_out=WBNB)
+        self.assertEqual(hops[1].amount_out, WBNB)
+        self.assertEqual(hops[0].amount_out, hops[1].amount_in)
+        # Paying the computed input covers the requested output
+        forward = [
+            simulator.Hop(
+                "PancakeSwapV2", "0xpancake", 1000 * WBNB, 300000 * WBNB, 25, 10000
+            ),
+            simulator.Hop("BiSwapV2", "0xbiswap", 150000 * WBNB, 500 * WBNB, 1, 1000),
+        ]
+        simulator.simulate_path(forward, amount_in=hops[0].amount_in)
+        self.assertGreaterEqual(forward[1].amount_out, WBNB)
+
+    def test_simulate_path_reverts(self):
+        hops = [
+            simulator.Hop("BiSwapV2", "0xbiswap", 150000 * WBNB, 500 * WBNB, 1, 1000)
+        ]
+        with self.assertRaises(ValueError):
+            simulator.simulate_path(hops, amount_out=500 * WBNB)
+
+    def make_v3_pool(self):
+        # WBNB/BUSD at the same 300 price in the 0.05% tier, with about
+        # 1000 WBNB of virtual liquidity over +-2000 ticks
+        sqrt_price = isqrt(300 * 2**192)
+        tick = get_tick_at_sqrt_ratio(sqrt_price)
+        state = PoolState(sqrt_price, tick, 0, 500)
+        tick_lower = (tick - 2000) // 10 * 10
+        tick_upper = (tick + 2000) // 10 * 10
+        for word_position in range(
+            state.word_position(tick_lower) - 1, state.word_position(tick_upper) + 2
+        ):
+            state.set_word(word_position, 0)
+        state.update_position(tick_lower, tick_upper, 1000 * WBNB * sqrt_price // Q96)
+        return V3Pool("PancakeSwapV3", "0xpancakev3", state, True)
+
+    def test_search_amount_in_matches_closed_form(self):
+        victim_pool = simulator.apply_swap(self.pancake, 50 * WBNB)
+        high = 500 * WBNB
+        amount_in = simulator.search_amount_in(self.biswap, victim_pool, high)
+        expected = simulator.optimal_amount_in(self.biswap, victim_pool)
+        self.assertLessEqual(abs(amount_in - expected), 2 * (high >> 20))
+
+    def test_find_best_backrun_on_v3_pool(self):
+        v3_pool = self.make_v3_pool()
+        self.assertAlmostEqual(v3_pool.reserve_loan / WBNB, 1000, places=3)
+        self.assertIsNone(simulator.find_best_backrun(self.pancake, [v3_pool]))
+        victim_pool = simulator.apply_swap(self.pancake, 50 * WBNB)
+        backrun = simulator.find_best_backrun(victim_pool, [v3_pool])
+        self.assertEqual(backrun.buy_pool.dex_name, "PancakeSwapV3")
+        self.assertEqual(backrun.sell_pool.dex_name, "PancakeSwapV2")
+        self.assertGreater(backrun.profit, 0)
+        for delta in (WBNB // 10, WBNB):
+            for neighbour in (backrun.amount_in - delta, backrun.amount_in + delta):
+                profit = simulator.simulate(v3_pool, victim_pool, neighbour).profit
+                self.assertLessEqual(profit, backrun.profit)
+
+    def test_simulate_path_through_v3_pool(self):
+        # WBNB -> BUSD on the V3 pool, then BUSD -> WBNB on BiSwap
+        state = self.make_v3_pool().state
+        hops = [
+            simulator.V3Hop("PancakeSwapV3", "0xpancakev3", state, True),
+            simulator.Hop("BiSwapV2", "0xbiswap", 150000 * WBNB, 500 * WBNB, 1, 1000),
+        ]
+        simulator.simulate_path(hops, amount_in=10 * WBNB)
+        self.assertEqual(hops[0].amount_out, state.get_amount_out(10 * WBNB, True))
+        self.assertEqual(hops[1].amount_in, hops[0].amount_out)
+        # The victim bought BUSD with WBNB, so the pool now sells BUSD dearer
+        victim_pool = hops[0].pool_after(loan_is_input=True)
+        self.assertTrue(victim_pool.loan_is_token0)
+        self.assertEqual(victim_pool.state, hops[0].state_after)
+        self.assertLess(victim_pool.buy(WBNB), state.get_amount_out(WBNB, True))
+        # Seen from BUSD as the loan token the pool is the other way round
+        self.assertFalse(hops[0].pool_after(loan_is_input=False).loan_is_token0)
+        backrun = simulator.find_best_backrun(victim_pool, [self.pancake])
+        self.assertEqual(backrun.sell_pool, victim_pool)
+        self.assertGreater(backrun.profit, 0)
+
+    def test_simulate_path_exact_output_through_v3_pool(self):
+        state = self.make_v3_pool().state
+        hops = [simulator.V3Hop("PancakeSwapV3", "0xpancakev3", state, False)]
+        simulator.simulate_path(hops, amount_out=WBNB)
+        self.assertEqual(hops[0].amount_in, state.get_amount_in(WBNB, False))
+        self.assertGreater(hops[0].state_after.sqrt_price_x96, state.sqrt_price_x96)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import json
+import unittest
+from eth_utils import function_abi_to_4byte_selector
+from web3 import Web3
+from scripts.swap_decoder import SWAPS, SwapDecoder
+
+ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+RECIPIENT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+
+
+class TestSwapDecoder(unittest.TestCase):
+    def setUp(self):
+        with open("abi/PancakeSwapV2_router_abi.json", "r") as json_file:
+            self.router = Web3().eth.contract(address=ROUTER, abi=json.load(json_file))
+        self.decoder = SwapDecoder()
+        self.decoder.add_router(ROUTER, "PancakeSwapV2")
+
+    def test_selectors_match_router_abi(self):
+        names = {swap.name for swap in SWAPS.values()}
+        for function_abi in self.router.abi:
+            if function_abi.get("name") in names:
+                selector = function_abi_to_4byte_selector(function_abi)
+                self.assertEqual(SWAPS[selector].name, function_abi["name"])
+        self.assertEqual(len(SWAPS), 9)
+
+    def test_decode_matches_web3(self):
+        data = self.router.encode_abi(
+            fn_name="swapExactTokensForTokens",
+            args=[10**18, 2 * 10**18, [BUSD, WBNB], RECIPIENT, 1700000000],
+        )
+        dex, swap, arguments = self.decoder.decode(ROUTER, data)
+        self.assertEqual(dex, "PancakeSwapV2")
+        self.assertEqual(swap.name, "swapExactTokensForTokens")
+        expected = self.router.decode_function_input(data)[1]
+        self.assertEqual(arguments["amountIn"], expected["amountIn"])
+        self.assertEqual(arguments["amountOutMin"], expected["amountOutMin"])
+        self.assertEqual(
+            [Web3.to_checksum_address(token) for token in arguments["path"]],
+            expected["path"],
+        )
+
+    def test_decode_exact_output(self):
+        data = self.router.encode_abi(
+            fn_name="swapETHForExactTokens",
+            args=[5 * 10**18, [WBNB, BUSD], RECIPIENT, 1700000000],
+        )
+        _, swap, arguments = self.decoder.decode(ROUTER.lower(), data)
+        self.assertEqual(swap.name, "swapETHForExactTokens")
+        self.assertEqual(arguments["amountOut"], 5 * 10**18)
+        self.assertNotIn("amountIn", arguments)
+
+    def test_value_is_the_exact_input_of_eth_swaps(self):
+        for fn_name in (
+            "swapExactETHForTokens",
+            "swapExactETHForTokensSupportingFeeOnTransferTokens",
+        ):
+            data = self.router.encode_abi(
+                fn_name=fn_name,
+                args=[10**18, [WBNB, BUSD], RECIPIENT, 1700000000],
+            )
+            _, swap, arguments = self.decoder.decode(ROUTER, data, 3 * 10**18)
+            self.assertEqual(swap.name, fn_name)
+            self.assertEqual(arguments["amountIn"], 3 * 10**18)
+            self.assertEqual(arguments["amountOutMin"], 10**18)
+        # Other swaps leave the value alone
+        data = self.router.encode_abi(
+            fn_name="swapETHForExactTokens",
+            args=[5 * 10**18, [WBNB, BUSD], RECIPIENT, 1700000000],
+        )
+        _, _, arguments = self.decoder.decode(ROUTER, data, 3 * 10**18)
+        self.assertNotIn("amountIn", arguments)
+
+    def test_duplicate_router_keeps_the_first_dex(self):
+        self.assertFalse(self.decoder.add_router(ROUTER.lower(), "NomiSwapV2"))
+        self.assertFalse(self.decoder.add_universal_router(ROUTER, "NomiSwapV2"))
+        self.assertTrue(self.decoder.add_router(RECIPIENT, "NomiSwapV2"))
+        data = self.router.encode_abi(
+            fn_name="swapExactTokensForTokens",
+            args=[1, 1, [BUSD, WBNB], RECIPIENT, 1700000000],
+        )
+        self.assertEqual(self.decoder.decode(ROUTER, data)[0], "PancakeSwapV2")
+
+    def test_rejects_unknown_router_and_selector(self):
+        data = self.router.encode_abi(
+            fn_name="swapExactTokensForTokens",
+            args=[1, 1, [BUSD, WBNB], RECIPIENT, 1700000000],
+        )
+        self.assertIsNone(self.decoder.decode(RECIPIENT, data))
+        self.assertIsNone(self.decoder.decode(None, data))
+        weth_call = self.router.encode_abi(fn_name="WETH")
+        self.assertIsNone(self.decoder.decode(ROUTER, weth_call))
+        self.assertIsNone(self.decoder.decode(ROUTER, "0x"))
+
+
+if __name__ == "__main__":
+    unittest.main()
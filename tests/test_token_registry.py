@@ -0,0 +1,60 @@
+import unittest
+from scripts.token_registry import (
+    Decoded_Token,
+    Token,
+    TokenRegistry,
+    checksum_address,
+)
+
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+UNKNOWN = "0x1111111111111111111111111111111111111111"
+VAULT = "0x4779FBC2628930eedb5Af6134491622deF69C36A"
+
+
+class TestTokenRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = TokenRegistry()
+        self.wbnb = self.registry.add(
+            Token("WBNB", {"address": WBNB.lower(), "decimals": 18}, VAULT, 10**15)
+        )
+        self.registry.add_token_list(
+            {
+                "WBNB": {"address": WBNB.lower(), "decimals": 18},
+                "USDT": {"address": USDT.lower(), "decimals": 18},
+            }
+        )
+
+    def test_lookup_ignores_address_case(self):
+        for address in (WBNB, WBNB.lower(), WBNB.upper().replace("0X", "0x")):
+            self.assertIs(self.registry.get(address), self.wbnb)
+            self.assertIs(self.registry.loan_token(address), self.wbnb)
+        self.assertEqual(self.registry.get(USDT.lower()).decimals, 18)
+        self.assertEqual(len(self.registry), 2)
+
+    def test_loan_token_is_not_replaced_by_token_list(self):
+        self.assertTrue(self.registry.is_loan_token(WBNB))
+        self.assertEqual(self.registry.vault(WBNB), VAULT)
+        self.assertFalse(self.registry.is_loan_token(USDT))
+        self.assertIsNone(self.registry.vault(USDT))
+        self.assertIsNone(self.registry.loan_token(UNKNOWN))
+
+    def test_unknown_token(self):
+        self.assertNotIn(UNKNOWN, self.registry)
+        token = self.registry.token(UNKNOWN)
+        self.assertIsInstance(token, Decoded_Token)
+        self.assertEqual(token.address, checksum_address(UNKNOWN))
+        self.assertEqual(self.registry.token(USDT).symbol, "USDT")
+
+    def test_entities_have_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            self.wbnb.pair_contract = None
+        self.assertFalse(hasattr(self.wbnb, "__dict__"))
+
+    def test_checksum_is_interned(self):
+        self.assertEqual(checksum_address(USDT.lower()), USDT)
+        self.assertIs(checksum_address(USDT.lower()), checksum_address(USDT.lower()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import json
+import unittest
+from eth_account import Account
+from web3 import Web3
+from scripts.tx_builder import FlashArbitrageEncoder, FlashArbitrageTransactions
+
+ARBITRAGE = "0x31E3d0a099954C285e232387946B4190EEb5EB68"
+LENDER = "0xEe7e961f77066c5E995615ae7e7E8e4366d9eC5A"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+PRIVATE_KEY = "0x" + "4c" * 32
+
+
+class TestTxBuilder(unittest.TestCase):
+    def setUp(self):
+        with open("abi/smart_contract_abi.json", "r") as json_file:
+            self.contract = Web3().eth.contract(
+                address=ARBITRAGE, abi=json.load(json_file)
+            )
+        self.calldata1 = bytes(range(70))
+        self.calldata2 = b"\xab" * 64
+
+    def test_encoding_matches_abi(self):
+        expected = self.contract.encode_abi(
+            fn_name="executeFlashArbitrage",
+            args=[LENDER, 10**18, BUSD, WBNB, self.calldata1, self.calldata2],
+        )
+        data = FlashArbitrageEncoder(LENDER).encode(
+            10**18, BUSD, WBNB, self.calldata1, self.calldata2
+        )
+        self.assertEqual("0x" + data.hex(), expected)
+
+    def test_signature_matches_eth_account(self):
+        transactions = FlashArbitrageTransactions(
+            ARBITRAGE, LENDER, PRIVATE_KEY, 56, 1500000
+        )
+        raw_transaction, transaction_hash = transactions.build(
+            12, 3 * 10**9, 10**18, BUSD, WBNB, self.calldata1, self.calldata2
+        )
+        expected = Account.sign_transaction(
+            {
+                "nonce": 12,
+                "gasPrice": 3 * 10**9,
+                "gas": 1500000,
+                "to": ARBITRAGE,
+                "value": 0,
+                "data": FlashArbitrageEncoder(LENDER).encode(
+                    10**18, BUSD, WBNB, self.calldata1, self.calldata2
+                ),
+                "chainId": 56,
+            },
+            PRIVATE_KEY,
+        )
+        self.assertEqual(raw_transaction, bytes(expected.rawTransaction))
+        self.assertEqual(transaction_hash, bytes(expected.hash))
+
+
+if __name__ == "__main__":
+    unittest.main()
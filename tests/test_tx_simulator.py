@@ -0,0 +1,176 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from eth_abi import decode, encode
+from eth_utils import to_checksum_address
+from scripts.multicall import (
+    AGGREGATE3_RESULT_TYPES,
+    AGGREGATE3_SELECTOR,
+    AGGREGATE3_TYPES,
+    MULTICALL3_ADDRESS,
+)
+from scripts.tx_builder import FlashArbitrageEncoder
+from scripts.tx_simulator import (
+    ERROR_SELECTOR,
+    SimulationCandidate,
+    TransactionSimulator,
+    mapping_slot,
+    reserves_word,
+    slot_key,
+    slot_value,
+)
+from scripts.v3_math import Q96, PoolState
+
+ACCOUNT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+ARBITRAGE = "0x31E3d0a099954C285e232387946B4190EEb5EB68"
+LENDER = "0xEe7e961f77066c5E995615ae7e7E8e4366d9eC5A"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+PAIR = "0x58F876857a02D6762E0101bb5C46A8c1ED44Dc16"
+UNKNOWN = "0x55d398326f99059fF775485246999027B3197955"
+BALANCE_SLOT = 1
+
+
+def word(value):
+    return value.to_bytes(32, "big")
+
+
+class FakeNode:
+    # Tokens keep balances at slot 1, except UNKNOWN whose slot is out of
+    # reach. The arbitrage earns loan_amount // 100 when the owner override is
+    # present and reverts above max_loan.
+    def __init__(self, max_loan=10**21):
+        self.max_loan = max_loan
+        self.batches = []
+
+    async def batch(self, requests):
+        self.batches.append(requests)
+        return [getattr(self, method)(*params) for method, params in requests]
+
+    def eth_call(self, transaction, block_identifier, state_override):
+        assert transaction["to"] == MULTICALL3_ADDRESS
+        (calls,) = decode(AGGREGATE3_TYPES, bytes.fromhex(transaction["data"][10:]))
+        if block_identifier == "latest":
+            # balanceOf probes, one per token
+            slot = slot_key(mapping_slot(MULTICALL3_ADDRESS, BALANCE_SLOT))
+            results = []
+            for token, _, _ in calls:
+                token = to_checksum_address(token)
+                value = state_override[token]["stateDiff"].get(slot, "0x0")
+                if token == UNKNOWN:
+                    value = "0x0"
+                results.append((True, word(int(value, 16))))
+            return "0x" + encode(AGGREGATE3_RESULT_TYPES, [results]).hex()
+        loan_amount = int.from_bytes(calls[1][2][36:68], "big")
+        owner = state_override[ARBITRAGE]["stateDiff"][slot_key(0)]
+        assert int(owner, 16) == int(MULTICALL3_ADDRESS, 16)
+        if loan_amount > self.max_loan:
+            arbitrage = (False, ERROR_SELECTOR + encode(["string"], ["BAL#"]))
+            after = 5
+        else:
+            arbitrage = (True, b"")
+            after = 5 + loan_amount // 100
+        return (
+            "0x"
+            + encode(
+                AGGREGATE3_RESULT_TYPES,
+                [[(True, word(5)), arbitrage, (True, word(after))]],
+            ).hex()
+        )
+
+    def eth_estimateGas(self, transaction, block_identifier, state_override):
+        assert transaction["from"] == ACCOUNT
+        assert transaction["to"] == ARBITRAGE
+        return hex(350000)
+
+
+class TestTransactionSimulator(unittest.TestCase):
+    def setUp(self):
+        self.node = FakeNode()
+        self.simulator = TransactionSimulator(
+            self.node, MagicMock(), FlashArbitrageEncoder(LENDER), ACCOUNT, ARBITRAGE
+        )
+        asyncio.run(self.simulator.load_balance_slots([BUSD, WBNB, UNKNOWN]))
+
+    def test_balance_slots_probed_at_boot(self):
+        # Every token in one eth_call, in one batch
+        self.assertEqual(len(self.node.batches), 1)
+        self.assertEqual(len(self.node.batches[0]), 1)
+        self.assertEqual(self.simulator.balance_slot(BUSD), BALANCE_SLOT)
+        self.assertEqual(self.simulator.balance_slot(WBNB), BALANCE_SLOT)
+        self.assertTrue(self.simulator.has_balance_slot(BUSD))
+        self.assertFalse(self.simulator.has_balance_slot(UNKNOWN))
+        self.assertFalse(self.simulator.has_balance_slot(PAIR))
+
+    def test_pair_override(self):
+        override = self.simulator.pair_override(PAIR, WBNB, BUSD, 7, 11)
+        self.assertEqual(
+            override[PAIR]["stateDiff"][slot_key(8)],
+            slot_value(reserves_word(7, 11)),
+        )
+        self.assertEqual(
+            override[WBNB]["stateDiff"][slot_key(mapping_slot(PAIR, BALANCE_SLOT))],
+            slot_value(7),
+        )
+        self.assertEqual(
+            override[BUSD]["stateDiff"][slot_key(mapping_slot(PAIR, BALANCE_SLOT))],
+            slot_value(11),
+        )
+
+    def test_v3_pool_override(self):
+        state = PoolState(Q96, -20, 10**21, 500)
+        self.assertIsNone(self.simulator.v3_pool_override(PAIR, state))
+        # observationIndex 3, cardinality 8, next cardinality 8, fee protocol
+        # 0x03200320, unlocked
+        state.slot0_extra = (3, 8, 8, 0x03200320, True)
+        state_diff = self.simulator.v3_pool_override(PAIR, state)[PAIR]["stateDiff"]
+        self.assertEqual(
+            state_diff,
+            {
+                slot_key(0): slot_value(
+                    Q96 | (2**24 - 20) << 160 | 3 << 184 | 8 << 200 | 8 << 216
+                ),
+                slot_key(1): slot_value(0x03200320 | 1 << 32),
+                slot_key(5): slot_value(10**21),
+            },
+        )
+
+    def test_simulate_all(self):
+        candidates = [
+            SimulationCandidate(10**20, b"\x01", b"\x02"),
+            SimulationCandidate(10**22, b"\x01", b"\x02"),
+            SimulationCandidate(10**21, b"\x01", b"\x02"),
+        ]
+        override = self.simulator.pair_override(PAIR, WBNB, BUSD, 7, 11)
+        results = asyncio.run(
+            self.simulator.simulate_all(candidates, BUSD, WBNB, override)
+        )
+        # Each candidate's eth_call and eth_estimateGas, all in one batch
+        self.assertEqual(
+            [method for method, _ in self.node.batches[-1]],
+            ["eth_call", "eth_estimateGas"] * 3,
+        )
+        self.assertEqual([result.candidate for result in results], candidates)
+        self.assertEqual(results[0].profit, 10**18)
+        self.assertEqual(results[0].gas_used, 350000)
+        self.assertFalse(results[1].success)
+        self.assertEqual(results[1].error, "BAL#")
+        # The victim's pair stays overridden next to the owner slot
+        self.assertIn(PAIR, self.node.batches[-1][0][1][2])
+        best = TransactionSimulator.best(results, 10**18)
+        self.assertIs(best.candidate, candidates[2])
+        self.assertIsNone(TransactionSimulator.best(results, 10**19))
+
+    def test_unreachable_node_fails_every_candidate(self):
+        async def batch(requests):
+            raise ConnectionError("refused")
+
+        self.node.batch = batch
+        candidates = [SimulationCandidate(10**20, b"\x01", b"\x02")] * 2
+        results = asyncio.run(self.simulator.simulate_all(candidates, BUSD, WBNB, {}))
+        self.assertEqual([result.success for result in results], [False, False])
+        self.assertEqual(results[0].error, "refused")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import unittest
+from eth_abi import encode
+from scripts.swap_decoder import SwapDecoder
+from scripts.universal_router import (
+    CONTRACT_BALANCE,
+    UNWRAP_WETH,
+    V2_SWAP_EXACT_IN,
+    V2_SWAP_EXACT_OUT,
+    V3_SWAP_EXACT_IN,
+    V3_SWAP_EXACT_OUT,
+    WRAP_ETH,
+    decode_execute,
+)
+
+ROUTER = "0xeC8B0F7Ffe3ae75d7FfAb09429e3675bb63503e4"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+RECIPIENT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+# The router's own address and the message sender, as the SDK encodes them
+ADDRESS_THIS = "0x0000000000000000000000000000000000000002"
+PERMIT2_PERMIT = 0x0A
+SWEEP = 0x04
+ALLOW_REVERT = 0x80
+
+
+def v3_path(*tokens_and_fees):
+    path = b""
+    for item in tokens_and_fees:
+        if isinstance(item, int):
+            path += item.to_bytes(3, "big")
+        else:
+            path += bytes.fromhex(item[2:])
+    return path
+
+
+def v2_swap(amount, limit, path, payer_is_user=True):
+    return encode(
+        ["address", "uint256", "uint256", "address[]", "bool"],
+        [RECIPIENT, amount, limit, path, payer_is_user],
+    )
+
+
+def v3_swap(amount, limit, path, payer_is_user=True):
+    return encode(
+        ["address", "uint256", "uint256", "bytes", "bool"],
+        [RECIPIENT, amount, limit, path, payer_is_user],
+    )
+
+
+def wrap(amount):
+    return encode(["address", "uint256"], [ADDRESS_THIS, amount])
+
+
+def execute(commands, inputs, deadline=True):
+    if deadline:
+        return bytes.fromhex("3593564c") + encode(
+            ["bytes", "bytes[]", "uint256"], [bytes(commands), inputs, 1700000000]
+        )
+    return bytes.fromhex("24856bc3") + encode(
+        ["bytes", "bytes[]"], [bytes(commands), inputs]
+    )
+
+
+class TestUniversalRouter(unittest.TestCase):
+    def test_v2_legs(self):
+        data = execute(
+            [V2_SWAP_EXACT_IN, V2_SWAP_EXACT_OUT],
+            [
+                v2_swap(10**18, 2 * 10**18, [BUSD, WBNB]),
+                v2_swap(5 * 10**18, 10**18, [WBNB, USDT]),
+            ],
+        )
+        exact_in, exact_out = decode_execute(data)
+        self.assertEqual((exact_in.name, exact_in.version), ("V2_SWAP_EXACT_IN", 2))
+        self.assertEqual(
+            exact_in.arguments,
+            {"amountIn": 10**18, "amountOutMin": 2 * 10**18, "path": [BUSD, WBNB]},
+        )
+        self.assertFalse(exact_out.exact_input)
+        self.assertEqual(
+            exact_out.arguments,
+            {"amountOut": 5 * 10**18, "amountInMax": 10**18, "path": [WBNB, USDT]},
+        )
+
+    def test_v3_paths_and_fees(self):
+        data = execute(
+            [V3_SWAP_EXACT_IN, V3_SWAP_EXACT_OUT | ALLOW_REVERT],
+            [
+                v3_swap(10**18, 1, v3_path(WBNB, 500, USDT, 100, BUSD)),
+                # Exact output paths start from the output token
+                v3_swap(7 * 10**18, 10**18, v3_path(BUSD, 2500, WBNB)),
+            ],
+            deadline=False,
+        )
+        exact_in, exact_out = decode_execute(data)
+        self.assertEqual(exact_in.version, 3)
+        self.assertEqual(exact_in.arguments["path"], [WBNB, USDT, BUSD])
+        self.assertEqual(exact_in.fees, [500, 100])
+        self.assertEqual(exact_out.name, "V3_SWAP_EXACT_OUT")
+        self.assertEqual(exact_out.arguments["path"], [WBNB, BUSD])
+        self.assertEqual(exact_out.fees, [2500])
+        self.assertEqual(exact_out.arguments["amountOut"], 7 * 10**18)
+
+    def test_wrapped_balance_feeds_the_swaps(self):
+        # BNB in: wrap it all, split it over a V3 and a V2 swap, unwrap nothing
+        data = execute(
+            [WRAP_ETH, V3_SWAP_EXACT_IN, V2_SWAP_EXACT_IN, UNWRAP_WETH],
+            [
+                wrap(CONTRACT_BALANCE),
+                v3_swap(3 * 10**18, 1, v3_path(WBNB, 500, BUSD), False),
+                v2_swap(CONTRACT_BALANCE, 1, [WBNB, BUSD], False),
+                wrap(0),
+            ],
+        )
+        legs = list(decode_execute(data, value=10 * 10**18))
+        self.assertEqual([leg.command for leg in legs], [0x0B, 0x00, 0x08, 0x0C])
+        self.assertEqual(legs[0].arguments["amountIn"], 10 * 10**18)
+        self.assertFalse(legs[0].is_swap)
+        self.assertEqual(legs[1].arguments["amountIn"], 3 * 10**18)
+        self.assertEqual(legs[2].arguments["amountIn"], 7 * 10**18)
+
+    def test_unknown_input_amount(self):
+        # Tokens already sent to the pair, or a balance left by another swap
+        data = execute(
+            [V2_SWAP_EXACT_IN, V2_SWAP_EXACT_IN],
+            [
+                v2_swap(0, 10**18, [BUSD, WBNB], False),
+                v2_swap(CONTRACT_BALANCE, 10**18, [WBNB, USDT], False),
+            ],
+        )
+        for leg in decode_execute(data):
+            self.assertNotIn("amountIn", leg.arguments)
+            self.assertEqual(leg.arguments["amountOutMin"], 10**18)
+
+    def test_other_commands_are_skipped(self):
+        data = execute(
+            [PERMIT2_PERMIT, V2_SWAP_EXACT_IN, SWEEP],
+            [
+                b"\x01" * 96,
+                v2_swap(10**18, 1, [BUSD, WBNB]),
+                encode(["address", "address", "uint256"], [WBNB, RECIPIENT, 0]),
+            ],
+        )
+        legs = list(decode_execute(data))
+        self.assertEqual([leg.name for leg in legs], ["V2_SWAP_EXACT_IN"])
+
+    def test_malformed_calldata(self):
+        data = execute([V2_SWAP_EXACT_IN], [v2_swap(10**18, 1, [BUSD, WBNB])])
+        with self.assertRaises(ValueError):
+            list(decode_execute(data[:-64]))
+        with self.assertRaises(ValueError):
+            list(decode_execute(execute([V2_SWAP_EXACT_IN, SWEEP], [b""])))
+        with self.assertRaises(ValueError):
+            list(decode_execute(b"\x12\x34\x56\x78" + data[4:]))
+
+    def test_swap_decoder_takes_the_first_leg(self):
+        decoder = SwapDecoder()
+        decoder.add_universal_router(ROUTER, "UniSwapV2Pairs", "UniSwapV3")
+        data = execute(
+            [V3_SWAP_EXACT_IN, V2_SWAP_EXACT_IN],
+            [
+                v3_swap(6 * 10**18, 1, v3_path(BUSD, 500, WBNB)),
+                v2_swap(4 * 10**18, 1, [BUSD, WBNB]),
+            ],
+        )
+        dex, leg, arguments = decoder.decode(ROUTER.lower(), "0x" + data.hex())
+        self.assertEqual((dex, leg.fees), ("UniSwapV3", [500]))
+        self.assertEqual(arguments["amountIn"], 6 * 10**18)
+        # Legs on a DEX that is not enabled are passed over
+        decoder = SwapDecoder()
+        decoder.add_universal_router(ROUTER, "UniSwapV2Pairs", None)
+        dex, leg, arguments = decoder.decode(ROUTER, data)
+        self.assertEqual(dex, "UniSwapV2Pairs")
+        self.assertEqual(leg.name, "V2_SWAP_EXACT_IN")
+        self.assertEqual(arguments["amountIn"], 4 * 10**18)
+        self.assertIsNone(decoder.decode(ROUTER, data[:100]))
+
+
+if __name__ == "__main__":
+    unittest.main()
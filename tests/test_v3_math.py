@@ -0,0 +1,159 @@
+import unittest
+from math import isqrt
+from scripts.v3_math import (
+    MAX_SQRT_RATIO,
+    MAX_TICK,
+    MIN_SQRT_RATIO,
+    MIN_TICK,
+    Q96,
+    PoolState,
+    compute_swap_step,
+    get_amount0_delta,
+    get_amount1_delta,
+    get_sqrt_ratio_at_tick,
+    get_tick_at_sqrt_ratio,
+    mul_div_rounding_up,
+)
+
+LIQUIDITY = 10**21
+FEE = 2500
+
+
+def encode_price_sqrt(reserve1, reserve0):
+    return isqrt(reserve1 * 2**192 // reserve0)
+
+
+def step_amounts(sqrt_a, sqrt_b, liquidity, fee=FEE):
+    # amount in with the fee and amount out of a step that reaches its target
+    # going from sqrt_a down to sqrt_b
+    amount_in = get_amount0_delta(sqrt_b, sqrt_a, liquidity, True)
+    amount_out = get_amount1_delta(sqrt_b, sqrt_a, liquidity, False)
+    return amount_in + mul_div_rounding_up(amount_in, fee, 10**6 - fee), amount_out
+
+
+class TestTickMath(unittest.TestCase):
+    def test_bounds(self):
+        self.assertEqual(get_sqrt_ratio_at_tick(0), Q96)
+        self.assertEqual(get_sqrt_ratio_at_tick(MIN_TICK), MIN_SQRT_RATIO)
+        self.assertEqual(get_sqrt_ratio_at_tick(MAX_TICK), MAX_SQRT_RATIO)
+        with self.assertRaises(ValueError):
+            get_sqrt_ratio_at_tick(MAX_TICK + 1)
+
+    def test_round_trip(self):
+        for tick in (MIN_TICK, -887000, -50, -1, 0, 1, 50, 250000, MAX_TICK - 1):
+            sqrt_price = get_sqrt_ratio_at_tick(tick)
+            self.assertEqual(get_tick_at_sqrt_ratio(sqrt_price), tick)
+            # Any price inside the tick's range rounds down to it
+            self.assertEqual(get_tick_at_sqrt_ratio(sqrt_price + 1), tick)
+
+
+class TestSwapMath(unittest.TestCase):
+    # Vectors from the Uniswap V3 SwapMath spec
+    def test_exact_in_capped_at_price_target(self):
+        target = encode_price_sqrt(101, 100)
+        self.assertEqual(
+            compute_swap_step(Q96, target, 2 * 10**18, 10**18, 600),
+            (target, 9975124224178055, 9925619580021728, 5988667735148),
+        )
+
+    def test_exact_out_fully_received(self):
+        target = encode_price_sqrt(10000, 100)
+        self.assertEqual(
+            compute_swap_step(Q96, target, 2 * 10**18, -(10**18), 600),
+            (
+                158456325028528675187087900672,
+                2000000000000000000,
+                1000000000000000000,
+                1200720432259356,
+            ),
+        )
+
+
+class TestPoolState(unittest.TestCase):
+    def setUp(self):
+        # PancakeSwap's 0.25% tier, tick spacing 50, with one position around
+        # the 1:1 price
+        self.state = PoolState(Q96, 0, 0, FEE)
+        self.state.set_word(-1, 0)
+        self.state.set_word(0, 0)
+        self.state.update_position(-500, 500, LIQUIDITY)
+
+    def test_mint_and_burn_flip_ticks(self):
+        self.assertEqual(self.state.liquidity, LIQUIDITY)
+        self.assertEqual(self.state.ticks[-500], [LIQUIDITY, LIQUIDITY])
+        self.assertEqual(self.state.ticks[500], [LIQUIDITY, -LIQUIDITY])
+        self.assertEqual(self.state.bitmap[0], 1 << 10)
+        self.assertEqual(self.state.bitmap[-1], 1 << 246)
+        self.state.update_position(-500, 500, -LIQUIDITY)
+        self.assertEqual(self.state.liquidity, 0)
+        self.assertEqual(self.state.ticks, {})
+        self.assertEqual(self.state.bitmap, {-1: 0, 0: 0})
+
+    def test_swap_to_price_limit(self):
+        limit = get_sqrt_ratio_at_tick(-500)
+        amount_in, amount_out = step_amounts(Q96, limit, LIQUIDITY)
+        self.assertEqual(self.state.swap(True, 10**30, limit), (amount_in, -amount_out))
+        # The swap is a quote, the state is left as it was
+        self.assertEqual(self.state.sqrt_price_x96, Q96)
+
+    def test_swap_crosses_initialized_ticks(self):
+        self.state.update_position(-1000, 0, 2 * LIQUIDITY)
+        price_0 = Q96
+        price_500 = get_sqrt_ratio_at_tick(-500)
+        price_800 = get_sqrt_ratio_at_tick(-800)
+        # Tick 0 adds the second position, tick -500 removes the first one
+        in_a, out_a = step_amounts(price_0, price_500, 3 * LIQUIDITY)
+        in_b, out_b = step_amounts(price_500, price_800, 2 * LIQUIDITY)
+        self.assertEqual(
+            self.state.swap(True, 10**30, price_800),
+            (in_a + in_b, -(out_a + out_b)),
+        )
+
+    def test_swap_past_cached_words_raises(self):
+        with self.assertRaises(ValueError):
+            self.state.get_amount_out(10**30, True)
+
+    def test_missing_tick_raises(self):
+        # Initialized in the bitmap, but its liquidity was never read
+        del self.state.ticks[-500]
+        with self.assertRaisesRegex(ValueError, "Tick -500"):
+            self.state.get_amount_out(10**20, True)
+
+    def test_exact_input_and_output_agree(self):
+        for zero_for_one in (True, False):
+            amount_out = self.state.get_amount_out(10**19, zero_for_one)
+            self.assertGreater(amount_out, 0)
+            amount_in = self.state.get_amount_in(amount_out, zero_for_one)
+            self.assertLessEqual(amount_in, 10**19)
+            self.assertLessEqual(10**19 - amount_in, 1)
+
+    def test_swap_state(self):
+        amount_in, amount_out, after = self.state.swap_state(True, 10**19)
+        self.assertEqual(amount_in, 10**19)
+        self.assertEqual(amount_out, self.state.get_amount_out(10**19, True))
+        # The copy moved, the cached state did not
+        self.assertEqual(self.state.sqrt_price_x96, Q96)
+        self.assertLess(after.sqrt_price_x96, Q96)
+        self.assertEqual(after.tick, get_tick_at_sqrt_ratio(after.sqrt_price_x96))
+        self.assertEqual(after.liquidity, LIQUIDITY)
+        # Swapping on from the state after is the rest of one bigger swap, up
+        # to the rounding of two swaps instead of one
+        rest = self.state.get_amount_out(2 * 10**19, True) - amount_out
+        self.assertLessEqual(abs(after.get_amount_out(10**19, True) - rest), 1)
+        after.update_position(-1000, 1000, LIQUIDITY)
+        self.assertNotIn(-1000, self.state.ticks)
+
+    def test_swap_state_exact_output_crosses_ticks(self):
+        self.state.update_position(-1000, 0, 2 * LIQUIDITY)
+        amount_out = self.state.get_amount_out(10**19, True)
+        amount_in, out, after = self.state.swap_state(True, -amount_out)
+        self.assertEqual(out, amount_out)
+        self.assertLessEqual(abs(amount_in - 10**19), 1)
+        # Tick 0 was crossed, only the second position is left below it
+        self.assertLess(after.tick, 0)
+        self.assertEqual(after.liquidity, 3 * LIQUIDITY)
+        self.assertEqual(after.tick, get_tick_at_sqrt_ratio(after.sqrt_price_x96))
+
+
+if __name__ == "__main__":
+    unittest.main()
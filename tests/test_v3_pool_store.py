@@ -0,0 +1,153 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock
+from eth_abi import decode
+from scripts.multicall import MULTICALL3_ADDRESS, function_selector
+from scripts.v3_math import Q96, get_sqrt_ratio_at_tick
+from scripts.v3_pool_store import (
+    BURN_TOPIC,
+    MINT_TOPIC,
+    PANCAKE_SWAP_TOPIC,
+    V3PoolStore,
+)
+
+POOL = "0x36696169C63e42cd08ce11f5deeBbCeBae652050"
+MISSING = "0x1111111111111111111111111111111111111111"
+LIQUIDITY = 10**21
+
+
+def int_word(value):
+    return value.to_bytes(32, "big", signed=True)
+
+
+class StubMulticall:
+    # A pool at tick 0 of the 0.05% tier (tick spacing 10) with one
+    # [-500, 500] position; every other address is not deployed
+    address = MULTICALL3_ADDRESS
+
+    def __init__(self):
+        self.blocks = []
+        self.failing_ticks = set()
+        self.no_block = False
+
+    def aggregate(self, calls, block_identifier="latest"):
+        self.blocks.append(block_identifier)
+        return [self.read(call) for call in calls]
+
+    def read(self, call):
+        selector, arguments = call.call_data[:4], call.call_data[4:]
+        if call.target == self.address:
+            return None if self.no_block else [200]
+        if call.target != POOL:
+            return None
+        if selector == function_selector("slot0()"):
+            return [Q96, 0, 0, 0, 0, 0, True]
+        if selector == function_selector("liquidity()"):
+            return [LIQUIDITY]
+        if selector == function_selector("tickBitmap(int16)"):
+            (word_position,) = decode(["int16"], arguments)
+            # Compressed ticks -50 and 50
+            return [{-1: 1 << 206, 0: 1 << 50}.get(word_position, 0)]
+        (tick,) = decode(["int24"], arguments)
+        if tick in self.failing_ticks:
+            return None
+        return [LIQUIDITY, LIQUIDITY if tick < 0 else -LIQUIDITY]
+
+
+def swap_log(tick, liquidity, block_number, log_index):
+    return {
+        "address": POOL,
+        "topics": [PANCAKE_SWAP_TOPIC, b"\0" * 32, b"\0" * 32],
+        "data": int_word(-1)
+        + int_word(1)
+        + int_word(get_sqrt_ratio_at_tick(tick))
+        + int_word(liquidity)
+        + int_word(tick)
+        + int_word(0)
+        + int_word(0),
+        "blockNumber": block_number,
+        "logIndex": log_index,
+    }
+
+
+def position_log(topic, tick_lower, tick_upper, data, block_number, log_index):
+    return {
+        "address": POOL,
+        "topics": [topic, b"\0" * 32, int_word(tick_lower), int_word(tick_upper)],
+        "data": data,
+        "blockNumber": block_number,
+        "logIndex": log_index,
+    }
+
+
+class TestV3PoolStore(unittest.TestCase):
+    def setUp(self):
+        self.multicall = StubMulticall()
+        self.store = V3PoolStore(MagicMock(), MagicMock(), self.multicall)
+        self.states = asyncio.run(self.store.load([(POOL, 500), (MISSING, 500)]))
+        self.state = self.states[POOL]
+
+    def test_load_reads_one_block(self):
+        self.assertIsNone(self.states[MISSING])
+        self.assertIn(MISSING, self.store.absent)
+        self.assertEqual(self.multicall.blocks, ["latest", 200, 200])
+        self.assertEqual(self.state.liquidity, LIQUIDITY)
+        self.assertEqual(self.state.slot0_extra, (0, 0, 0, 0, True))
+        self.assertEqual(
+            self.state.ticks,
+            {-500: [LIQUIDITY, LIQUIDITY], 500: [LIQUIDITY, -LIQUIDITY]},
+        )
+        self.assertEqual(set(self.state.bitmap), {-2, -1, 0, 1, 2})
+        self.assertEqual(self.store.watched, {POOL})
+        self.assertEqual(self.store.backfill_from, 201)
+        # Cached pools are not read again
+        asyncio.run(self.store.load([(POOL, 500), (MISSING, 500)]))
+        self.assertEqual(len(self.multicall.blocks), 3)
+
+    def test_swap_log(self):
+        self.store.handle_log(swap_log(-20, LIQUIDITY, 201, 3))
+        self.assertEqual(self.state.tick, -20)
+        self.assertEqual(self.state.sqrt_price_x96, get_sqrt_ratio_at_tick(-20))
+        self.assertEqual(self.state.position, (201, 3))
+        # Logs of the snapshot block or older are already in the state
+        self.store.handle_log(swap_log(-40, LIQUIDITY, 201, 2))
+        self.assertEqual(self.state.tick, -20)
+
+    def test_swap_out_of_cached_words_drops_pool(self):
+        self.store.handle_log(swap_log(-2600, 0, 201, 0))
+        self.assertIsNone(self.store.get(POOL))
+
+    def test_mint_and_burn_logs(self):
+        amount = 5 * 10**20
+        mint = int_word(0) + int_word(amount) + int_word(1) + int_word(1)
+        self.store.handle_log(position_log(MINT_TOPIC, -100, 100, mint, 201, 0))
+        self.assertEqual(self.state.liquidity, LIQUIDITY + amount)
+        self.assertEqual(self.state.ticks[-100], [amount, amount])
+        burn = int_word(amount) + int_word(1) + int_word(1)
+        self.store.handle_log(position_log(BURN_TOPIC, -100, 100, burn, 201, 1))
+        self.assertEqual(self.state.liquidity, LIQUIDITY)
+        self.assertNotIn(-100, self.state.ticks)
+        self.assertEqual(self.state.bitmap[-1], 1 << 206)
+
+    def test_failed_tick_read_leaves_pool_uncached(self):
+        multicall = StubMulticall()
+        multicall.failing_ticks.add(500)
+        store = V3PoolStore(MagicMock(), MagicMock(), multicall)
+        self.assertEqual(asyncio.run(store.load([(POOL, 500)])), {POOL: None})
+        self.assertNotIn(POOL, store.absent)
+        self.assertEqual(store.watched, set())
+        # Read again on the next request
+        multicall.failing_ticks.clear()
+        state = asyncio.run(store.load([(POOL, 500)]))[POOL]
+        self.assertEqual(set(state.ticks), {-500, 500})
+
+    def test_failed_block_number_read(self):
+        multicall = StubMulticall()
+        multicall.no_block = True
+        store = V3PoolStore(MagicMock(), MagicMock(), multicall)
+        self.assertEqual(asyncio.run(store.load([(POOL, 500)])), {POOL: None})
+        self.assertEqual((store.absent, store.backfill_from), (set(), None))
+
+
+if __name__ == "__main__":
+    unittest.main()
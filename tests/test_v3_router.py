@@ -0,0 +1,127 @@
+import unittest
+from eth_abi import encode
+from scripts.swap_decoder import SwapDecoder
+from scripts.universal_router import V3_SWAP_EXACT_IN, V3_SWAP_EXACT_OUT
+from scripts.v3_router import (
+    PATH_PARAMS,
+    SINGLE_PARAMS,
+    decode_swap_router,
+    selector,
+)
+
+ROUTER = "0x1b81D678ffb9C0263b24A97847620C99d213eB14"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+RECIPIENT = "0xf01A75A88C66da31390Cbd87d305F1Ac9Ffbcd71"
+DEADLINE = 1700000000
+
+
+def v3_path(*tokens_and_fees):
+    path = b""
+    for item in tokens_and_fees:
+        if isinstance(item, int):
+            path += item.to_bytes(3, "big")
+        else:
+            path += bytes.fromhex(item[2:])
+    return path
+
+
+def single(name, token_in, token_out, fee, amount, limit):
+    return selector(f"{name}({SINGLE_PARAMS})") + encode(
+        [SINGLE_PARAMS],
+        [(token_in, token_out, fee, RECIPIENT, DEADLINE, amount, limit, 0)],
+    )
+
+
+def multi(name, path, amount, limit):
+    return selector(f"{name}({PATH_PARAMS})") + encode(
+        [PATH_PARAMS], [(path, RECIPIENT, DEADLINE, amount, limit)]
+    )
+
+
+def multicall(calls, deadline=False):
+    if deadline:
+        return selector("multicall(uint256,bytes[])") + encode(
+            ["uint256", "bytes[]"], [DEADLINE, calls]
+        )
+    return selector("multicall(bytes[])") + encode(["bytes[]"], [calls])
+
+
+class TestV3Router(unittest.TestCase):
+    def test_exact_input_single(self):
+        [leg] = decode_swap_router(
+            single("exactInputSingle", WBNB, BUSD, 500, 10**18, 3 * 10**20)
+        )
+        self.assertEqual(leg.command, V3_SWAP_EXACT_IN)
+        self.assertEqual(
+            leg.arguments,
+            {"amountIn": 10**18, "amountOutMin": 3 * 10**20, "path": [WBNB, BUSD]},
+        )
+        self.assertEqual(leg.fees, [500])
+
+    def test_exact_output_single(self):
+        [leg] = decode_swap_router(
+            single("exactOutputSingle", BUSD, WBNB, 2500, 10**18, 4 * 10**20)
+        )
+        self.assertEqual(leg.command, V3_SWAP_EXACT_OUT)
+        self.assertEqual(
+            leg.arguments,
+            {"amountOut": 10**18, "amountInMax": 4 * 10**20, "path": [BUSD, WBNB]},
+        )
+
+    def test_exact_input_path(self):
+        [leg] = decode_swap_router(
+            multi("exactInput", v3_path(WBNB, 500, USDT, 100, BUSD), 10**18, 1)
+        )
+        self.assertEqual(leg.arguments["path"], [WBNB, USDT, BUSD])
+        self.assertEqual(leg.fees, [500, 100])
+        self.assertTrue(leg.exact_input)
+
+    def test_exact_output_path_is_reversed(self):
+        # Encoded from the output token back to the input token
+        [leg] = decode_swap_router(
+            multi("exactOutput", v3_path(BUSD, 100, USDT, 500, WBNB), 10**20, 10**18)
+        )
+        self.assertEqual(leg.arguments["path"], [WBNB, USDT, BUSD])
+        self.assertEqual(leg.fees, [500, 100])
+        self.assertEqual(leg.arguments["amountOut"], 10**20)
+
+    def test_multicall(self):
+        refund = selector("refundETH()")
+        for deadline in (False, True):
+            legs = list(
+                decode_swap_router(
+                    multicall(
+                        [
+                            single("exactInputSingle", WBNB, BUSD, 500, 10**18, 1),
+                            refund,
+                        ],
+                        deadline,
+                    )
+                )
+            )
+            self.assertEqual([leg.arguments["path"] for leg in legs], [[WBNB, BUSD]])
+
+    def test_other_calls_and_truncated_calldata(self):
+        self.assertEqual(list(decode_swap_router(selector("refundETH()"))), [])
+        data = multi("exactInput", v3_path(WBNB, 500, BUSD), 10**18, 1)
+        with self.assertRaises(ValueError):
+            list(decode_swap_router(data[:100]))
+
+    def test_swap_decoder_routes_v3_router(self):
+        decoder = SwapDecoder()
+        dex = object()
+        self.assertTrue(decoder.add_v3_router(ROUTER, dex))
+        self.assertFalse(decoder.add_router(ROUTER, object()))
+        data = single("exactInputSingle", WBNB, BUSD, 500, 10**18, 1)
+        decoded_dex, leg, arguments = decoder.decode(ROUTER, "0x" + data.hex())
+        self.assertIs(decoded_dex, dex)
+        self.assertEqual(leg.fees, [500])
+        self.assertEqual(arguments["amountIn"], 10**18)
+        self.assertIsNone(decoder.decode(ROUTER, data[:100]))
+        self.assertIsNone(decoder.decode(ROUTER, selector("refundETH()")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+from scripts import back_runner
+from scripts.token_registry import Token, TokenRegistry
+
+WBNB = "0xbb4CdB9CBd36B01bD1cBaEBF2De08d9173bc095c"
+BUSD = "0xe9e7CEA3DedcA5984780Bafc599bD69ADd087D56"
+USDT = "0x55d398326f99059fF775485246999027B3197955"
+FACTORY = "0xcA143Ce32Fe78f1f7019d7d551a6402fC5350c73"
+ROUTER = "0x10ED43C718714eb63d5aA57B78B54704E256024E"
+
+
+def pending(index, to=None, value=0):
+    return {
+        "hash": bytes([index]) * 32,
+        "to": to,
+        "input": "0x",
+        "value": value,
+        "gasPrice": 3 * 10**9,
+        "blockHash": None,
+        "blockNumber": None,
+    }
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.multiple(
+            back_runner, gas_oracle=MagicMock(), recorder=None, boot_started_at=None
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_workers_overlap(self):
+        running = []
+        peak = []
+
+        async def handle_transaction(transaction):
+            running.append(transaction)
+            peak.append(len(running))
+            await asyncio.sleep(0.05)
+            running.remove(transaction)
+
+        async def run():
+            queue = asyncio.Queue(maxsize=8)
+            workers = [asyncio.create_task(back_runner.worker(queue)) for _ in range(4)]
+            for index in range(8):
+                back_runner.enqueue_transaction(queue, pending(index))
+            await asyncio.wait_for(queue.join(), 1.0)
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        with patch.object(back_runner, "handle_transaction", handle_transaction):
+            asyncio.run(run())
+        self.assertEqual(max(peak), 4)
+        self.assertEqual(len(peak), 8)
+
+    def test_full_queue_drops_the_oldest(self):
+        async def run():
+            queue = asyncio.Queue(maxsize=2)
+            for index in range(3):
+                back_runner.enqueue_transaction(queue, pending(index))
+            return [queue.get_nowait()["hash"][0] for _ in range(queue.qsize())]
+
+        rejections = back_runner.metrics.rejections.values
+        dropped = rejections.get("queue_full", 0)
+        self.assertEqual(asyncio.run(run()), [1, 2])
+        self.assertEqual(rejections["queue_full"], dropped + 1)
+
+    def test_opportunities_are_per_task(self):
+        registry = TokenRegistry()
+        registry.add(Token("WBNB", {"address": WBNB, "decimals": 18}, vault=WBNB))
+        dex = back_runner.Dex(
+            "PancakeSwapV2", {"factory": FACTORY, "router": ROUTER, "enabled": True}
+        )
+        function = MagicMock(fees=None)
+        paths = {BUSD: [WBNB, BUSD], USDT: [USDT, WBNB]}
+        decoder = MagicMock()
+        decoder.decode.side_effect = lambda to, data, value: (
+            dex,
+            function,
+            {"amountIn": 10**18, "amountOutMin": 1, "path": paths[to]},
+        )
+
+        async def run():
+            return await asyncio.gather(
+                back_runner.initial_checks(pending(1, BUSD)),
+                back_runner.initial_checks(pending(2, USDT)),
+            )
+
+        with patch.multiple(
+            back_runner,
+            swap_decoder=decoder,
+            token_registry=registry,
+            max_gas_price=10**10,
+        ):
+            first, second = asyncio.run(run())
+        self.assertTrue(first[0] and second[0])
+        first, second = first[2], second[2]
+        self.assertIsNot(first, second)
+        self.assertIs(first.dex, second.dex)
+        self.assertEqual(
+            (first.src_token.address, first.dest_token.address), (WBNB, BUSD)
+        )
+        self.assertEqual(
+            (second.src_token.address, second.dest_token.address), (USDT, WBNB)
+        )
+        # Nothing the workers work out is written back to the shared DEX
+        self.assertFalse(hasattr(dex, "__dict__"))
+        self.assertIsNone(dex.factory_abi)
+
+
+if __name__ == "__main__":
+    unittest.main()